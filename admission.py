@@ -0,0 +1,234 @@
+#----------------------------------------------------------------------------#
+# Admission control and load shedding for expensive routes.
+#----------------------------------------------------------------------------#
+
+# Expensive views are tagged with a route class, e.g. @admission.limit('search').
+# Each request then has to pass three gates before the view runs:
+#
+#   1. a per-client token bucket for that class (429 + Retry-After when empty),
+#      keyed on request.remote_addr.  Behind a reverse proxy, set TRUSTED_PROXIES
+#      (config.py) so that is the client's address rather than the proxy's.
+#      Past ADMISSION_MAX_CLIENTS buckets, the least recently used are dropped.
+#   2. a per-class concurrency cap, waiting at most ADMISSION_QUEUE_TIMEOUT for a
+#      slot,
+#   3. a database pool check: if every pooled connection is already checked out,
+#      a new checkout would just queue behind them.
+#
+# Failing gate 2 or 3, or hitting the pool checkout timeout (pool_timeout, see
+# config.py) inside the view, sheds the request immediately.  The last good copy
+# of that page is served with a Warning header if we have one, otherwise a quick
+# 503 with Retry-After.
+#
+# Outcomes are counted per route class, and pool_stats() reports every engine's
+# pool.  Both are served by GET /stats/pool, which is only open to ADMIN_TOKEN
+# holders (see admin_only()), for the load generator in loadtest.py.  The same
+# token unlocks the profiler (profiler.py).
+
+import functools
+import hmac
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import sqlalchemy.exc
+from flask import Response, abort, current_app, jsonify, make_response, request, session
+
+from extensions import db
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Seconds to wait before a token is available; 0 means one was taken."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionControl:
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()   # (route class, client) -> TokenBucket, least recently used first
+        self._semaphores = {}
+        self._stale = OrderedDict()
+        self.counts = Counter()         # (route class, outcome) -> requests
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # route class -> (tokens per second, burst) per client
+        app.config.setdefault('RATE_LIMITS', {'search': (2, 10), 'heavy': (5, 30)})
+        # route class -> requests of that class running at once in this process
+        app.config.setdefault('CONCURRENCY_LIMITS', {'search': 4, 'heavy': 8})
+        app.config.setdefault('ADMISSION_QUEUE_TIMEOUT', 0.25)
+        app.config.setdefault('ADMISSION_RETRY_AFTER', 2)
+        app.config.setdefault('ADMISSION_STALE_ENTRIES', 256)
+        app.config.setdefault('ADMISSION_MAX_CLIENTS', 10000)
+        app.extensions['admission'] = self
+
+    def limit(self, route_class):
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapped(*args, **kwargs):
+                return self._admit(route_class, view, args, kwargs)
+            return wrapped
+        return decorator
+
+    # Gates
+    def _take_token(self, route_class):
+        limits = current_app.config['RATE_LIMITS'].get(route_class)
+        if not limits:
+            return 0
+        key = (route_class, request.remote_addr)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(*limits)
+                # A flood of distinct clients only pushes out the idlest buckets, never everyone's
+                while len(self._buckets) > current_app.config['ADMISSION_MAX_CLIENTS']:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.take()
+
+    def _semaphore(self, route_class):
+        with self._lock:
+            semaphore = self._semaphores.get(route_class)
+            if semaphore is None:
+                cap = current_app.config['CONCURRENCY_LIMITS'].get(route_class, 1 << 30)
+                semaphore = self._semaphores[route_class] = threading.BoundedSemaphore(cap)
+            return semaphore
+
+    def pool_saturated(self):
+        pool = db.engine.pool
+        if not hasattr(pool, 'checkedout') or not hasattr(pool, 'size'):
+            return False
+        max_overflow = getattr(pool, '_max_overflow', -1)
+        if max_overflow < 0:
+            return False
+        return pool.checkedout() >= pool.size() + max_overflow
+
+    def pool_stats(self):
+        """Checkout figures for the primary's pool and every bind's, in this process."""
+        stats = {}
+        for bind, engine in db.engines.items():
+            pool = engine.pool
+            if not hasattr(pool, 'checkedout') or not hasattr(pool, 'size'):
+                stats[bind or 'default'] = {'pool': type(pool).__name__}
+                continue
+            max_overflow = getattr(pool, '_max_overflow', -1)
+            capacity = pool.size() + max_overflow if max_overflow >= 0 else None
+            stats[bind or 'default'] = {
+                'pool': type(pool).__name__,
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': pool.overflow(),
+                'capacity': capacity,
+                'saturated': capacity is not None and pool.checkedout() >= capacity,
+            }
+        return stats
+
+    def outcomes(self):
+        """Requests per route class and outcome (admitted, rate_limited, shed_*) since this process started."""
+        with self._lock:
+            return [{'class': route_class, 'outcome': outcome, 'requests': n}
+                    for (route_class, outcome), n in sorted(self.counts.items())]
+
+    def _count(self, route_class, outcome):
+        with self._lock:
+            self.counts[route_class, outcome] += 1
+
+    def _admit(self, route_class, view, args, kwargs):
+        wait = self._take_token(route_class)
+        if wait:
+            self._count(route_class, 'rate_limited')
+            return self._reject(429, 'Too many requests, slow down.', wait)
+
+        semaphore = self._semaphore(route_class)
+        if not semaphore.acquire(timeout=current_app.config['ADMISSION_QUEUE_TIMEOUT']):
+            self._count(route_class, 'shed_queue')
+            return self._shed()
+        try:
+            if self.pool_saturated():
+                self._count(route_class, 'shed_pool')
+                return self._shed()
+            had_flashes = bool(session.get('_flashes'))
+            try:
+                response = make_response(view(*args, **kwargs))
+            except sqlalchemy.exc.TimeoutError:
+                # Pool checkout waited longer than pool_timeout
+                db.session.rollback()
+                self._count(route_class, 'shed_timeout')
+                return self._shed()
+            self._count(route_class, 'admitted')
+            # Pages carrying someone's flash messages aren't safe to replay to others
+            if response.status_code == 200 and not response.is_streamed and not had_flashes:
+                self._remember(response)
+            return response
+        finally:
+            semaphore.release()
+
+    # Responses
+    def _key(self):
+        return (request.method, request.full_path, tuple(sorted(request.form.items(multi=True))))
+
+    def _remember(self, response):
+        with self._lock:
+            self._stale[self._key()] = (response.get_data(), response.mimetype)
+            self._stale.move_to_end(self._key())
+            while len(self._stale) > current_app.config['ADMISSION_STALE_ENTRIES']:
+                self._stale.popitem(last=False)
+
+    def _shed(self):
+        with self._lock:
+            stale = self._stale.get(self._key())
+        if stale is not None:
+            body, mimetype = stale
+            response = Response(body, mimetype=mimetype)
+            response.headers['Warning'] = '110 - "Response is Stale"'
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        return self._reject(503, 'Server busy, try again shortly.', current_app.config['ADMISSION_RETRY_AFTER'])
+
+    def _reject(self, status, message, retry_after):
+        response = jsonify({'error': message})
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+        return response
+
+
+def is_admin():
+    """Whether the request carries `Authorization: Bearer <ADMIN_TOKEN>`.  Never, when no token is configured."""
+    token = current_app.config.get('ADMIN_TOKEN')
+    if not token:
+        return False
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    return hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def admin_only(view):
+    """Only for admins (see is_admin()); a 404 when no token is configured."""
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        if not current_app.config.get('ADMIN_TOKEN'):
+            abort(404)
+        if not is_admin():
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapped
+
+
+admission = AdmissionControl()
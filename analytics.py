@@ -0,0 +1,298 @@
+#----------------------------------------------------------------------------#
+# Venue utilization analytics over a columnar show frame.
+#----------------------------------------------------------------------------#
+
+# One streamed pass over `shows` on every shard (yield_per chunks, never the
+# whole table as ORM objects) fills a ShowFrame: one NumPy array per column.
+# Venue city/state and artist genres are joined in from the in-memory catalog
+# (catalog.py) by index lookups, not per-row queries.  Every report is then a
+# handful of array operations (bincount, unique, repeat):
+#
+#   venue_months  shows per venue per month
+#   heatmap       shows per weekday and hour of day
+#   genre_mix     shows per city and artist genre
+#   occupancy     per month, booked venue-days / (venues x days in the month)
+#
+# Venues have no creation date, so occupancy counts a venue from the month of
+# its first show (or the current month, if it has no earlier show) onwards.
+# A venue that was open for months before its first booking is undercounted
+# there; a deleted venue drops out of every month, shows included.
+#
+# Each report is a table of columns.  GET /api/analytics/<report> serves it as
+# JSON from the shared cache (rebuilt at most every ANALYTICS_TTL_SECONDS), and
+# `flask export-analytics DIRECTORY` writes the frame and every report as
+# Parquet or Arrow IPC files for offline analysis.
+#
+# NumPy is needed for any of it and pyarrow for exports.  Both are optional:
+# without them the rest of the app runs as before.
+
+import os
+import threading
+import time
+
+import click
+from flask import current_app
+
+from catalog import catalog
+from extensions import db, shared_cache
+from models import Show
+from shards import shards
+
+try:
+    import numpy as np
+except ImportError:  # optional
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional
+    pa = pq = None
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+FORMATS = ('parquet', 'arrow')
+
+
+class AnalyticsUnavailable(RuntimeError):
+    pass
+
+
+class ShowFrame:
+    """Shows as parallel arrays, plus the lookup tables their index columns point into.
+
+    venue and city index self.venues and self.cities; artist indexes
+    self.artists and is -1 for an artist missing from the catalog.  Shows whose
+    venue is missing (deleted mid-load) are dropped.  venues and artists may
+    come in any order; they are kept sorted by id.
+    """
+
+    def __init__(self, venue_ids, artist_ids, starts, venues, artists):
+        # _positions() binary-searches the ids
+        self.venues = sorted(venues, key=lambda venue: venue.id)
+        self.artists = sorted(artists, key=lambda artist: artist.id)
+        venues, artists = self.venues, self.artists
+        self.cities = sorted({(venue.city, venue.state) for venue in venues}, key=lambda c: (c[1] or '', c[0] or ''))
+        city_index = {city: i for i, city in enumerate(self.cities)}
+        known_venue_ids = np.array([venue.id for venue in venues], dtype=np.int64)
+        venue_city = np.array([city_index[venue.city, venue.state] for venue in venues], dtype=np.int64)
+        known_artist_ids = np.array([artist.id for artist in artists], dtype=np.int64)
+
+        venue = _positions(known_venue_ids, venue_ids)
+        keep = venue >= 0
+        self.venue_ids = venue_ids[keep]
+        self.artist_ids = artist_ids[keep]
+        self.start = starts[keep]
+        self.venue = venue[keep]
+        self.city = venue_city[self.venue]
+        self.artist = _positions(known_artist_ids, self.artist_ids)
+
+    def __len__(self):
+        return len(self.venue)
+
+
+def _positions(sorted_ids, ids):
+    """Index of each of ids in sorted_ids, -1 where it isn't there."""
+    if not len(sorted_ids):
+        return np.full(len(ids), -1, dtype=np.int64)
+    positions = np.searchsorted(sorted_ids, ids)
+    positions[positions == len(sorted_ids)] = 0
+    return np.where(sorted_ids[positions] == ids, positions, -1)
+
+
+#  Reports
+#  ----------------------------------------------------------------
+#  Each takes a ShowFrame and returns {column name: array}, all of equal length.
+
+def venue_months(frame):
+    months, month = np.unique(frame.start.astype('datetime64[M]'), return_inverse=True)
+    counts = np.bincount(frame.venue * len(months) + month,
+                         minlength=len(frame.venues) * len(months)).reshape(len(frame.venues), len(months))
+    venue, month = counts.nonzero()
+    names = np.array([v.name for v in frame.venues], dtype=object)
+    return {
+        'venue_id': np.array([v.id for v in frame.venues], dtype=np.int64)[venue],
+        'venue_name': names[venue],
+        'month': months[month].astype(str),
+        'shows': counts[venue, month],
+    }
+
+
+def heatmap(frame):
+    days = frame.start.astype('datetime64[D]')
+    weekday = (days.view(np.int64) + 3) % 7        # 1970-01-01 was a Thursday
+    hour = (frame.start - days).astype('timedelta64[h]').astype(np.int64)
+    counts = np.bincount(weekday * 24 + hour, minlength=7 * 24)
+    cells = np.arange(7 * 24)
+    return {
+        'weekday': np.array(WEEKDAYS, dtype=object)[cells // 24],
+        'hour': cells % 24,
+        'shows': counts,
+    }
+
+
+def genre_mix(frame):
+    # Artist genres as CSR: genres of artist i are genre[offsets[i]:offsets[i + 1]]
+    genre_names = sorted({name for artist in frame.artists for name in artist.genres})
+    genre_index = {name: i for i, name in enumerate(genre_names)}
+    lengths = np.array([len(artist.genres) for artist in frame.artists], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    genre = np.array([genre_index[name] for artist in frame.artists for name in artist.genres], dtype=np.int64)
+
+    # One entry per (show, genre of its artist)
+    known = frame.artist >= 0
+    artist, city = frame.artist[known], frame.city[known]
+    per_show = lengths[artist]
+    first = np.repeat(offsets[artist], per_show)
+    within = np.arange(per_show.sum()) - np.repeat(np.cumsum(per_show) - per_show, per_show)
+    pairs = np.repeat(city, per_show) * len(genre_names) + genre[first + within]
+
+    counts = np.bincount(pairs, minlength=len(frame.cities) * len(genre_names))
+    nonzero = counts.nonzero()[0]
+    city, genre = np.divmod(nonzero, len(genre_names)) if len(genre_names) else (nonzero, nonzero)
+    return {
+        'city': np.array([c for c, _ in frame.cities], dtype=object)[city],
+        'state': np.array([s for _, s in frame.cities], dtype=object)[city],
+        'genre': np.array(genre_names, dtype=object)[genre],
+        'shows': counts[nonzero],
+    }
+
+
+def occupancy(frame):
+    if not len(frame):
+        return {'month': np.array([], dtype=str), 'shows': np.array([], dtype=np.int64),
+                'venues': np.array([], dtype=np.int64), 'booked_venue_days': np.array([], dtype=np.int64),
+                'venue_days': np.array([], dtype=np.int64),
+                'occupancy': np.array([], dtype=np.float64)}
+    day = frame.start.astype('datetime64[D]').view(np.int64)
+    first_day = day.min()
+    span = day.max() - first_day + 1
+    # Several shows at a venue on one day book it once
+    booked = np.unique(frame.venue * span + (day - first_day))
+    booked_months = (booked % span + first_day).astype('datetime64[D]').astype('datetime64[M]')
+
+    months, month, shows = np.unique(frame.start.astype('datetime64[M]'), return_inverse=True, return_counts=True)
+    booked_days = np.bincount(np.searchsorted(months, booked_months), minlength=len(months))
+
+    # Venues open in each month: each counts from its first show's month, or this month if earlier
+    this_month = np.searchsorted(months, np.datetime64('today', 'M'))
+    opened = np.full(len(frame.venues), this_month, dtype=np.int64)
+    np.minimum.at(opened, frame.venue, month)
+    venues = np.cumsum(np.bincount(opened, minlength=len(months) + 1))[:len(months)]
+
+    days_in_month = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64)
+    venue_days = days_in_month * venues
+    return {
+        'month': months.astype(str),
+        'shows': shows,
+        'venues': venues,
+        'booked_venue_days': booked_days,
+        'venue_days': venue_days,
+        'occupancy': np.round(booked_days / np.maximum(venue_days, 1), 4),
+    }
+
+
+REPORTS = {
+    'venue_months': venue_months,
+    'heatmap': heatmap,
+    'genre_mix': genre_mix,
+    'occupancy': occupancy,
+}
+
+
+class Analytics:
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ANALYTICS_TTL_SECONDS', 600)
+        app.config.setdefault('ANALYTICS_CHUNK_ROWS', 10000)
+
+        @app.cli.command('export-analytics')
+        @click.argument('directory')
+        @click.option('--format', 'fmt', type=click.Choice(FORMATS), default='parquet')
+        def export_analytics_command(directory, fmt):
+            """Write the show frame and every analytics report to DIRECTORY."""
+            for path in self.export(directory, fmt):
+                print(f'Wrote {path}')
+
+        app.extensions['analytics'] = self
+
+    @property
+    def available(self):
+        return np is not None
+
+    def frame(self):
+        """Every show on every shard as a ShowFrame, read in one streamed pass."""
+        if np is None:
+            raise AnalyticsUnavailable('Analytics needs numpy installed.')
+        chunk = current_app.config['ANALYTICS_CHUNK_ROWS']
+
+        def columns(session):
+            venue_ids, artist_ids, starts = [], [], []
+            result = session.execute(db.select(Show.venue_id, Show.artist_id, Show.start_time)
+                                     .execution_options(yield_per=chunk))
+            for rows in result.partitions():
+                venue, artist, start = zip(*rows)
+                venue_ids.append(np.array(venue, dtype=np.int64))
+                artist_ids.append(np.array(artist, dtype=np.int64))
+                starts.append(np.array(start, dtype='datetime64[m]'))
+            return venue_ids, artist_ids, starts
+
+        parts = shards.scatter(columns)
+        venue_ids, artist_ids, starts = (
+            np.concatenate([array for part in parts for array in part[i]] or [np.array([], dtype=dtype)])
+            for i, dtype in enumerate((np.int64, np.int64, 'datetime64[m]')))
+        return ShowFrame(venue_ids, artist_ids, starts, catalog.venues(), catalog.artists())
+
+    def report(self, name):
+        """{'report', 'computed_at', 'columns': {name: [values]}} for one report, from the shared cache."""
+        return self.reports()[name]
+
+    def reports(self):
+        # Computed together, as they share one pass over the shows
+        key = shared_cache.key('analytics')
+        cached = shared_cache.get(key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            cached = shared_cache.get(key)
+            if cached is None:
+                frame = self.frame()
+                computed_at = time.time()
+                cached = {name: {'report': name, 'computed_at': computed_at,
+                                 'columns': {column: values.tolist() for column, values in build(frame).items()}}
+                          for name, build in REPORTS.items()}
+                shared_cache.set(key, cached, ttl=current_app.config['ANALYTICS_TTL_SECONDS'])
+        return cached
+
+    def export(self, directory, fmt='parquet'):
+        """Write shows.<ext> and one file per report to directory; returns their paths."""
+        if pa is None:
+            raise AnalyticsUnavailable('Exporting analytics needs pyarrow installed.')
+        frame = self.frame()
+        os.makedirs(directory, exist_ok=True)
+        tables = {'shows': pa.table({
+            'venue_id': frame.venue_ids,
+            'artist_id': frame.artist_ids,
+            'start_time': frame.start.astype('datetime64[s]'),
+            'city': pa.array(np.array([c for c, _ in frame.cities], dtype=object)[frame.city]).dictionary_encode(),
+            'state': pa.array(np.array([s for _, s in frame.cities], dtype=object)[frame.city]).dictionary_encode(),
+        })}
+        tables.update((name, pa.table(build(frame))) for name, build in REPORTS.items())
+
+        paths = []
+        for name, table in tables.items():
+            path = os.path.join(directory, f'{name}.{fmt}')
+            if fmt == 'parquet':
+                pq.write_table(table, path)
+            else:
+                with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            paths.append(path)
+        return paths
+
+
+analytics = Analytics()
@@ -0,0 +1,161 @@
+#----------------------------------------------------------------------------#
+# Fingerprinted, minified and precompressed static bundles.
+#----------------------------------------------------------------------------#
+
+# `flask build-assets` reads the <link>/<script> tags that layouts/main.html pulls
+# from /static, concatenates them into three bundles (main.css, head.js for the
+# blocking head scripts, defer.js for the deferred ones), minifies them, names
+# each file after a hash of its contents and writes .gz (and .br when the brotli
+# package is installed) variants next to it in static/dist.  main.html links the
+# bundles through asset_url() when a manifest exists and falls back to the
+# original tags otherwise, so a fresh checkout works without a build.
+#
+# Bundles are served from /assets/<name>: the best precompressed variant the
+# client accepts, with a one year immutable Cache-Control (the hash in the name
+# changes whenever the contents do).
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+from flask import abort, request, send_file, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always written
+    brotli = None
+
+ONE_YEAR = 365 * 24 * 60 * 60
+
+_CONDITIONAL_COMMENT = re.compile(r'<!--\[if.*?<!\[endif\]-->', re.S)
+_CSS_LINK = re.compile(r'<link\b[^>]*\bhref="/static/([^"]+\.css)"[^>]*>')
+_SCRIPT = re.compile(r'<script\b([^>]*)\bsrc="/static/([^"]+\.js)"([^>]*)>')
+
+
+def minify_css(css):
+    css = re.sub(r'/\*(?!!).*?\*/', '', css, flags=re.S)    # keep /*! license */ comments
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    css = css.replace(';}', '}')
+    return css.strip()
+
+
+def minify_js(js):
+    # Deliberately conservative: trimming indentation and blank lines can't change
+    # meaning, whereas stripping comments or newlines safely needs a real JS parser.
+    return '\n'.join(line.strip() for line in js.splitlines() if line.strip())
+
+
+def find_bundles(template_source):
+    """{'main.css': [...], 'head.js': [...], 'defer.js': [...]} of /static paths in page order."""
+    source = _CONDITIONAL_COMMENT.sub('', template_source)
+    bundles = {'main.css': _CSS_LINK.findall(source), 'head.js': [], 'defer.js': []}
+    for before, path, after in _SCRIPT.findall(source):
+        deferred = re.search(r'\bdefer\b', before + after) is not None
+        bundles['defer.js' if deferred else 'head.js'].append(path)
+    return bundles
+
+
+class AssetPipeline:
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_DIST_DIR', os.path.join(app.static_folder, 'dist'))
+        app.config.setdefault('ASSETS_LAYOUT', 'layouts/main.html')
+        self.app = app
+        self.dist_dir = app.config['ASSETS_DIST_DIR']
+        self.manifest = self._read_manifest()
+
+        app.add_url_rule('/assets/<path:filename>', 'asset', self.serve)
+        app.jinja_env.globals['asset_url'] = self.asset_url
+        app.cli.command('build-assets')(self._build_command)
+        app.extensions['assets'] = self
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.dist_dir, 'manifest.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def asset_url(self, name):
+        filename = self.manifest.get(name)
+        return url_for('asset', filename=filename) if filename else None
+
+    # Build
+    def build(self):
+        layout = self.app.jinja_loader.get_source(self.app.jinja_env, self.app.config['ASSETS_LAYOUT'])[0]
+        os.makedirs(self.dist_dir, exist_ok=True)
+        previous = set(self._read_manifest().values())
+
+        manifest = {}
+        for name, paths in find_bundles(layout).items():
+            if not paths:
+                continue
+            parts = []
+            for path in paths:
+                with open(os.path.join(self.app.static_folder, path), encoding='utf-8') as f:
+                    text = f.read()
+                if '.min.' not in path:
+                    text = minify_css(text) if name.endswith('.css') else minify_js(text)
+                parts.append(text.strip())
+            body = ('\n' if name.endswith('.css') else ';\n').join(parts).encode('utf-8')
+
+            stem, ext = name.rsplit('.', 1)
+            filename = f'{stem}.{hashlib.sha256(body).hexdigest()[:12]}.{ext}'
+            self._write(filename, body)
+            self._write(filename + '.gz', gzip.compress(body, compresslevel=9, mtime=0))
+            if brotli is not None:
+                self._write(filename + '.br', brotli.compress(body, quality=11))
+            manifest[name] = filename
+
+        with open(os.path.join(self.dist_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+        # Keep the previous generation around so pages rendered before a deploy still resolve
+        keep = set(manifest.values()) | previous
+        for entry in os.listdir(self.dist_dir):
+            if entry != 'manifest.json' and entry.split('.gz')[0].split('.br')[0] not in keep:
+                os.remove(os.path.join(self.dist_dir, entry))
+
+        self.manifest = manifest
+        return manifest
+
+    def _write(self, filename, body):
+        with open(os.path.join(self.dist_dir, filename), 'wb') as f:
+            f.write(body)
+
+    def _build_command(self):
+        """Bundle, minify, fingerprint and precompress static assets."""
+        for name, filename in sorted(self.build().items()):
+            print(f'{name} -> {filename}')
+
+    # Serve
+    def serve(self, filename):
+        path = safe_join(self.dist_dir, filename)
+        if path is None or filename.endswith(('.gz', '.br')) or not os.path.isfile(path):
+            abort(404)
+
+        encoding = None
+        accept = request.accept_encodings
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accept[candidate] and os.path.isfile(path + suffix):
+                encoding, path = candidate, path + suffix
+                break
+
+        response = send_file(path, mimetype=mimetypes.guess_type(filename)[0],
+                             max_age=ONE_YEAR, conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = f'public, max-age={ONE_YEAR}, immutable'
+        return response
@@ -0,0 +1,164 @@
+#----------------------------------------------------------------------------#
+# In-memory catalog of the venue and artist listing fields.
+#----------------------------------------------------------------------------#
+
+# The listing pages (/venues, /artists and both searches) only need a few
+# columns per row.  Each process keeps those in __slots__ records: a few hundred
+# bytes a row with city, state and genre strings interned and shared, against
+# several KB for an ORM instance with its identity-map state.  The catalog is
+# loaded on first use (from every shard, see shards.py).
+#
+# It is kept current by polling the change feed (changes.py) at most every
+# CATALOG_POLL_SECONDS.  `seq` is the watermark: one indexed query fetches the
+# entries after it.  Each venue/artist entry carries a snapshot of the row,
+# which is applied as is, so catching up doesn't touch the venue or artist
+# tables at all.  If the watermark has been pruned out of the feed, the catalog
+# reloads from scratch.
+#
+# Upcoming show counts depend on the clock and on shows, so callers still get
+# those with one grouped query (upcoming_counts() in views/).
+
+import sys
+import threading
+import time
+
+from flask import current_app
+
+from changes import change_feed
+from extensions import db
+from models import Genre, Venue, Artist, artist_genre_table, purging
+from shards import shards, genre_names
+
+
+class Record:
+    __slots__ = ('id', 'name', 'folded', 'city', 'state', 'phone', 'image_link', 'genres')
+
+    def __init__(self, id, name, city, state, phone, image_link, genres):
+        self.id = id
+        self.name = name or ''
+        self.folded = self.name.casefold()
+        # Repeated across rows, so one shared copy of each
+        self.city = sys.intern(city) if city else city
+        self.state = sys.intern(state) if state else state
+        self.phone = phone
+        self.image_link = image_link
+        self.genres = tuple(sys.intern(genre) for genre in genres)
+
+    @classmethod
+    def from_snapshot(cls, data):
+        return cls(data['id'], data['name'], data['city'], data['state'], data['phone'], data['image_link'],
+                   data.get('genres', ()))
+
+
+class Catalog:
+
+    def __init__(self, app=None):
+        self._records = {'venue': {}, 'artist': {}}
+        self._sorted = {}
+        self.seq = None
+        self._polled_at = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CATALOG_POLL_SECONDS', 2.0)
+        app.extensions['catalog'] = self
+
+    # Reading
+    def venues(self):
+        """Venue records in id order."""
+        return self._view('venue', 'id')
+
+    def artists(self):
+        """Artist records in name order."""
+        return self._view('artist', 'name')
+
+    def search(self, kind, term):
+        """Records whose name contains term, ignoring case, in id order."""
+        term = term.casefold()
+        return [record for record in self._view(kind, 'id') if term in record.folded]
+
+    def _view(self, kind, order):
+        self._sync()
+        key = (kind, order)
+        view = self._sorted.get(key)
+        if view is None:
+            # Under the lock _catch_up() changes the records with, so the view is built from, and
+            # stored for, one consistent state
+            with self._lock:
+                view = self._sorted.get(key)
+                if view is None:
+                    sort_key = (lambda r: r.id) if order == 'id' else (lambda r: (r.folded, r.id))
+                    view = self._sorted[key] = sorted(self._records[kind].values(), key=sort_key)
+        return view
+
+    # Keeping current
+    def _sync(self):
+        if self.seq is not None and time.monotonic() - self._polled_at < current_app.config['CATALOG_POLL_SECONDS']:
+            return
+        with self._lock:
+            if self.seq is not None and time.monotonic() - self._polled_at < current_app.config['CATALOG_POLL_SECONDS']:
+                return      # another thread just did it
+            if self.seq is None or not self._catch_up():
+                self.load()
+            self._polled_at = time.monotonic()
+
+    def _catch_up(self):
+        """Apply change feed entries past the watermark.  False if it has been pruned."""
+        while True:
+            page = change_feed.since(self.seq)
+            if page is None:
+                return False
+            rows, more = page
+            for row in rows:
+                if row.entity not in self._records:
+                    continue
+                records = self._records[row.entity]
+                if row.op == 'delete':
+                    records.pop(row.entity_id, None)
+                else:
+                    records[row.entity_id] = Record.from_snapshot(row.data)
+                self._drop_views(row.entity)
+            if rows:
+                self.seq = rows[-1].seq
+            if not more:
+                return True
+
+    def _drop_views(self, kind):
+        for key in [key for key in self._sorted if key[0] == kind]:
+            del self._sorted[key]
+
+    def load(self):
+        # Read the watermark first: anything committed during the load is replayed on the next poll
+        seq = change_feed.latest()
+
+        def venue_rows(session):
+            genres = genre_names(session)
+            return [Record(id, name, city, state, phone, image_link, genres.get(id, ()))
+                    for id, name, city, state, phone, image_link in session.execute(
+                        db.select(Venue.id, Venue.name, Venue.city, Venue.state, Venue.phone, Venue.image_link))]
+
+        venues = {record.id: record for records in shards.scatter(venue_rows) for record in records}
+
+        artist_genres = {}
+        for artist_id, name in db.session.execute(
+                db.select(artist_genre_table.c.artist_id, Genre.name)
+                .join(Genre, Genre.id == artist_genre_table.c.genre_id).order_by(Genre.name)):
+            artist_genres.setdefault(artist_id, []).append(name)
+        artists = {id: Record(id, name, city, state, phone, image_link, artist_genres.get(id, ()))
+                   for id, name, city, state, phone, image_link in db.session.execute(
+                       db.select(Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone, Artist.image_link))}
+
+        # Venues/artists being purged are already deleted as far as readers go (see purge.py)
+        for id in purging('venue'):
+            venues.pop(id, None)
+        for id in purging('artist'):
+            artists.pop(id, None)
+
+        self._records = {'venue': venues, 'artist': artists}
+        self._sorted = {}
+        self.seq = seq
+
+
+catalog = Catalog()
@@ -0,0 +1,143 @@
+#----------------------------------------------------------------------------#
+# Change feed: an outbox of writes for downstream sync.
+#----------------------------------------------------------------------------#
+
+# Every write path calls change_feed.record(entity, op, ids) before it commits,
+# which appends rows to the `changes` table in the same transaction.  So a change
+# is in the feed if and only if the write committed.  Inserts and updates carry
+# a snapshot of the row.  Venue and artist snapshots include their genre names,
+# which is how genre link changes show up: as an update of the owning venue or
+# artist.  Deletes carry no data.  Shows removed by a venue/artist delete get
+# their own delete entries.
+#
+# GET /changes?since=<seq> returns entries in seq order.  A consumer stores the
+# returned `next` cursor and asks again, so syncing costs O(changes), not
+# O(table).  On Postgres, appends take a transaction-level advisory lock, so
+# sequence numbers become visible in commit order and a consumer can never skip
+# past a change that commits late.  Old entries are dropped by
+# `flask prune-changes`.  A consumer whose cursor is older than what's left gets
+# a 410 and has to resync from scratch.
+
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+
+from extensions import db
+from models import Genre, Venue, Artist, Show, Change, artist_genre_table
+from shards import shards, genre_names
+
+_ADVISORY_LOCK = 0x6679797572    # 'fyyur'
+
+_ENTITIES = {
+    'venue': (Venue, None, None),           # genres added in _rows()
+    'artist': (Artist, artist_genre_table, 'artist_id'),
+    'show': (Show, None, None),
+}
+
+
+def _json_safe(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+class ChangeFeed:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHANGES_PAGE_SIZE', 500)
+        app.config.setdefault('CHANGES_RETENTION_DAYS', 30)
+
+        @app.cli.command('prune-changes')
+        @click.option('--keep-days', type=int, default=None,
+                      help='Days of changes to keep (default CHANGES_RETENTION_DAYS).')
+        def prune_changes_command(keep_days):
+            """Delete change feed entries older than the retention period."""
+            keep_days = current_app.config['CHANGES_RETENTION_DAYS'] if keep_days is None else keep_days
+            print(f'Pruned {self.prune(keep_days)} changes older than {keep_days} days')
+
+        app.extensions['changes'] = self
+
+    # Writing
+    def record(self, entity, op, ids, session=None):
+        """Append one change per id to the outbox, in the current transaction.
+
+        For inserts and updates call it after the rows have been written (flushed);
+        for deletes, any time before commit.  session is where shows live (their
+        venue's shard, see shards.py); venues are located on their own.
+        """
+        ids = sorted({int(id) for id in ids})
+        if not ids:
+            return
+        if op == 'delete':
+            snapshots = {id: None for id in ids}
+        else:
+            snapshots = self._snapshots(entity, ids, session or db.session)
+        if not snapshots:
+            return
+        if db.session.get_bind().dialect.name == 'postgresql':
+            db.session.execute(db.text('SELECT pg_advisory_xact_lock(:key)'), {'key': _ADVISORY_LOCK})
+        now = datetime.utcnow()
+        db.session.execute(db.insert(Change), [
+            {'entity': entity, 'entity_id': id, 'op': op, 'data': data, 'changed_at': now}
+            for id, data in snapshots.items()])
+
+    def _snapshots(self, entity, ids, session):
+        model, association_table, owner_column = _ENTITIES[entity]
+        if entity == 'venue':
+            # Venues are read from their shard (see shards.py)
+            return {id: snapshot for shard, shard_ids in shards.locate_venues(ids).items()
+                    for id, snapshot in self._rows(shards.session(shard), model, shard_ids).items()}
+        if entity == 'show':
+            return self._rows(session, model, ids)
+        snapshots = self._rows(db.session, model, ids)
+        if association_table is not None:
+            for snapshot in snapshots.values():
+                snapshot['genres'] = []
+            owner = association_table.c[owner_column]
+            for owner_id, name in db.session.execute(
+                    db.select(owner, Genre.name).join(Genre, Genre.id == association_table.c.genre_id)
+                    .where(owner.in_(ids)).order_by(owner, Genre.name)):
+                snapshots[owner_id]['genres'].append(name)
+        return snapshots
+
+    def _rows(self, session, model, ids):
+        columns = [column.key for column in model.__table__.columns]
+        snapshots = {}
+        for row in session.execute(db.select(*model.__table__.columns).where(model.id.in_(ids))):
+            snapshots[row.id] = {column: _json_safe(value) for column, value in zip(columns, row)}
+        if model is Venue:
+            genres = genre_names(session, list(snapshots))
+            for id, snapshot in snapshots.items():
+                snapshot['genres'] = genres.get(id, [])
+        return snapshots
+
+    # Reading
+    def since(self, seq, limit=None):
+        """(entries after seq, whether there are more), or None if seq was pruned."""
+        page_size = current_app.config['CHANGES_PAGE_SIZE']
+        # At least one entry per page, or a client following `next` while `more` would never get anywhere
+        limit = max(1, min(limit or page_size, page_size))
+        if seq > 0:
+            oldest = db.session.scalar(db.select(db.func.min(Change.seq)))
+            if oldest is not None and seq < oldest - 1:
+                return None
+        rows = db.session.scalars(db.select(Change).where(Change.seq > seq)
+                                  .order_by(Change.seq).limit(limit + 1)).all()
+        return rows[:limit], len(rows) > limit
+
+    def latest(self):
+        return db.session.scalar(db.select(db.func.max(Change.seq))) or 0
+
+    def prune(self, keep_days):
+        cutoff = datetime.utcnow() - timedelta(days=keep_days)
+        # Keep the newest entry whatever its age, so the sequence never restarts
+        latest = self.latest()
+        result = db.session.execute(db.delete(Change).where(Change.changed_at < cutoff, Change.seq < latest))
+        db.session.commit()
+        return result.rowcount
+
+
+change_feed = ChangeFeed()
@@ -0,0 +1,216 @@
+#----------------------------------------------------------------------------#
+# Single-flight page data with stale-while-revalidate.
+#----------------------------------------------------------------------------#
+
+# The expensive listing views (venues(), shows()) build their template data
+# through SingleFlight.get(key, builder):
+#
+#   - fresh (younger than COALESCE_TTL): returned as is,
+#   - stale (up to COALESCE_STALE seconds past that): returned as is while one
+#     background thread rebuilds it,
+#   - missing or older: built now.  Concurrent requests for the same key in this
+#     process wait on a single build, and an flock() on a per-key lock file makes
+#     other workers on the box wait for that build too instead of running their own.
+#     They wait at most COALESCE_WAIT seconds for the lock, then build anyway, so a
+#     hung build in one worker doesn't stall the key everywhere.
+#
+# A background rebuild holds the key's flight from the moment it's queued, so a
+# burst of stale hits queues one rebuild, not one each.
+#
+# Built results go to the shared cache (shared_cache.py), which is how a build
+# in one worker reaches the others.  Each process also keeps the decoded value
+# in memory and reuses it while the cache entry's stored_at is unchanged.  Keys
+# are '<namespace>' or '<namespace>:<id>' and map to versioned cache keys, so
+# invalidate('venue:*') is a single version bump and invalidate('venue:3') a
+# single delete, and a write in any worker forces a rebuild everywhere on the
+# next request.  COALESCE_DIR only holds the lock files.
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; builds are then only coalesced per process
+    fcntl = None
+
+_KEY = re.compile(r'^[a-z_]+(:[0-9a-z_]+)?$')
+
+
+class SingleFlight:
+
+    def __init__(self, app=None, cache=None):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._flights = {}      # key -> Future of the build in progress in this process
+        self._memory = OrderedDict()   # cache key -> (built_at, value), most recent last
+        self._executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COALESCE_DIR', os.path.join(app.instance_path, 'coalesce'))
+        app.config.setdefault('COALESCE_TTL', 5)
+        app.config.setdefault('COALESCE_STALE', 60)
+        app.config.setdefault('COALESCE_WAIT', 30)
+        app.config.setdefault('COALESCE_MEMORY_ENTRIES', 1024)
+        self.app = app
+        self.directory = app.config['COALESCE_DIR']
+        self.ttl = app.config['COALESCE_TTL']
+        self.stale = app.config['COALESCE_STALE']
+        self.wait = app.config['COALESCE_WAIT']
+        self.memory_entries = app.config['COALESCE_MEMORY_ENTRIES']
+        os.makedirs(self.directory, exist_ok=True)
+        app.extensions['coalesce'] = self
+
+    def _cache_key(self, key):
+        if not _KEY.match(key):
+            raise ValueError(f'Bad key {key!r}')
+        namespace, _, item = key.partition(':')
+        return self.cache.key(namespace, item)
+
+    def get(self, key, builder):
+        """Value for key, building it with builder() if needed.
+
+        builder must return something JSON serializable; None means "doesn't
+        exist" and is returned without being stored.
+        """
+        entry = self._read(self._cache_key(key))
+        if entry is not None:
+            built_at, value = entry
+            age = time.time() - built_at
+            if age < self.ttl:
+                return value
+            if age < self.ttl + self.stale:
+                self._refresh(key, builder)
+                return value
+        return self._build(key, builder)
+
+    def invalidate(self, *keys):
+        """Drop keys everywhere.  'venue:*' drops every key in the venue namespace."""
+        for key in keys:
+            if key.endswith(':*'):
+                self.cache.bump(key[:-2])
+            else:
+                self.cache.delete(self._cache_key(key))
+
+    # Storage
+    def _read(self, cache_key):
+        built_at = self.cache.stored_at(cache_key)
+        if built_at is None:
+            return None
+        with self._lock:
+            cached = self._memory.get(cache_key)
+            if cached is not None and cached[0] == built_at:
+                self._memory.move_to_end(cache_key)
+                return cached
+        entry = self.cache.get_entry(cache_key)
+        if entry is None:
+            return None
+        value, built_at = entry
+        with self._lock:
+            self._memory[cache_key] = (built_at, value)
+            self._memory.move_to_end(cache_key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+        return built_at, value
+
+    # Building
+    def _build(self, key, builder):
+        with self._lock:
+            flight = self._flights.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._flights[key] = Future()
+        if not owner:
+            return flight.result(timeout=self.wait)
+        return self._fly(key, builder, flight)
+
+    def _fly(self, key, builder, flight):
+        # Runs the build of the flight this thread owns
+        try:
+            with self._file_lock(key):
+                # Another worker may have finished this build while we waited for the lock.
+                # The cache key is fixed before building: if an invalidation bumps the
+                # version meanwhile, this possibly outdated result lands under the old one.
+                cache_key = self._cache_key(key)
+                entry = self._read(cache_key)
+                if entry is not None and time.time() - entry[0] < self.ttl:
+                    value = entry[1]
+                else:
+                    built_at = time.time()
+                    value = builder()
+                    if value is not None:
+                        self.cache.set(cache_key, value, ttl=self.ttl + self.stale, stored_at=built_at)
+            flight.set_result(value)
+            return value
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+    def _refresh(self, key, builder):
+        with self._lock:
+            if key in self._flights:
+                return
+            # Reserved before it's queued, so the next stale hit doesn't queue another
+            flight = self._flights[key] = Future()
+            if self._executor is None:
+                # Created on first use, so a preloaded master never forks with a live thread
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='refresh')
+        try:
+            self._executor.submit(self._refresh_in_background, key, builder, flight)
+        except BaseException as e:
+            flight.set_exception(e)
+            with self._lock:
+                del self._flights[key]
+            raise
+
+    def _refresh_in_background(self, key, builder, flight):
+        with self.app.app_context():
+            try:
+                self._fly(key, builder, flight)
+            except Exception as e:
+                print(f'Exception "{e}" refreshing {key}')
+
+    def _file_lock(self, key):
+        return _FileLock(os.path.join(self.directory, key.replace(':', '-') + '.lock'), self.wait)
+
+
+class _FileLock:
+    """flock() on path, waiting at most timeout seconds; past that the block runs without it."""
+
+    def __init__(self, path, timeout):
+        self.path = path
+        self.timeout = timeout
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return self
+        self._file = open(self.path, 'a')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return self
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(0.05)
+        # The holder is stuck: build anyway rather than stall this key in every worker
+        print(f'Gave up waiting for {self.path} after {self.timeout}s, building without it')
+        self._file.close()
+        self._file = None
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
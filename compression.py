@@ -0,0 +1,197 @@
+#----------------------------------------------------------------------------#
+# On-the-fly response compression.
+#----------------------------------------------------------------------------#
+
+# An after_request hook that compresses HTML/JSON/CSS/JS responses with the best
+# encoding both sides support (brotli and zstd when their packages are installed,
+# gzip always).  Small bodies go out untouched.  Streamed responses are wrapped
+# in a streaming compressor that flushes after every chunk, so progressive
+# delivery keeps working.
+#
+# Buffered responses are keyed by their ETag (computed from the body when the
+# view didn't set one), and the compressed bytes are kept in a small LRU cache,
+# so repeated hits on a popular page skip the compressor entirely.  The ETag
+# sent to the client gets the encoding appended, as each encoding is a distinct
+# representation, and If-None-Match is honoured against it.
+
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+
+
+class _Gzip:
+    def __init__(self, level):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+class _Brotli:
+    def __init__(self, level):
+        self._obj = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._obj.process(data) + self._obj.flush()
+
+    def finish(self):
+        return self._obj.finish()
+
+
+class _Zstd:
+    def __init__(self, level):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+def _one_shot(encoding, level, data):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return zlib.compress(data, level, wbits=31)
+
+
+class CompressedBodyCache:
+    """Byte-bounded LRU of (etag, encoding) -> compressed body."""
+
+    def __init__(self, max_entries=128, max_bytes=8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+
+class Compress:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_LEVELS', {'br': 5, 'zstd': 3, 'gzip': 6})
+        app.config.setdefault('COMPRESS_CACHE_ENTRIES', 128)
+        app.config.setdefault('COMPRESS_CACHE_BYTES', 8 * 1024 * 1024)
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        self.levels = app.config['COMPRESS_LEVELS']
+        self.cache = CompressedBodyCache(app.config['COMPRESS_CACHE_ENTRIES'],
+                                         app.config['COMPRESS_CACHE_BYTES'])
+
+        # Server preference when the client rates several encodings equally
+        self.encodings = [e for e, available in (('br', brotli), ('zstd', zstandard), ('gzip', True))
+                          if available]
+        app.after_request(self.after_request)
+        app.extensions['compress'] = self
+
+    def choose_encoding(self, accept):
+        best, best_q = None, 0
+        for encoding in self.encodings:
+            q = accept[encoding]
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def _compressor(self, encoding):
+        level = self.levels[encoding]
+        if encoding == 'br':
+            return _Brotli(level)
+        if encoding == 'zstd':
+            return _Zstd(level)
+        return _Gzip(level)
+
+    def after_request(self, response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.direct_passthrough or 'Content-Encoding' in response.headers
+                or not 200 <= response.status_code < 300 or response.status_code == 204):
+            return response
+
+        encoding = self.choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+            response.headers['Content-Encoding'] = encoding
+            return response
+
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+
+        etag, weak = response.get_etag()
+        if etag is None:
+            response.add_etag()
+            etag, weak = response.get_etag()
+        key = (etag, weak, encoding)
+        compressed = self.cache.get(key)
+        if compressed is None:
+            compressed = _one_shot(encoding, self.levels[encoding], body)
+            self.cache.put(key, compressed)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag(f'{etag}-{encoding}', weak=weak)
+        return response.make_conditional(request)
+
+    def _stream(self, chunks, encoding):
+        compressor = self._compressor(encoding)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                if chunk:
+                    yield compressor.compress(chunk)
+            yield compressor.finish()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
@@ -0,0 +1,225 @@
+#----------------------------------------------------------------------------#
+# Show events for Server-Sent Event streams.
+#----------------------------------------------------------------------------#
+
+# Write paths call events.publish_shows('show.created' / 'show.deleted', ...)
+# inside their transaction.  Each event goes to three channels: the venue, the
+# artist and the venue's city.  The SSE routes in views/events.py subscribe a
+# queue to one channel and stream whatever lands in it.
+#
+# On Postgres an event is a pg_notify() issued in the writer's transaction, so
+# it is delivered only if that transaction commits.  Each process keeps one
+# LISTEN connection (opened on the first subscription, in a background thread)
+# and fans every notification out to its local subscribers, whichever worker
+# made the write.  On other databases (SQLite in development) events are held
+# on the session and dispatched to this process's subscribers after commit.
+# That is enough for a single dev server, but workers don't see each other's
+# events.
+#
+# An open stream holds one of its worker's threads for as long as the client
+# stays connected, so each process serves at most EVENTS_MAX_STREAMS of them at
+# once (keep it below gunicorn's threads, see gunicorn.conf.py).  Past that,
+# subscribe() returns None and the route answers 503 with Retry-After.
+
+import json
+import queue
+import select
+import threading
+import time
+
+from sqlalchemy import event as sa_event, text
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import Venue, Show
+from shards import artist_cards
+
+NOTIFY_CHANNEL = 'fyyur_events'
+
+
+def city_channel(state, city):
+    return f"city:{(state or '').upper()}:{(city or '').strip().casefold()}"
+
+
+class Subscription:
+
+    def __init__(self, bus, channel, maxsize):
+        self.bus = bus
+        self.channel = channel
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+        self.closed = False
+
+    def get(self, timeout):
+        """Next event, or None if nothing arrived within timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.bus._unsubscribe(self)
+
+
+class EventBus:
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._subscribers = {}      # channel -> set of Subscription
+        self._open = 0              # subscriptions not yet closed
+        self._listener = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EVENTS_BACKEND', 'auto')      # 'auto', 'postgres' or 'local'
+        app.config.setdefault('EVENTS_QUEUE_SIZE', 256)
+        app.config.setdefault('EVENTS_KEEPALIVE', 15)
+        app.config.setdefault('EVENTS_MAX_STREAMS', 2)
+        app.config.setdefault('EVENTS_RETRY_AFTER', 30)
+        backend = app.config['EVENTS_BACKEND']
+        if backend == 'auto':
+            backend = 'postgres' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres') else 'local'
+        self.backend = backend
+        self.queue_size = app.config['EVENTS_QUEUE_SIZE']
+        self.keepalive = app.config['EVENTS_KEEPALIVE']
+        self.max_streams = app.config['EVENTS_MAX_STREAMS']
+        self.app = app
+        app.extensions['events'] = self
+
+    # Publishing
+    def publish_shows(self, kind, *criteria, session=None):
+        """Publish a `kind` event for every show matching criteria, e.g. Show.id.in_(ids).
+
+        Call it inside the write transaction: before a delete, after an insert has
+        been flushed.  session is where the shows live (their venue's shard, see
+        shards.py); the events themselves go out with the primary's transaction.
+        """
+        rows = (session or db.session).execute(
+            db.select(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Venue.name, Venue.city, Venue.state)
+            .join(Venue, Venue.id == Show.venue_id).where(*criteria)).all()
+        # Artists are on the primary
+        artists = artist_cards(artist_id for _, _, artist_id, *_ in rows)
+        pending = []
+        for id, venue_id, artist_id, start_time, venue_name, city, state in rows:
+            if artist_id not in artists:
+                continue
+            artist_name, artist_image = artists[artist_id]
+            pending.append({
+                'type': kind,
+                'channels': [f'venue:{venue_id}', f'artist:{artist_id}', city_channel(state, city)],
+                'show': {'id': id, 'venue_id': venue_id, 'venue_name': venue_name, 'city': city,
+                         'state': state, 'artist_id': artist_id, 'artist_name': artist_name,
+                         'artist_image_link': artist_image, 'start_time': start_time.isoformat()},
+            })
+        if not pending:
+            return
+        if self.backend == 'postgres':
+            for event in pending:
+                db.session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                                   {'channel': NOTIFY_CHANNEL, 'payload': json.dumps(event)})
+        else:
+            db.session.info.setdefault('pending_events', []).extend(pending)
+
+    def dispatch(self, event):
+        """Hand an event to this process's subscribers of its channels."""
+        with self._lock:
+            subscribers = [s for channel in event['channels'] for s in self._subscribers.get(channel, ())]
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                # A client that stopped reading: end its stream, the browser reconnects
+                subscription.overflowed = True
+
+    # Subscribing
+    def subscribe(self, channel):
+        """A Subscription to channel, or None when EVENTS_MAX_STREAMS are already open in this process."""
+        with self._lock:
+            if self._open >= self.max_streams:
+                return None
+            self._open += 1
+        if self.backend == 'postgres':
+            self._start_listener()
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            self._open -= 1
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def stream(self, subscription):
+        """text/event-stream body for one subscription, with keep-alive comments."""
+        try:
+            yield 'retry: 3000\n\n'
+            while not subscription.overflowed:
+                event = subscription.get(self.keepalive)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                data = json.dumps({'type': event['type'], 'show': event['show']})
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+        finally:
+            subscription.close()
+
+    # Postgres LISTEN
+    def _start_listener(self):
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            # Started on first use, so a preloaded master never forks with a live thread
+            self._listener = threading.Thread(target=self._listen, name='events-listener', daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        delay = 1
+        while True:
+            raw = None
+            try:
+                with self.app.app_context():
+                    # Detached from the pool: this connection is ours for as long as it lives
+                    raw = db.engine.raw_connection()
+                    raw.detach()
+                connection = raw.driver_connection
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+                delay = 1
+                while True:
+                    if select.select([connection], [], [], 5) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self.dispatch(json.loads(connection.notifies.pop(0).payload))
+            except Exception as e:
+                print(f'Exception "{e}" in events listener, reconnecting in {delay}s')
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+
+events = EventBus()
+
+
+@sa_event.listens_for(Session, 'after_commit')
+def _dispatch_pending_events(session):
+    for event in session.info.pop('pending_events', ()):
+        events.dispatch(event)
+
+
+@sa_event.listens_for(Session, 'after_rollback')
+def _drop_pending_events(session):
+    session.info.pop('pending_events', None)
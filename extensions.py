@@ -0,0 +1,26 @@
+from flask_migrate import Migrate
+from flask_moment import Moment
+from flask_sqlalchemy import SQLAlchemy
+
+from assets import AssetPipeline
+from coalesce import SingleFlight
+from compression import Compress
+from shared_cache import SharedCache
+from template_cache import TemplateCache
+from thumbnails import ThumbnailCache
+
+#----------------------------------------------------------------------------#
+# Extensions.
+#----------------------------------------------------------------------------#
+
+# Created unbound here and attached to the app in create_app(), so models and
+# blueprints can import them without importing the app itself.
+db = SQLAlchemy()
+migrate = Migrate()
+moment = Moment()
+thumbnails = ThumbnailCache()
+assets = AssetPipeline()
+compress = Compress()
+template_cache = TemplateCache()
+shared_cache = SharedCache()
+coalescer = SingleFlight(cache=shared_cache)
@@ -55,4 +55,11 @@ def deploy():
 
 
 def rollback():
-    local("heroku rollback")
\ No newline at end of file
+    local("heroku rollback")
+
+# static assets
+
+
+def assets():
+    local("flask build-assets")
+    local("flask precompile-templates")
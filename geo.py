@@ -0,0 +1,146 @@
+#----------------------------------------------------------------------------#
+# Offline geocoding and an in-memory grid index for "venues near me".
+#----------------------------------------------------------------------------#
+
+# Venues only store free-text city/state/address.  We resolve city + state to a
+# bundled city centroid (data/us_city_centroids.csv, no network calls) and keep
+# every geocoded venue in a fixed-size lat/lng grid.  A radius query only looks
+# at the grid cells overlapping the search circle's bounding box and then sorts
+# the survivors by great-circle distance.
+
+import csv
+import math
+import os
+import re
+import threading
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_KM = 0.621371
+MILES_PER_DEGREE_LAT = 69.0
+
+_CENTROIDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'us_city_centroids.csv')
+_centroids = None
+_centroids_lock = threading.Lock()
+
+
+def _normalize_city(city):
+    city = re.sub(r'[^a-z ]', ' ', (city or '').lower())
+    city = re.sub(r'\bsaint\b', 'st', city)
+    city = re.sub(r'\bfort\b', 'ft', city)
+    return ' '.join(city.split())
+
+
+def _load_centroids():
+    global _centroids
+    with _centroids_lock:
+        if _centroids is None:
+            table = {}
+            with open(_CENTROIDS_PATH, newline='') as f:
+                for row in csv.DictReader(f):
+                    key = (_normalize_city(row['city']), row['state'].strip().upper())
+                    table[key] = (float(row['latitude']), float(row['longitude']))
+            _centroids = table
+    return _centroids
+
+
+def geocode(city, state):
+    """(latitude, longitude) of the bundled centroid for city/state, or None if unknown."""
+    if not city or not state:
+        return None
+    return _load_centroids().get((_normalize_city(city), state.strip().upper()))
+
+
+def haversine_miles(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """Points bucketed into cell_degrees x cell_degrees lat/lng cells."""
+
+    def __init__(self, cell_degrees=0.5):
+        self.cell_degrees = cell_degrees
+        self._lock = threading.RLock()
+        self._cells = {}    # (row, col) -> {item id: (lat, lng)}
+        self._points = {}   # item id -> (lat, lng)
+        self.loaded = False
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+
+    def __len__(self):
+        return len(self._points)
+
+    def update(self, item_id, lat, lng):
+        """Insert or move an item.  A missing coordinate removes it from the index."""
+        with self._lock:
+            self._remove(item_id)
+            if lat is None or lng is None:
+                return
+            self._points[item_id] = (lat, lng)
+            self._cells.setdefault(self._cell(lat, lng), {})[item_id] = (lat, lng)
+
+    def remove(self, item_id):
+        with self._lock:
+            self._remove(item_id)
+
+    def _remove(self, item_id):
+        point = self._points.pop(item_id, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        members = self._cells.get(cell)
+        if members is not None:
+            members.pop(item_id, None)
+            if not members:
+                del self._cells[cell]
+
+    def load(self, rows):
+        """Bulk (re)build from (item id, lat, lng) rows."""
+        with self._lock:
+            self._cells.clear()
+            self._points.clear()
+            for item_id, lat, lng in rows:
+                self.update(item_id, lat, lng)
+            self.loaded = True
+
+    def within(self, lat, lng, radius_miles):
+        """[(item id, distance in miles)] inside the radius, nearest first."""
+        dlat = radius_miles / MILES_PER_DEGREE_LAT
+        # Widen the longitude span at the circle's most poleward latitude
+        edge_lat = min(89.9, abs(lat) + dlat)
+        dlng = min(180.0, radius_miles / (MILES_PER_DEGREE_LAT * math.cos(math.radians(edge_lat))))
+        row_lo, col_lo = self._cell(lat - dlat, lng - dlng)
+        row_hi, col_hi = self._cell(lat + dlat, lng + dlng)
+
+        found = []
+        with self._lock:
+            if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) > len(self._cells):
+                # Huge radius: walking the populated cells beats walking the bounding box
+                candidates = (m for m in self._cells.values())
+            else:
+                candidates = (self._cells.get((r, c)) for r in range(row_lo, row_hi + 1)
+                              for c in range(col_lo, col_hi + 1))
+            for members in candidates:
+                if not members:
+                    continue
+                for item_id, (plat, plng) in members.items():
+                    distance = haversine_miles(lat, lng, plat, plng)
+                    if distance <= radius_miles:
+                        found.append((item_id, distance))
+        found.sort(key=lambda f: (f[1], f[0]))
+        return found
+
+    def nearest(self, lat, lng, k=10, max_radius_miles=2 * math.pi * EARTH_RADIUS_MILES):
+        """The k nearest items, found by doubling the search radius until k are in range."""
+        if not self._points or k <= 0:
+            return []
+        radius = 10.0
+        while True:
+            found = self.within(lat, lng, radius)
+            if len(found) >= k or len(found) == len(self._points) or radius >= max_radius_miles:
+                return found[:k]
+            radius = min(radius * 2, max_radius_miles)
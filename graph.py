@@ -0,0 +1,224 @@
+#----------------------------------------------------------------------------#
+# JSON selection queries over venues, artists, shows and genres.
+#----------------------------------------------------------------------------#
+
+# A query names a root collection and a nested selection, e.g.
+#
+#   {"shows": {"where": {"venue_id": 3}, "limit": 50,
+#              "select": ["start_time", {"artist": ["name", {"genres": ["name"]}]},
+#                                       {"venue": ["name", "city"]}]}}
+#
+# Selections are resolved a level at a time, DataLoader style: the keys of
+# every parent at one level are collected and each relation is fetched with a
+# single IN (...) query, whatever the number of parents.  Children reached from
+# several parents (the same artist on many shows) are resolved once.  The query
+# count therefore depends only on the shape of the selection: the root plus one
+# query per relation in it.
+
+from datetime import date, datetime
+
+from extensions import db
+from models import Genre, Venue, Artist, Show, artist_genre_table, venue_genre_table
+
+
+class QueryError(ValueError):
+    pass
+
+
+class Type:
+
+    def __init__(self, model, scalars, relations, order_by):
+        self.model = model
+        self.scalars = scalars
+        self.relations = relations
+        self.order_by = order_by
+
+
+# Relation kinds
+class One:
+    """Parent column holds the child's id (show.artist)."""
+    def __init__(self, target, column):
+        self.target, self.column = target, column
+
+
+class Many:
+    """Child column holds the parent's id (venue.shows)."""
+    def __init__(self, target, column):
+        self.target, self.column = target, column
+
+
+class Linked:
+    """Through an association table (venue.genres)."""
+    def __init__(self, target, table, parent_column, child_column):
+        self.target, self.table = target, table
+        self.parent_column, self.child_column = parent_column, child_column
+
+
+TYPES = {
+    'venue': Type(Venue, ['id', 'name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+                          'website', 'seeking_talent', 'seeking_description', 'latitude', 'longitude'],
+                  {'genres': Linked('genre', venue_genre_table, 'venue_id', 'genre_id'),
+                   'shows': Many('show', 'venue_id')},
+                  order_by=('name', 'id')),
+    'artist': Type(Artist, ['id', 'name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+                            'website', 'seeking_venue', 'seeking_description'],
+                   {'genres': Linked('genre', artist_genre_table, 'artist_id', 'genre_id'),
+                    'shows': Many('show', 'artist_id')},
+                   order_by=('name', 'id')),
+    'show': Type(Show, ['id', 'start_time', 'artist_id', 'venue_id'],
+                 {'artist': One('artist', 'artist_id'), 'venue': One('venue', 'venue_id')},
+                 order_by=('start_time', 'id')),
+    'genre': Type(Genre, ['id', 'name'],
+                  {'venues': Linked('venue', venue_genre_table, 'genre_id', 'venue_id'),
+                   'artists': Linked('artist', artist_genre_table, 'genre_id', 'artist_id')},
+                  order_by=('name', 'id')),
+}
+ROOTS = {'venues': 'venue', 'artists': 'artist', 'shows': 'show', 'genres': 'genre'}
+
+
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+def _json_safe(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+class Query:
+    """One query document, executed with per-level batched loads."""
+
+    def __init__(self, max_rows=5000, max_depth=6, max_limit=500):
+        self.max_rows = max_rows
+        self.max_depth = max_depth
+        self.max_limit = max_limit
+        self.queries = 0
+        self.rows = 0
+
+    def run(self, document):
+        if not isinstance(document, dict) or not document:
+            raise QueryError('Expected an object like {"venues": {"select": [...]}}.')
+        data = {}
+        for root, spec in document.items():
+            if root not in ROOTS:
+                raise QueryError(f'Unknown root "{root}", expected one of {sorted(ROOTS)}.')
+            data[root] = self._root(ROOTS[root], spec if isinstance(spec, dict) else {'select': spec})
+        return data
+
+    # Selections
+    def _parse(self, type_name, selection, depth):
+        """(scalar names, {relation name: sub-selection}) after validating against the schema."""
+        if depth > self.max_depth:
+            raise QueryError(f'Selections may nest at most {self.max_depth} levels.')
+        if not isinstance(selection, list) or not selection:
+            raise QueryError(f'Selection for {type_name} must be a non-empty list.')
+        type_ = TYPES[type_name]
+        scalars, relations = [], {}
+        for item in selection:
+            if isinstance(item, str):
+                if item not in type_.scalars:
+                    raise QueryError(f'{type_name} has no field "{item}".')
+                scalars.append(item)
+            elif isinstance(item, dict):
+                for name, sub in item.items():
+                    if name not in type_.relations:
+                        raise QueryError(f'{type_name} has no relation "{name}".')
+                    relations[name] = sub
+            else:
+                raise QueryError('Selection items must be field names or {relation: [...]} objects.')
+        return scalars, relations
+
+    def _columns(self, type_name, scalars, relations, extra=()):
+        # Requested fields plus whatever the next level needs to join on
+        type_ = TYPES[type_name]
+        names = {'id', *scalars, *extra}
+        names.update(type_.relations[r].column for r in relations if isinstance(type_.relations[r], One))
+        return [getattr(type_.model, name) for name in type_.scalars if name in names]
+
+    def _remaining(self):
+        # One more than the budget allows, so _fetch() can tell it was exceeded without loading the rest
+        return self.max_rows - self.rows + 1
+
+    def _fetch(self, statement):
+        self.queries += 1
+        rows = [dict(row._mapping) for row in db.session.execute(statement)]
+        self.rows += len(rows)
+        if self.rows > self.max_rows:
+            raise QueryError(f'Query touches more than {self.max_rows} rows, narrow it down.')
+        return rows
+
+    def _ordered(self, type_name, statement):
+        type_ = TYPES[type_name]
+        return statement.order_by(*(getattr(type_.model, name) for name in type_.order_by))
+
+    # Resolution
+    def _root(self, type_name, spec):
+        type_ = TYPES[type_name]
+        scalars, relations = self._parse(type_name, spec.get('select'), 1)
+        statement = db.select(*self._columns(type_name, scalars, relations))
+        ids = spec.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(id, int) and not isinstance(id, bool) for id in ids):
+                raise QueryError('"ids" must be a list of integers.')
+            statement = statement.where(type_.model.id.in_(ids))
+        where = spec.get('where') or {}
+        if not isinstance(where, dict):
+            raise QueryError('"where" must be an object of field: value.')
+        for name, value in where.items():
+            if name not in type_.scalars:
+                raise QueryError(f'Can\'t filter {type_name} on "{name}".')
+            if not isinstance(value, _SCALAR_TYPES):
+                raise QueryError(f'Filter on "{name}" must be a string, number, boolean or null.')
+            statement = statement.where(getattr(type_.model, name) == value)
+        try:
+            limit = max(1, min(int(spec.get('limit', 50)), self.max_limit))
+            offset = max(int(spec.get('offset', 0)), 0)
+        except (TypeError, ValueError):
+            raise QueryError('"limit" and "offset" must be integers.')
+        rows = self._fetch(self._ordered(type_name, statement).limit(limit).offset(offset))
+        return self._resolve(type_name, rows, scalars, relations, 1)
+
+    def _resolve(self, type_name, rows, scalars, relations, depth):
+        outputs = [{name: _json_safe(row[name]) for name in scalars} for row in rows]
+        for name, sub in relations.items():
+            relation = TYPES[type_name].relations[name]
+            sub_scalars, sub_relations = self._parse(relation.target, sub, depth + 1)
+            children, parent_keys = self._load(relation, rows, sub_scalars, sub_relations)
+
+            # Each distinct child is resolved once, however many parents share it
+            unique = list({child['id']: child for child in children}.values())
+            resolved = dict(zip((child['id'] for child in unique),
+                                self._resolve(relation.target, unique, sub_scalars, sub_relations, depth + 1)))
+            for row, output in zip(rows, outputs):
+                keys = parent_keys(row)
+                if isinstance(relation, One):
+                    output[name] = resolved.get(keys)
+                else:
+                    output[name] = [resolved[id] for id in keys]
+        return outputs
+
+    def _load(self, relation, rows, scalars, relations):
+        """One query for a relation across all parent rows: (children, row -> child id(s))."""
+        target = TYPES[relation.target]
+        columns = self._columns(relation.target, scalars, relations)
+        if isinstance(relation, One):
+            keys = {row[relation.column] for row in rows if row[relation.column] is not None}
+            children = (self._fetch(db.select(*columns).where(target.model.id.in_(keys)).limit(self._remaining()))
+                        if keys else [])
+            return children, lambda row: row[relation.column]
+
+        parent_ids = {row['id'] for row in rows}
+        grouped = {}
+        if parent_ids:
+            if isinstance(relation, Many):
+                owner = getattr(target.model, relation.column)
+                statement = db.select(owner.label('_parent'), *columns).where(owner.in_(parent_ids))
+            else:
+                owner = relation.table.c[relation.parent_column]
+                statement = (db.select(owner.label('_parent'), *columns).select_from(target.model)
+                             .join(relation.table, relation.table.c[relation.child_column] == target.model.id)
+                             .where(owner.in_(parent_ids)))
+            children = self._fetch(self._ordered(relation.target, statement).limit(self._remaining()))
+        else:
+            children = []
+        for child in children:
+            grouped.setdefault(child.pop('_parent'), []).append(child['id'])
+        return children, lambda row: grouped.get(row['id'], [])
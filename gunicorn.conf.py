@@ -0,0 +1,18 @@
+import os
+
+# gunicorn -c gunicorn.conf.py
+#
+# The app is built once in the master (preload_app) and workers are forked from
+# it, sharing the imported code and compiled templates copy-on-write.  Database
+# pools inherited across the fork are disposed in each child by create_app().
+# Templates are compiled and rendered once in the master before forking.
+os.environ.setdefault('FYYUR_TEMPLATE_WARMUP', 'true')
+
+wsgi_app = 'wsgi:app'
+preload_app = True
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', (os.cpu_count() or 1) * 2 + 1))
+# Each open Server-Sent Event stream holds one thread; events.py caps them at
+# EVENTS_MAX_STREAMS per worker so the rest keep serving pages.
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = 30
@@ -0,0 +1,189 @@
+import threading
+import time
+
+from flask import current_app
+
+import geo
+from changes import change_feed
+from extensions import db
+from models import Genre, Venue, Artist, artist_genre_table, purging
+from prefix import PrefixIndex
+from shards import shards, genre_names
+from similarity import MinHashLSH
+
+
+# Venues can live on any shard (see shards.py); these gather rows from all of them
+def _gather(fn):
+    return [row for rows in shards.scatter(fn) for row in rows]
+
+
+def _from_shards(query):
+    return _gather(lambda session: session.execute(query).all())
+
+#----------------------------------------------------------------------------#
+# Similarity indexes.
+#----------------------------------------------------------------------------#
+
+# One MinHash/LSH index per entity type, built from the genre association tables on
+# first use and then kept current from the change feed (see _sync() below).
+artist_similarity = MinHashLSH()
+venue_similarity = MinHashLSH()
+
+
+def _visible(kind, rows):
+    # Venues/artists being purged are already deleted as far as readers go (see purge.py)
+    hidden = purging(kind)
+    return [row for row in rows if row[0] not in hidden]
+
+
+def similar_artists(artist_id, k=4):
+    _sync()
+    if not artist_similarity.loaded:
+        artist_similarity.load(_visible('artist', db.session.query(artist_genre_table.c.artist_id, Genre.name)
+            .join(Genre, Genre.id == artist_genre_table.c.genre_id).all()))
+    scores = dict(artist_similarity.similar(artist_id, k))
+    if not scores:
+        return []
+    rows = Artist.query.with_entities(Artist.id, Artist.name, Artist.image_link) \
+        .filter(Artist.id.in_(scores)).all()
+    rows.sort(key=lambda row: (-scores[row.id], row.name))
+    return [{"id": row.id, "name": row.name, "image_link": row.image_link,
+             "score": round(scores[row.id] * 100)} for row in rows]
+
+
+def similar_venues(venue_id, k=4):
+    _sync()
+    if not venue_similarity.loaded:
+        venue_similarity.load(_visible('venue', _gather(lambda session: [
+            (id, name) for id, names in genre_names(session).items() for name in names])))
+    scores = dict(venue_similarity.similar(venue_id, k))
+    if not scores:
+        return []
+    rows = _from_shards(db.select(Venue.id, Venue.name, Venue.image_link).where(Venue.id.in_(scores)))
+    rows.sort(key=lambda row: (-scores[row.id], row.name))
+    return [{"id": row.id, "name": row.name, "image_link": row.image_link,
+             "score": round(scores[row.id] * 100)} for row in rows]
+
+#----------------------------------------------------------------------------#
+# Venue locations.
+#----------------------------------------------------------------------------#
+
+# Grid index over geocoded venues, loaded on first use and kept current from the change feed
+venue_locations = geo.GridIndex()
+
+
+def nearby_venues(lat, lng, radius_miles=None, k=None):
+    _sync()
+    if not venue_locations.loaded:
+        venue_locations.load(_visible('venue', _from_shards(db.select(Venue.id, Venue.latitude, Venue.longitude)
+            .where(Venue.latitude.isnot(None), Venue.longitude.isnot(None)))))
+    if radius_miles is not None:
+        found = venue_locations.within(lat, lng, radius_miles)
+        if k is not None:
+            found = found[:k]
+    else:
+        found = venue_locations.nearest(lat, lng, k or 10)
+    distances = dict(found)
+    if not distances:
+        return []
+    rows = _from_shards(db.select(Venue.id, Venue.name, Venue.city, Venue.state, Venue.address)
+                        .where(Venue.id.in_(distances)))
+    rows.sort(key=lambda row: (distances[row.id], row.id))
+    return [{"id": row.id, "name": row.name, "city": row.city, "state": row.state,
+             "address": row.address, "distance": round(distances[row.id], 2)} for row in rows]
+
+#----------------------------------------------------------------------------#
+# Name autocomplete.
+#----------------------------------------------------------------------------#
+
+# Prefix indexes over venue and artist names, loaded on first use and kept current
+# from the change feed
+venue_names = PrefixIndex()
+artist_names = PrefixIndex()
+
+
+def autocomplete(query, kind=None, k=8):
+    _sync()
+    results = []
+    for name, index, model in (('venue', venue_names, Venue), ('artist', artist_names, Artist)):
+        if kind not in (None, name):
+            continue
+        if not index.loaded:
+            # Artists are all on the primary, venues on any shard
+            index.load(_visible(name, _from_shards(db.select(model.id, model.name)) if model is Venue
+                                else db.session.query(model.id, model.name).all()))
+        results.extend({"type": name, "id": item_id, "name": item_name}
+                       for item_id, item_name in index.search(query, k))
+    return results
+
+#----------------------------------------------------------------------------#
+# Keeping current.
+#----------------------------------------------------------------------------#
+
+# Every index lives in one process, and under gunicorn a write is handled by one
+# worker out of many.  So no request handler touches the indexes: each process
+# polls the change feed (changes.py) at most every INDEXES_POLL_SECONDS, the
+# way the catalog does (catalog.py), and applies the venue and artist snapshots
+# to whichever indexes it has loaded.  Snapshots carry the full row plus genre
+# names, and each one replaces the last, so entries that predate a load are
+# harmless to replay.  If the watermark has been pruned out of the feed, the
+# indexes are dropped and reload on next use.
+
+_VENUE_INDEXES = (venue_similarity, venue_locations, venue_names)
+_ARTIST_INDEXES = (artist_similarity, artist_names)
+_feed = {'seq': None, 'polled_at': 0.0}
+_feed_lock = threading.Lock()
+
+
+def _sync():
+    poll_seconds = current_app.config.get('INDEXES_POLL_SECONDS', 2.0)
+    if _feed['seq'] is not None and time.monotonic() - _feed['polled_at'] < poll_seconds:
+        return
+    with _feed_lock:
+        if _feed['seq'] is not None and time.monotonic() - _feed['polled_at'] < poll_seconds:
+            return      # another thread just did it
+        if _feed['seq'] is None or not _catch_up():
+            # Indexes load lazily, from a state at least as new as this watermark
+            for index in _VENUE_INDEXES + _ARTIST_INDEXES:
+                index.loaded = False
+            _feed['seq'] = change_feed.latest()
+        _feed['polled_at'] = time.monotonic()
+
+
+def _catch_up():
+    """Apply change feed entries past the watermark.  False if it has been pruned."""
+    while True:
+        page = change_feed.since(_feed['seq'])
+        if page is None:
+            return False
+        rows, more = page
+        for row in rows:
+            _apply(row)
+        if rows:
+            _feed['seq'] = rows[-1].seq
+        if not more:
+            return True
+
+
+def _apply(change):
+    id, data = change.entity_id, change.data
+    if change.entity == 'venue':
+        if change.op == 'delete':
+            for index in _VENUE_INDEXES:
+                index.remove(id)
+            return
+        if venue_similarity.loaded:
+            venue_similarity.update(id, data.get('genres', ()))
+        if venue_locations.loaded:
+            venue_locations.update(id, data.get('latitude'), data.get('longitude'))
+        if venue_names.loaded:
+            venue_names.update(id, data['name'])
+    elif change.entity == 'artist':
+        if change.op == 'delete':
+            for index in _ARTIST_INDEXES:
+                index.remove(id)
+            return
+        if artist_similarity.loaded:
+            artist_similarity.update(id, data.get('genres', ()))
+        if artist_names.loaded:
+            artist_names.update(id, data['name'])
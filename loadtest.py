@@ -0,0 +1,324 @@
+#----------------------------------------------------------------------------#
+# Load generator for a locally running instance.
+#----------------------------------------------------------------------------#
+
+# Replays a weighted mix of browsing, detail pages, searches and show creation
+# against a running server (e.g. gunicorn -c gunicorn.conf.py), ramping the
+# number of concurrent clients through --stages.  Each client thread keeps one
+# keep-alive connection, like a browser would.
+#
+#   python loadtest.py --url http://127.0.0.1:5000 --stages 4,16,64 --stage-seconds 30
+#
+# Every --interval seconds it prints throughput, p50/p99 latency, the error rate,
+# the share of requests rate limited (429) or shed (503) by admission control
+# and how busy the database pools are, then a summary per stage.  All clients
+# share one address, so raise the server's RATE_LIMITS (see admission.py) when
+# measuring capacity rather than the limits themselves.  Pool figures come from
+# GET /stats/pool and need --admin-token (or FYYUR_ADMIN_TOKEN) to match the
+# server's ADMIN_TOKEN; each poll lands on one worker, so the peak over all of
+# them is reported.
+#
+# --json FILE saves the stage summaries.  Given one as --baseline, a stage whose
+# throughput fell or whose p99 rose by more than --tolerance is reported as a
+# regression and the exit status is 1.
+#
+# create_show really inserts shows (through /api/shows/batch, which also needs
+# --admin-token).  Point it at a scratch database, or leave it out with
+# --mix create_show=0.
+
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_MIX = {
+    'venues': 20,
+    'artists': 15,
+    'shows': 10,
+    'venue': 20,
+    'artist': 15,
+    'search_venues': 8,
+    'search_artists': 7,
+    'create_show': 5,
+}
+SEARCH_TERMS = ('a', 'the', 'music', 'band', 'hop', 'jazz', 'park', 'sax', 'bar', 'live')
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+JSON = {'Content-Type': 'application/json'}
+
+
+def _request(action, ids, token=None):
+    """(method, path, body, headers) for one request of the given kind."""
+    if action in ('venues', 'artists', 'shows'):
+        return 'GET', f'/{action}', None, {}
+    if action in ('venue', 'artist'):
+        return 'GET', f'/{action}s/{random.choice(ids[action])}', None, {}
+    if action in ('search_venues', 'search_artists'):
+        path = '/venues/search' if action == 'search_venues' else '/artists/search'
+        return 'POST', path, urlencode({'search_term': random.choice(SEARCH_TERMS)}), FORM
+    if action == 'create_show':
+        start = datetime.now() + timedelta(days=random.randint(1, 60), hours=random.randint(0, 23))
+        record = {'venue_id': random.choice(ids['venue']), 'artist_id': random.choice(ids['artist']),
+                  'start_time': start.replace(minute=0, second=0, microsecond=0).isoformat()}
+        return 'POST', '/api/shows/batch', json.dumps([record]), {**JSON, 'Authorization': f'Bearer {token}'}
+    raise ValueError(f'Unknown action {action!r}')
+
+
+class Connection:
+    """One keep-alive HTTP connection, reopened after any failure."""
+
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80)
+        self.https = parts.scheme == 'https'
+        self.timeout = timeout
+        self._conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        if self._conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self._conn = cls(self.host, self.port, timeout=self.timeout)
+        try:
+            self._conn.request(method, path, body=body, headers=headers or {})
+            response = self._conn.getresponse()
+            data = response.read()
+            return response.status, data
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class Recorder:
+    """Completed requests, plus the pool samples taken meanwhile."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = []      # (finished at, action, seconds, status or None for a failure)
+        self.pool_samples = []  # (taken at, pid, peak checked out / capacity, saturated)
+
+    def add(self, *entry):
+        with self._lock:
+            self.requests.append(entry)
+
+    def add_sample(self, *entry):
+        with self._lock:
+            self.pool_samples.append(entry)
+
+    def window(self, start, end):
+        with self._lock:
+            return ([r for r in self.requests if start <= r[0] < end],
+                    [s for s in self.pool_samples if start <= s[0] < end])
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+
+def summarize(requests, samples, seconds):
+    latencies = sorted(r[2] for r in requests)
+    statuses = [r[3] for r in requests]
+    errors = sum(1 for s in statuses if s is None or (s >= 400 and s not in (429, 503)))
+    limited = sum(1 for s in statuses if s == 429)
+    shed = sum(1 for s in statuses if s == 503)
+    summary = {
+        'requests': len(requests),
+        'throughput': round(len(requests) / seconds, 2) if seconds else 0.0,
+        'p50_ms': round(_percentile(latencies, 50) * 1000, 1) if latencies else None,
+        'p99_ms': round(_percentile(latencies, 99) * 1000, 1) if latencies else None,
+        'error_rate': round(errors / len(requests), 4) if requests else 0.0,
+        'limited_rate': round(limited / len(requests), 4) if requests else 0.0,
+        'shed_rate': round(shed / len(requests), 4) if requests else 0.0,
+        'pool_peak': round(max(s[2] for s in samples), 2) if samples else None,
+        'pool_saturated': round(sum(1 for s in samples if s[3]) / len(samples), 2) if samples else None,
+        'workers_seen': len({s[1] for s in samples}),
+    }
+    by_action = {}
+    for finished, action, seconds_taken, status in requests:
+        by_action.setdefault(action, []).append(seconds_taken)
+    summary['actions'] = {action: {'requests': len(values),
+                                   'p50_ms': round(_percentile(sorted(values), 50) * 1000, 1),
+                                   'p99_ms': round(_percentile(sorted(values), 99) * 1000, 1)}
+                          for action, values in sorted(by_action.items())}
+    return summary
+
+
+def _format(label, summary):
+    pool = (f"pool peak {summary['pool_peak']:.0%} saturated {summary['pool_saturated']:.0%}"
+            if summary['pool_peak'] is not None else 'pool n/a')
+    p50 = '-' if summary['p50_ms'] is None else f"{summary['p50_ms']:.0f}"
+    p99 = '-' if summary['p99_ms'] is None else f"{summary['p99_ms']:.0f}"
+    return (f"{label:>14}  {summary['throughput']:8.1f} req/s  p50 {p50:>6} ms  p99 {p99:>6} ms  "
+            f"errors {summary['error_rate']:6.1%}  429 {summary['limited_rate']:6.1%}  "
+            f"503 {summary['shed_rate']:6.1%}  {pool}")
+
+
+def discover_ids(url, timeout):
+    """Venue and artist ids to aim the detail pages and show creation at, scraped from the listings."""
+    conn = Connection(url, timeout)
+    ids = {}
+    for kind in ('venue', 'artist'):
+        for attempt in range(10):
+            status, body = conn.request('GET', f'/{kind}s')
+            if status not in (429, 503):
+                break
+            time.sleep(1)     # rate limited or shed, e.g. right after an earlier run
+        if status != 200:
+            raise SystemExit(f'GET /{kind}s answered {status}, is the server up?')
+        ids[kind] = sorted({int(id) for id in re.findall(rf'href="/{kind}s/(\d+)"'.encode(), body)})
+    conn.close()
+    return ids
+
+
+def client(url, timeout, mix, ids, token, recorder, stop):
+    conn = Connection(url, timeout)
+    actions, weights = zip(*mix.items())
+    while not stop.is_set():
+        action = random.choices(actions, weights)[0]
+        method, path, body, headers = _request(action, ids, token)
+        started = time.perf_counter()
+        try:
+            status, _ = conn.request(method, path, body, headers)
+        except Exception:
+            status = None
+        recorder.add(time.time(), action, time.perf_counter() - started, status)
+    conn.close()
+
+
+def sample_pools(url, token, recorder, stop, every=1.0):
+    conn = Connection(url, 5)
+    headers = {'Authorization': f'Bearer {token}'}
+    while not stop.wait(every):
+        try:
+            status, body = conn.request('GET', '/stats/pool', headers=headers)
+        except Exception:
+            continue
+        if status != 200:
+            print(f'GET /stats/pool answered {status}, pool figures disabled', file=sys.stderr)
+            return
+        stats = json.loads(body)
+        busy = [pool['checked_out'] / pool['capacity'] for pool in stats['pools'].values() if pool.get('capacity')]
+        saturated = any(pool.get('saturated') for pool in stats['pools'].values())
+        recorder.add_sample(time.time(), stats['pid'], max(busy, default=0.0), saturated)
+    conn.close()
+
+
+def run(args, mix, ids):
+    recorder = Recorder()
+    done = threading.Event()
+    if args.admin_token:
+        threading.Thread(target=sample_pools, args=(args.url, args.admin_token, recorder, done), daemon=True).start()
+
+    stages = []
+    for concurrency in args.stages:
+        stop = threading.Event()
+        threads = [threading.Thread(target=client, daemon=True,
+                                    args=(args.url, args.timeout, mix, ids, args.admin_token, recorder, stop))
+                   for _ in range(concurrency)]
+        started = time.time()
+        for thread in threads:
+            thread.start()
+        print(f'-- {concurrency} clients')
+        tick = started
+        while tick < started + args.stage_seconds:
+            end = min(tick + args.interval, started + args.stage_seconds)
+            time.sleep(max(0.0, end - time.time()))
+            print(_format(f'+{end - started:.0f}s', summarize(*recorder.window(tick, end), end - tick)))
+            tick = end
+        stop.set()
+        for thread in threads:
+            thread.join(args.timeout + 1)
+        ended = time.time()
+        stages.append(dict(summarize(*recorder.window(started, ended), ended - started), concurrency=concurrency))
+    done.set()
+    return stages
+
+
+def compare(stages, baseline, tolerance):
+    """Human-readable regressions of stages against baseline stages at the same concurrency."""
+    previous = {stage['concurrency']: stage for stage in baseline}
+    regressions = []
+    for stage in stages:
+        before = previous.get(stage['concurrency'])
+        if before is None:
+            continue
+        if before['throughput'] and stage['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append(f"{stage['concurrency']} clients: throughput {before['throughput']} -> "
+                               f"{stage['throughput']} req/s")
+        if before['p99_ms'] and stage['p99_ms'] and stage['p99_ms'] > before['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{stage['concurrency']} clients: p99 {before['p99_ms']} -> {stage['p99_ms']} ms")
+        if stage['error_rate'] > before['error_rate'] + tolerance / 10:
+            regressions.append(f"{stage['concurrency']} clients: error rate {before['error_rate']:.1%} -> "
+                               f"{stage['error_rate']:.1%}")
+    return regressions
+
+
+def _mix(text):
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, text.split(',')):
+        action, _, weight = part.partition('=')
+        if action not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'unknown action {action!r}, expected one of {", ".join(DEFAULT_MIX)}')
+        mix[action] = float(weight)
+    return {action: weight for action, weight in mix.items() if weight > 0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ramp concurrent clients against a running instance.')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--stages', type=lambda s: [int(n) for n in s.split(',')], default=[1, 4, 16, 32],
+                        help='concurrent clients per stage, e.g. 4,16,64')
+    parser.add_argument('--stage-seconds', type=float, default=20)
+    parser.add_argument('--interval', type=float, default=5, help='seconds between progress lines')
+    parser.add_argument('--mix', type=_mix, default=_mix(''),
+                        help=f'action weights to override, e.g. create_show=0,search_venues=20 '
+                             f'(actions: {", ".join(DEFAULT_MIX)})')
+    parser.add_argument('--timeout', type=float, default=10, help='per-request timeout in seconds')
+    parser.add_argument('--admin-token', default=os.environ.get('FYYUR_ADMIN_TOKEN'))
+    parser.add_argument('--json', help='write the stage summaries to this file')
+    parser.add_argument('--baseline', help='stage summaries from an earlier --json run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown, default 0.2')
+    args = parser.parse_args(argv)
+
+    ids = discover_ids(args.url, args.timeout)
+    # Detail pages and show creation need something to point at
+    needs = {'venue': ['venue'], 'artist': ['artist'], 'create_show': ['venue', 'artist']}
+    mix = {action: weight for action, weight in args.mix.items() if all(ids[kind] for kind in needs.get(action, []))}
+    if not args.admin_token:
+        print('No --admin-token, pool figures and create_show disabled', file=sys.stderr)
+        mix.pop('create_show', None)
+
+    stages = run(args, mix, ids)
+    print('-- summary')
+    for stage in stages:
+        print(_format(f"{stage['concurrency']} clients", stage))
+        for action, figures in stage['actions'].items():
+            print(f"{action:>30}  {figures['requests']:7d} req  p50 {figures['p50_ms']:6.0f} ms  "
+                  f"p99 {figures['p99_ms']:6.0f} ms")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'url': args.url, 'mix': mix, 'stages': stages}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(stages, json.load(f)['stages'], args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
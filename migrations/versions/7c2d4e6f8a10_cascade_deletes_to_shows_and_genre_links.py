@@ -0,0 +1,61 @@
+"""ON DELETE CASCADE for shows and genre links, index show foreign keys.
+
+Revision ID: 7c2d4e6f8a10
+Revises: 3f1a9c2e7b54
+Create Date: 2026-10-19 11:02:57.603318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d4e6f8a10'
+down_revision = '3f1a9c2e7b54'
+branch_labels = None
+depends_on = None
+
+# (table, column, referenced table) for every foreign key that should cascade
+CASCADES = [
+    ('shows', 'artist_id', 'artists'),
+    ('shows', 'venue_id', 'venues'),
+    ('artist_genre_table', 'artist_id', 'artists'),
+    ('artist_genre_table', 'genre_id', 'genres'),
+    ('venue_genre_table', 'venue_id', 'venues'),
+    ('venue_genre_table', 'genre_id', 'genres'),
+]
+
+
+def _existing_fk_name(inspector, table, column):
+    for fk in inspector.get_foreign_keys(table):
+        if fk['constrained_columns'] == [column]:
+            return fk['name']
+    return None
+
+
+def _recreate_foreign_keys(ondelete):
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+    for table, column, referred in CASCADES:
+        # The genre association tables were historically created with db.create_all()
+        if table not in tables:
+            continue
+        name = _existing_fk_name(inspector, table, column) or f'{table}_{column}_fkey'
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            if _existing_fk_name(inspector, table, column):
+                batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    _recreate_foreign_keys('CASCADE')
+    with op.batch_alter_table('shows', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_shows_artist_id'), ['artist_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_shows_venue_id'), ['venue_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('shows', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_shows_venue_id'))
+        batch_op.drop_index(batch_op.f('ix_shows_artist_id'))
+    _recreate_foreign_keys(None)
@@ -1,7 +1,14 @@
 from datetime import datetime
-from app import app, db, Venue, Artist, Show
+from app import create_app
+from changes import change_feed
+from events import events
+from extensions import db, coalescer
+from models import Venue, Artist, Show
+from read_model import read_model
+from shards import shards
+from trending import trending
 
-def populate_shows():
+def populate_shows(app=None):
     reference_shows = [
         {
             "venue_name": "The Musical Hop",
@@ -35,32 +42,58 @@ def populate_shows():
         }
     ]
 
+    app = app or create_app()
     with app.app_context():
+        shows = []
+        committed = []      # shard rows to delete again if the primary's commit fails
         try:
             for ref_show in reference_shows:
-                # Get or create venue by name
-                venue = Venue.query.filter_by(name=ref_show["venue_name"]).first()
-                if not venue:
-                    venue = Venue(name=ref_show["venue_name"])
+                # Get or create venue by name, on whichever shard it lives
+                venue_id = next((id for id in shards.scatter(lambda session: session.scalar(
+                    db.select(Venue.id).where(Venue.name == ref_show["venue_name"]).limit(1))) if id is not None), None)
+                if venue_id is None:
+                    venue = Venue(id=shards.next_id(Venue), name=ref_show["venue_name"])
                     db.session.add(venue)
-                    db.session.commit()
+                    db.session.flush()
+                    venue_id = venue.id
+                    change_feed.record('venue', 'insert', [venue_id])
 
                 # Get or create artist by name
                 artist = Artist.query.filter_by(name=ref_show["artist_name"]).first()
                 if not artist:
                     artist = Artist(name=ref_show["artist_name"], image_link=ref_show["artist_image_link"])
                     db.session.add(artist)
-                    db.session.commit()
+                    db.session.flush()
+                    change_feed.record('artist', 'insert', [artist.id])
 
-                # Check if show exists by venue_id, artist_id, and start_time
+                # Check if show exists by venue_id, artist_id, and start_time, on the venue's shard
                 start_time_dt = datetime.fromisoformat(ref_show["start_time"].replace("Z", "+00:00"))
-                existing_show = Show.query.filter_by(venue_id=venue.id, artist_id=artist.id, start_time=start_time_dt).first()
+                shard = shards.shard_of_venue(venue_id)
+                session = shards.session(shard)
+                existing_show = session.scalar(db.select(Show.id).where(
+                    Show.venue_id == venue_id, Show.artist_id == artist.id, Show.start_time == start_time_dt))
                 if not existing_show:
-                    new_show = Show(venue_id=venue.id, artist_id=artist.id, start_time=start_time_dt)
-                    db.session.add(new_show)
-                    db.session.commit()
+                    new_show = Show(id=shards.next_id(Show), venue_id=venue_id, artist_id=artist.id,
+                                    start_time=start_time_dt)
+                    session.add(new_show)
+                    session.flush()
+                    if session is not db.session:
+                        session.commit()    # shard first, then the primary
+                        committed.append((shard, Show, [new_show.id]))
+                    events.publish_shows('show.created', Show.id == new_show.id, session=session)
+                    change_feed.record('show', 'insert', [new_show.id], session=session)
+                    shows.append((venue_id, artist.id, start_time_dt))
+
+            # The same bookkeeping as the batch API (views/api.py), so the catalog,
+            # trending, page documents and /changes all see the seeded rows
+            trending.shows_added(shows)
+            read_model.refresh(venue_ids={venue_id for venue_id, _, _ in shows},
+                               artist_ids={artist_id for _, artist_id, _ in shows})
+            db.session.commit()
+            coalescer.invalidate('shows', 'venues')
         except Exception as e:
             db.session.rollback()
+            shards.rollback(committed)
             print(f"Error occurred: {e}")
 
 if __name__ == "__main__":
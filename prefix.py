@@ -0,0 +1,100 @@
+#----------------------------------------------------------------------------#
+# Sorted-array prefix index for name autocomplete.
+#----------------------------------------------------------------------------#
+
+# Names are normalized (accents stripped, case folded, punctuation collapsed to
+# single spaces) and indexed once per word start, so "hop" finds
+# "The Musical Hop" as well as "Hop Scotch".  The keys live in one sorted list
+# of (key, item id) tuples: a lookup is a bisect to the first key >= the query
+# followed by a short forward scan while keys still start with it.  Inserts and
+# removals are bisect + list insert/delete, which for a few hundred thousand
+# keys is a memmove, cheap enough to do on every write.
+
+import bisect
+import re
+import threading
+import unicodedata
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD.sub(' ', text.casefold()).strip()
+
+
+def _word_starts(name):
+    words = normalize(name).split(' ')
+    return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+
+class PrefixIndex:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys = []     # sorted (key, item id)
+        self._names = {}    # item id -> display name
+        self._full = {}     # item id -> normalized name
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._names)
+
+    def update(self, item_id, name):
+        """Insert or rename one item."""
+        with self._lock:
+            if self._names.get(item_id) == name:
+                return
+            self._remove(item_id)
+            self._names[item_id] = name
+            self._full[item_id] = normalize(name)
+            for key in _word_starts(name):
+                bisect.insort(self._keys, (key, item_id))
+
+    def remove(self, item_id):
+        with self._lock:
+            self._remove(item_id)
+
+    def _remove(self, item_id):
+        name = self._names.pop(item_id, None)
+        if name is None:
+            return
+        del self._full[item_id]
+        for key in _word_starts(name):
+            i = bisect.bisect_left(self._keys, (key, item_id))
+            if i < len(self._keys) and self._keys[i] == (key, item_id):
+                del self._keys[i]
+
+    def load(self, rows):
+        """Bulk (re)build the index from (item id, name) rows."""
+        with self._lock:
+            self._names = {item_id: name for item_id, name in rows}
+            self._full = {item_id: normalize(name) for item_id, name in self._names.items()}
+            self._keys = sorted((key, item_id) for item_id, name in self._names.items()
+                                for key in _word_starts(name))
+            self.loaded = True
+
+    def search(self, query, k=8, scan=200):
+        """Up to k (item id, name) pairs whose name has a word starting with query.
+
+        Names that start with the query rank first, then shorter names, then
+        alphabetical.  At most `scan` keys are examined, which bounds the cost of
+        one-letter queries on a large index.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        with self._lock:
+            keys = self._keys
+            i = bisect.bisect_left(keys, (query,))
+            end = min(len(keys), i + scan)
+            found = {}
+            while i < end and keys[i][0].startswith(query):
+                key, item_id = keys[i]
+                whole = key == self._full[item_id]
+                if whole or item_id not in found:
+                    found[item_id] = (whole, self._names[item_id])
+                i += 1
+        ranked = sorted(found.items(), key=lambda item: (not item[1][0], len(item[1][1]), item[1][1]))
+        return [(item_id, name) for item_id, (_, name) in ranked[:k]]
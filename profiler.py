@@ -0,0 +1,311 @@
+#----------------------------------------------------------------------------#
+# Opt-in sampling profiler and allocation tracing.
+#----------------------------------------------------------------------------#
+
+# Per request: an admin (see admin_only() in admission.py) sends
+# `X-Profile: 1` or adds `?_profile=1`.  While that request runs, a sampler
+# thread records the request thread's stack every PROFILE_INTERVAL seconds, and
+# tracemalloc traces allocations.  Afterwards the folded stacks, a flame graph
+# (SVG) and the top allocation sites are stored in PROFILE_DIR, and the response
+# carries an X-Profile-Id to fetch them from /profiles/<id>.svg and
+# /profiles/<id>.txt.  `X-Profile: svg` returns the flame graph in place of the
+# page.  Non-admins asking for a profile get the normal page, nothing else.
+#
+# tracemalloc is process-wide, so allocations of requests running concurrently
+# in other threads show up in the report too.  It also slows the process down
+# while it's on, which is why it's only ever on while a profiled request runs:
+# the first one starts it and the last one to finish stops it.
+#
+# Continuous mode (PROFILE_CONTINUOUS) samples every request thread every
+# PROFILE_CONTINUOUS_INTERVAL seconds from one background thread and adds the
+# stacks up per endpoint, for /profiles/endpoints/<endpoint>.svg.  The request
+# path only pays for registering and unregistering its thread.  Each endpoint
+# keeps at most PROFILE_MAX_STACKS distinct stacks; samples of new stacks past
+# that count as '[other]'.  The sampler thread exits once it has had no request
+# to sample for PROFILE_CONTINUOUS_IDLE seconds (or on stop()), and the next
+# request starts another.
+
+import html
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import zlib
+from collections import Counter
+
+from flask import Response, current_app, g, request
+
+from admission import is_admin
+
+_OTHER = '[other]'
+
+# Profiled requests running at once, sharing tracemalloc
+_tracing = {'users': 0, 'ours': False}
+_tracing_lock = threading.Lock()
+
+
+def _start_tracing(depth):
+    with _tracing_lock:
+        if _tracing['users'] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(depth)
+            _tracing['ours'] = True
+        _tracing['users'] += 1
+
+
+def _stop_tracing():
+    with _tracing_lock:
+        _tracing['users'] -= 1
+        # Never stops tracing someone else started (e.g. PYTHONTRACEMALLOC)
+        if _tracing['users'] == 0 and _tracing['ours']:
+            tracemalloc.stop()
+            _tracing['ours'] = False
+
+
+def folded_stack(frame, limit):
+    """'outer;...;inner' for a frame, innermost limit frames, in flamegraph.pl's folded format."""
+    names = []
+    while frame is not None and len(names) < limit:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def flamegraph(stacks, title, width=1200, row_height=16):
+    """An SVG flame graph of {folded stack: samples}.  Hover a frame for its full name and share."""
+    root = {'value': 0, 'children': {}}
+    for stack, count in stacks.items():
+        node = root
+        node['value'] += count
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'value': 0, 'children': {}})
+            node['value'] += count
+    total = root['value'] or 1
+
+    rects, depth = [], 0
+    pending = [('all', root, 0, 0.0)]
+    while pending:
+        name, node, level, x = pending.pop()
+        w = node['value'] / total * width
+        if w < 0.5:
+            continue
+        depth = max(depth, level)
+        rects.append((name, node['value'], level, x, w))
+        for child_name, child in sorted(node['children'].items()):
+            pending.append((child_name, child, level + 1, x))
+            x += child['value'] / total * width
+
+    height = (depth + 1) * row_height + 40
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+           f'font-family="monospace" font-size="11">',
+           f'<text x="4" y="18" font-size="14">{html.escape(title)} ({total} samples)</text>']
+    for name, value, level, x, w in rects:
+        # Stacks grow upwards from the bottom edge, warm colours hashed from the name so they are stable
+        y = height - (level + 1) * row_height
+        hue = zlib.crc32(name.encode('utf-8')) % 60
+        label = html.escape(name)
+        text = html.escape(name[:max(0, int(w / 7) - 1)]) if w > 21 else ''
+        out.append(f'<g><title>{label}: {value} samples ({value / total:.1%})</title>'
+                   f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" '
+                   f'fill="hsl({hue},80%,60%)"/>'
+                   f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{text}</text></g>')
+    out.append('</svg>')
+    return '\n'.join(out)
+
+
+class RequestProfile:
+    """Samples one thread's stack and traces allocations until stop()."""
+
+    def __init__(self, thread_id, interval, depth):
+        self.stacks = Counter()
+        self._thread_id = thread_id
+        self._interval = interval
+        self._depth = depth
+        self._stop = threading.Event()
+        _start_tracing(depth)
+        self._before = tracemalloc.take_snapshot()
+        self._started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample, name='profile-request', daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None and not self._stop.is_set():     # not the request waiting in stop()
+                self.stacks[folded_stack(frame, self._depth)] += 1
+
+    def stop(self, top=25):
+        """Stop sampling; returns the allocation report as text."""
+        self._stop.set()
+        self._sampler.join()
+        self.seconds = time.perf_counter() - self._started
+        after = tracemalloc.take_snapshot()
+        _stop_tracing()
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        diff = after.filter_traces(filters).compare_to(self._before.filter_traces(filters), 'lineno')
+        lines = [f'Allocations during the request ({self.seconds * 1000:.1f} ms, {sum(self.stacks.values())} samples), '
+                 f'largest growth first:', '']
+        for stat in diff[:top]:
+            frame = stat.traceback[0]
+            lines.append(f'{stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} blocks  {frame.filename}:{frame.lineno}')
+        return '\n'.join(lines) + '\n'
+
+
+class Profiler:
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._active = {}           # thread id -> endpoint of the request it is serving
+        self.endpoints = {}         # endpoint -> Counter of folded stacks
+        self._sampler = None
+        self._sampler_stop = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+        app.config.setdefault('PROFILE_INTERVAL', 0.002)
+        app.config.setdefault('PROFILE_DEPTH', 64)
+        app.config.setdefault('PROFILE_KEEP', 50)
+        app.config.setdefault('PROFILE_CONTINUOUS', False)
+        app.config.setdefault('PROFILE_CONTINUOUS_INTERVAL', 0.05)
+        app.config.setdefault('PROFILE_CONTINUOUS_IDLE', 60)
+        app.config.setdefault('PROFILE_MAX_STACKS', 2000)
+        self.app = app
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['profiler'] = self
+
+    # One request
+    def _requested(self):
+        flag = request.headers.get('X-Profile') or request.args.get('_profile')
+        return flag if flag and is_admin() else None
+
+    def _before_request(self):
+        if current_app.config['PROFILE_CONTINUOUS']:
+            self._register(threading.get_ident(), request.endpoint or '[unmatched]')
+        flag = self._requested()
+        if flag:
+            g.profile = (flag, RequestProfile(threading.get_ident(), current_app.config['PROFILE_INTERVAL'],
+                                              current_app.config['PROFILE_DEPTH']))
+
+    def _after_request(self, response):
+        flag, profile = g.pop('profile', (None, None))
+        if profile is None:
+            return response
+        allocations = profile.stop()
+        title = f'{request.method} {request.full_path.rstrip("?")}'
+        svg = flamegraph(profile.stacks, title)
+        if flag == 'svg':
+            return Response(svg, mimetype='image/svg+xml', headers={'Cache-Control': 'no-store'})
+        response.headers['X-Profile-Id'] = self._store(request.endpoint or 'unknown', profile.stacks, svg,
+                                                       f'{title}\n{allocations}')
+        return response
+
+    def _teardown_request(self, exc):
+        # Also runs when the view raised, so the sampler and tracemalloc never outlive the request
+        flag, profile = g.pop('profile', (None, None))
+        if profile is not None:
+            profile.stop()
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    def _store(self, endpoint, stacks, svg, allocations):
+        directory = current_app.config['PROFILE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        profile_id = f'{int(time.time() * 1000)}-{re.sub(r"[^A-Za-z0-9_.-]", "_", endpoint)}'
+        for suffix, content in (('.folded', ''.join(f'{s} {n}\n' for s, n in stacks.items())),
+                                ('.svg', svg), ('.txt', allocations)):
+            with open(os.path.join(directory, profile_id + suffix), 'w') as f:
+                f.write(content)
+        # Keep the newest PROFILE_KEEP profiles
+        stored = sorted({name.rsplit('.', 1)[0] for name in os.listdir(directory)})
+        for old in stored[:-current_app.config['PROFILE_KEEP']]:
+            for suffix in ('.folded', '.svg', '.txt'):
+                try:
+                    os.remove(os.path.join(directory, old + suffix))
+                except FileNotFoundError:
+                    pass
+        return profile_id
+
+    def stored(self):
+        """Ids of the stored profiles, newest first."""
+        directory = current_app.config['PROFILE_DIR']
+        if not os.path.isdir(directory):
+            return []
+        return sorted({name.rsplit('.', 1)[0] for name in os.listdir(directory)}, reverse=True)
+
+    # Continuous
+    def _register(self, thread_id, endpoint):
+        with self._lock:
+            self._active[thread_id] = endpoint
+            # Also replaces a sampler that died of an exception
+            if self._sampler is None or not self._sampler.is_alive():
+                # Started on first use, so a preloaded master never forks with a live thread
+                self._sampler_stop = threading.Event()
+                self._sampler = threading.Thread(target=self._sample_loop, args=(self._sampler_stop,),
+                                                 name='profile-continuous', daemon=True)
+                self._sampler.start()
+
+    def stop(self):
+        """Stop the continuous sampler thread, if running.  The next continuous-mode request starts another."""
+        with self._lock:
+            sampler, stop, self._sampler = self._sampler, self._sampler_stop, None
+        if sampler is not None:
+            stop.set()
+            sampler.join()
+
+    def _sample_loop(self, stop):
+        interval = self.app.config['PROFILE_CONTINUOUS_INTERVAL']
+        depth = self.app.config['PROFILE_DEPTH']
+        max_stacks = self.app.config['PROFILE_MAX_STACKS']
+        idle_limit = self.app.config['PROFILE_CONTINUOUS_IDLE']
+        idle_since = None
+        while not stop.wait(interval):
+            frames = sys._current_frames()
+            with self._lock:
+                active = list(self._active.items())
+                if not active:
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since >= idle_limit:
+                        # Registering under the same lock, a request either sees this thread or starts a new one
+                        if self._sampler is threading.current_thread():
+                            self._sampler = None
+                        return
+                    continue
+            idle_since = None
+            try:
+                self._record(active, frames, depth, max_stacks)
+            except Exception:
+                self.app.logger.exception('Continuous profiler failed to record a sample')
+
+    def _record(self, active, frames, depth, max_stacks):
+        for thread_id, endpoint in active:
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            stack = folded_stack(frame, depth)
+            with self._lock:
+                stacks = self.endpoints.setdefault(endpoint, Counter())
+                if stack not in stacks and len(stacks) >= max_stacks:
+                    stack = _OTHER
+                stacks[stack] += 1
+
+    def endpoint_stacks(self, endpoint):
+        with self._lock:
+            return Counter(self.endpoints.get(endpoint, ()))
+
+    def endpoint_samples(self):
+        """{endpoint: samples} so far in this process."""
+        with self._lock:
+            return {endpoint: sum(stacks.values()) for endpoint, stacks in self.endpoints.items()}
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+
+
+profiler = Profiler()
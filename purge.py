@@ -0,0 +1,231 @@
+#----------------------------------------------------------------------------#
+# Venue/artist deletes with database-side cascade and a background purge.
+#----------------------------------------------------------------------------#
+
+# shows, venue_genre_table and artist_genre_table reference their parents with
+# ON DELETE CASCADE, so deleting a venue or artist is a single DELETE statement
+# and the ORM never has to load the related shows.  For a venue or artist with
+# few shows that statement runs inline.  The page documents of the deleted
+# entity and of everything it had shows with are refreshed in the transaction
+# that deletes it.
+#
+# Past PURGE_INLINE_LIMIT shows, one cascading DELETE would hold locks on
+# `shows` for too long.  Instead the request records a pending_purges row,
+# drops the entity's page document and appends its delete to the change feed,
+# all in one transaction.  From then on it is gone for readers: the read model
+# won't rebuild its page, and the catalog and indexes drop it and skip it when
+# loading.  A background thread then removes the shows in PURGE_BATCH_SIZE
+# chunks, one short transaction each, which also refreshes the pages listing
+# them.  Finally it deletes the parent row and the pending_purges row.
+#
+# The purging process heartbeats claimed_at with every batch.  Pending purges
+# live in the database, so a worker restart loses nothing: a purge whose claim
+# is older than PURGE_STALE_SECONDS is picked up by the next request to any
+# process (checked every PURGE_RESUME_SECONDS) or by `flask resume-purges`.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from changes import change_feed
+from events import events
+from extensions import db, coalescer
+from models import Venue, Artist, Show, VenueShard, PageDocument, PendingPurge
+from read_model import read_model
+from shards import shards, DEFAULT
+from trending import trending
+
+_KINDS = {'venue': (Venue, Show.venue_id, Show.artist_id), 'artist': (Artist, Show.artist_id, Show.venue_id)}
+
+
+class Purger:
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._resumed_at = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PURGE_INLINE_LIMIT', 200)
+        app.config.setdefault('PURGE_BATCH_SIZE', 500)
+        app.config.setdefault('PURGE_STALE_SECONDS', 60)
+        app.config.setdefault('PURGE_RESUME_SECONDS', 60)
+        self.app = app
+        app.before_request(self._resume_stale)
+
+        @app.cli.command('resume-purges')
+        def resume_purges_command():
+            """Run every pending venue/artist purge no process is working on."""
+            print(f'Finished {self.resume(inline=True)} pending purges')
+
+        app.extensions['purge'] = self
+
+    def delete_venue(self, venue_id):
+        """Delete a venue and its shows.  Returns True if done inline, False if scheduled."""
+        shard = shards.shard_of_venue(venue_id)
+        if shard != DEFAULT:
+            return self._delete_from_shard(shard, venue_id)
+        return self._delete(Venue, Show.venue_id, venue_id)
+
+    def delete_artist(self, artist_id):
+        """Delete an artist and its shows.  Returns True if done inline, False if scheduled."""
+        sharded_shows = self._delete_sharded_shows(artist_id)
+        done = self._delete(Artist, Show.artist_id, artist_id)
+        if sharded_shows:
+            trending.shows_removed(sharded_shows)
+            read_model.refresh(venue_ids={venue_id for venue_id, _, _ in sharded_shows})
+            db.session.commit()
+        return done
+
+    def _delete_sharded_shows(self, artist_id):
+        # Shows on shards have no foreign key to the artist to cascade from.  Their
+        # events and change feed entries go out with the primary's commit.
+        shows = []
+        for name in shards.names[1:]:
+            session = shards.session(name)
+            show_ids = session.scalars(db.select(Show.id).where(Show.artist_id == artist_id)).all()
+            if not show_ids:
+                continue
+            events.publish_shows('show.deleted', Show.id.in_(show_ids), session=session)
+            change_feed.record('show', 'delete', show_ids)
+            shows.extend(trending.show_rows(session, Show.id.in_(show_ids)))
+            session.execute(db.delete(Show).where(Show.id.in_(show_ids)))
+            session.commit()
+        return shows
+
+    def _delete(self, model, show_column, owner_id):
+        num_shows = db.session.scalar(db.select(db.func.count(Show.id)).where(show_column == owner_id))
+        if num_shows <= self.app.config['PURGE_INLINE_LIMIT']:
+            related = self._related(model, owner_id)
+            show_ids = db.session.scalars(db.select(Show.id).where(show_column == owner_id)).all()
+            events.publish_shows('show.deleted', Show.id.in_(show_ids))
+            change_feed.record('show', 'delete', show_ids)
+            trending.shows_removed(trending.show_rows(db.session, Show.id.in_(show_ids)))
+            # The database cascades to shows and genre links
+            db.session.execute(db.delete(model).where(model.id == owner_id))
+            self._record_delete(model, owner_id, related)
+            db.session.commit()
+            return True
+        self._schedule('venue' if model is Venue else 'artist', owner_id)
+        return False
+
+    def _schedule(self, kind, owner_id):
+        if db.session.get(PendingPurge, (kind, owner_id)) is not None:
+            db.session.commit()     # already being purged
+            return
+        # Gone for readers from this commit on (see above); the rows follow in the background
+        db.session.add(PendingPurge(kind=kind, entity_id=owner_id, claimed_at=datetime.utcnow()))
+        db.session.execute(db.delete(PageDocument).where(PageDocument.kind == kind,
+                                                          PageDocument.entity_id == owner_id))
+        change_feed.record(kind, 'delete', [owner_id])
+        db.session.commit()
+        self._submit(kind, owner_id)
+
+    def _delete_from_shard(self, shard, venue_id):
+        # Shards hold a state's worth of venues, so the cascade always runs inline
+        session = shards.session(shard)
+        related = self._related(Venue, venue_id)
+        show_ids = session.scalars(db.select(Show.id).where(Show.venue_id == venue_id)).all()
+        events.publish_shows('show.deleted', Show.id.in_(show_ids), session=session)
+        change_feed.record('show', 'delete', show_ids)
+        shows = trending.show_rows(session, Show.venue_id == venue_id)
+        session.execute(db.delete(Venue).where(Venue.id == venue_id))
+        session.commit()
+        db.session.execute(db.delete(VenueShard).where(VenueShard.venue_id == venue_id))
+        trending.shows_removed(shows)
+        self._record_delete(Venue, venue_id, related)
+        db.session.commit()
+        return True
+
+    def _related(self, model, owner_id):
+        # Page documents listing shows of the entity being deleted
+        if model is Venue:
+            return read_model.artists_at_venue(owner_id)
+        return read_model.venues_of_artist(owner_id)
+
+    def _record_delete(self, model, owner_id, related):
+        # Page documents and the change feed, in the deleting transaction
+        if model is Venue:
+            read_model.refresh(venue_ids=[owner_id], artist_ids=related)
+            change_feed.record('venue', 'delete', [owner_id])
+        else:
+            read_model.refresh(venue_ids=related, artist_ids=[owner_id])
+            change_feed.record('artist', 'delete', [owner_id])
+
+    def _submit(self, kind, owner_id):
+        with self._lock:
+            if self._executor is None:
+                # Created on first use, so a preloaded master never forks with a live thread
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='purge')
+        self._executor.submit(self._purge, kind, owner_id)
+
+    def _purge(self, kind, owner_id):
+        model, show_column, other_column = _KINDS[kind]
+        batch_size = self.app.config['PURGE_BATCH_SIZE']
+        pending = (PendingPurge.kind == kind, PendingPurge.entity_id == owner_id)
+        with self.app.app_context():
+            try:
+                while True:
+                    batch = db.session.execute(db.select(Show.id, other_column).where(show_column == owner_id)
+                                               .limit(batch_size)).all()
+                    if not batch:
+                        break
+                    show_ids = [show_id for show_id, _ in batch]
+                    events.publish_shows('show.deleted', Show.id.in_(show_ids))
+                    change_feed.record('show', 'delete', show_ids)
+                    trending.shows_removed(trending.show_rows(db.session, Show.id.in_(show_ids)))
+                    db.session.execute(db.delete(Show).where(Show.id.in_(show_ids)))
+                    # Pages that listed these shows, so an interrupted purge leaves none stale
+                    related = {other_id for _, other_id in batch}
+                    read_model.refresh(**{'artist_ids' if model is Venue else 'venue_ids': related})
+                    db.session.execute(db.update(PendingPurge).where(*pending).values(claimed_at=datetime.utcnow()))
+                    db.session.commit()
+                db.session.execute(db.delete(model).where(model.id == owner_id))
+                db.session.execute(db.delete(PendingPurge).where(*pending))
+                db.session.commit()
+                coalescer.invalidate('venues', 'shows')
+            except Exception:
+                self.app.logger.exception(f'Purging {kind} {owner_id} failed')
+                db.session.rollback()
+            finally:
+                db.session.close()
+
+    # Pending purges
+    def resume(self, inline=False):
+        """Claim the pending purges no process is working on and run them.  Returns how many were claimed."""
+        stale = datetime.utcnow() - timedelta(seconds=self.app.config['PURGE_STALE_SECONDS'])
+        unclaimed = db.or_(PendingPurge.claimed_at.is_(None), PendingPurge.claimed_at < stale)
+        claimed = 0
+        for kind, owner_id in db.session.execute(
+                db.select(PendingPurge.kind, PendingPurge.entity_id).where(unclaimed)).all():
+            # Conditional, so only one process wins each purge
+            won = db.session.execute(
+                db.update(PendingPurge)
+                .where(PendingPurge.kind == kind, PendingPurge.entity_id == owner_id, unclaimed)
+                .values(claimed_at=datetime.utcnow())).rowcount
+            db.session.commit()
+            if won:
+                claimed += 1
+                if inline:
+                    self._purge(kind, owner_id)
+                else:
+                    self._submit(kind, owner_id)
+        return claimed
+
+    def _resume_stale(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._resumed_at is not None and now - self._resumed_at < self.app.config['PURGE_RESUME_SECONDS']:
+                return
+            self._resumed_at = now
+        try:
+            self.resume()
+        except Exception:
+            self.app.logger.exception('Resuming pending purges failed')
+            db.session.rollback()
+
+
+purger = Purger()
@@ -0,0 +1,288 @@
+#----------------------------------------------------------------------------#
+# Query plan regression guard for the hot routes.
+#----------------------------------------------------------------------------#
+
+# `flask check-query-plans` requests every route in QUERY_PLAN_ROUTES through
+# the test client and captures each SQL statement it issues, on every engine
+# (shards included).  Each distinct SELECT is explained on the engine it ran
+# on: EXPLAIN (FORMAT JSON) on PostgreSQL, EXPLAIN QUERY PLAN on SQLite.  The
+# plan is reduced to its shape (scan nodes with their table and index, plus the
+# estimated total cost on PostgreSQL) and compared with the baseline file
+# (QUERY_PLAN_BASELINE).  The check fails, exiting 1, on:
+#
+#   - a sequential scan of a QUERY_PLAN_WATCHED_TABLES table the baseline didn't
+#     have, or any such scan in a statement the baseline has never seen,
+#   - an index the baseline plan used and the new one doesn't,
+#   - an estimated cost above QUERY_PLAN_COST_FACTOR times the baseline's,
+#   - a route issuing more statements than its budget: QUERY_BUDGETS[route]
+#     if set, otherwise the count recorded in the baseline.
+#
+# The baseline records the database dialect it was captured on, and plans are
+# only ever compared with a baseline of the same dialect: SQLite and PostgreSQL
+# plans of one statement have nothing in common.  Statements are matched by
+# their SQL with literal lists collapsed, so a different number of ids in an
+# IN (...) is the same statement.  Routes are
+# requested once each, in order, from a fresh process with the listing caches
+# invalidated, so the counts include the cold loads (catalog, trending lists,
+# autocomplete index) of whichever route comes first.
+#
+# Plans only mean something on realistic volumes: a planner happily seq scans
+# a 10-row table.  `flask seed-plan-data --shows 200000` fills a scratch
+# database with synthetic venues, artists and shows.  Then run
+# `flask check-query-plans --update` to write the baseline and commit it.
+# tests/test_query_plans.py runs the same check against a small seeded SQLite
+# database and the SQLite baseline next to it.
+
+import hashlib
+import json
+import os
+import random
+import re
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import event
+
+from extensions import db, coalescer
+from models import Genre, Venue, Artist, Show, artist_genre_table, venue_genre_table
+from shards import shards
+
+DEFAULT_ROUTES = [
+    ('GET', '/venues'),
+    ('GET', '/artists'),
+    ('GET', '/shows'),
+    ('GET', '/venues/{venue_id}'),
+    ('GET', '/artists/{artist_id}'),
+    ('GET', '/venues/{venue_id}/shows'),
+    ('POST', '/venues/search', {'search_term': 'the'}),
+    ('POST', '/artists/search', {'search_term': 'the'}),
+    ('GET', '/autocomplete?q=th'),
+    ('GET', '/trending'),
+    ('GET', '/changes?since=0'),
+]
+
+_PLACEHOLDER = r'(?:\?|%\(\w+\)s|%s|:\w+)'
+_PLACEHOLDER_LIST = re.compile(rf'\bIN \(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)', re.IGNORECASE)
+_SQLITE_SCAN = re.compile(r'^(SCAN|SEARCH) (?:TABLE )?(\w+)(?: AS \w+)?(?: USING (?:COVERING )?(INDEX (\w+)|INTEGER PRIMARY KEY))?')
+
+
+def fingerprint(statement):
+    """Statement text with whitespace normalised and IN-lists of placeholders collapsed."""
+    text = _PLACEHOLDER_LIST.sub('IN (...)', ' '.join(statement.split()))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16], text
+
+
+class QueryPlanGuard:
+
+    def __init__(self, app=None):
+        self._statements = None     # while capturing; shard queries run on pool threads, so not thread-local
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_PLAN_ROUTES', DEFAULT_ROUTES)
+        app.config.setdefault('QUERY_PLAN_BASELINE', os.path.join(app.root_path, 'query_plans.json'))
+        app.config.setdefault('QUERY_PLAN_WATCHED_TABLES', ('shows', 'venues', 'artists'))
+        app.config.setdefault('QUERY_PLAN_COST_FACTOR', 2.0)
+        app.config.setdefault('QUERY_BUDGETS', {})     # 'GET /venues' -> statements
+
+        @app.cli.command('check-query-plans')
+        @click.option('--update', is_flag=True, help='Write the current plans and counts as the new baseline.')
+        def check_query_plans_command(update):
+            """Explain every statement of the hot routes and compare with the baseline."""
+            report = self.capture()
+            path = current_app.config['QUERY_PLAN_BASELINE']
+            if update:
+                with open(path, 'w') as f:
+                    json.dump(report, f, indent=2, sort_keys=True)
+                routes = report['routes']
+                print(f'Wrote {sum(len(r["statements"]) for r in routes.values())} {report["dialect"]} plans '
+                      f'for {len(routes)} routes to {path}')
+                return
+            baseline = None
+            if os.path.exists(path):
+                with open(path) as f:
+                    baseline = json.load(f)
+            else:
+                print(f'No baseline at {path}, only checking for scans and budgets (run with --update)')
+            problems = self.compare(report, baseline)
+            for route, route_report in report['routes'].items():
+                print(f'{route}: {route_report["queries"]} queries')
+            for problem in problems:
+                print(f'FAIL {problem}')
+            if problems:
+                raise SystemExit(1)
+            print('Query plans OK')
+
+        @app.cli.command('seed-plan-data')
+        @click.option('--shows', type=int, default=200000)
+        def seed_plan_data_command(shows):
+            """Fill a scratch database with synthetic rows for check-query-plans."""
+            self.seed(shows)
+
+        app.extensions['query_plans'] = self
+
+    # Capturing
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        captured = self._statements
+        if captured is not None:
+            captured.append((conn.engine, statement, parameters))
+
+    def capture(self):
+        """{'dialect': name, 'routes': {'METHOD path': {'queries': n, 'statements': {fingerprint: {'sql', 'plan', 'cost'}}}}}"""
+        config = current_app.config
+        engines = list(db.engines.values())
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        ids = {'venue_id': self._first_id(Venue), 'artist_id': self._first_id(Artist)}
+        coalescer.invalidate('venues', 'shows')
+        # The catalog loads on the first route that needs it and doesn't poll mid-run,
+        # so the counts don't depend on how long the explains take
+        poll_seconds, config['CATALOG_POLL_SECONDS'] = config['CATALOG_POLL_SECONDS'], float('inf')
+        client = current_app.test_client()
+        routes = {}
+        try:
+            for route in config['QUERY_PLAN_ROUTES']:
+                method, path, form = (tuple(route) + (None,))[:3]
+                path = path.format(**ids)
+                self._statements = []
+                try:
+                    response = client.open(path, method=method, data=form)
+                finally:
+                    statements, self._statements = self._statements, None
+                if response.status_code >= 400:
+                    click.echo(f'{method} {path} answered {response.status_code}', err=True)
+                route_report = routes[f'{method} {route[1]}'] = {'queries': len(statements), 'statements': {}}
+                for engine, statement, parameters in statements:
+                    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+                        continue
+                    key, text = fingerprint(statement)
+                    if key not in route_report['statements']:
+                        plan, cost = self.explain(engine, statement, parameters)
+                        route_report['statements'][key] = {'sql': text, 'plan': plan, 'cost': cost}
+        finally:
+            config['CATALOG_POLL_SECONDS'] = poll_seconds
+            for engine in engines:
+                event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+        return {'dialect': db.engine.dialect.name, 'routes': routes}
+
+    def _first_id(self, model):
+        return min((id for id in shards.scatter(lambda session: session.scalar(db.select(db.func.min(model.id))))
+                    if id is not None), default=1)
+
+    # Explaining
+    def explain(self, engine, statement, parameters):
+        """(scan nodes as [node, table, index], estimated total cost or None)."""
+        with engine.connect() as conn:
+            if engine.dialect.name == 'postgresql':
+                result = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+                plan = (json.loads(result) if isinstance(result, str) else result)[0]['Plan']
+                return self._postgres_nodes(plan), plan.get('Total Cost')
+            if engine.dialect.name == 'sqlite':
+                rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+                return self._sqlite_nodes(row[-1] for row in rows), None
+        return [], None
+
+    def _postgres_nodes(self, plan):
+        nodes = []
+        if 'Relation Name' in plan or 'Index Name' in plan:
+            nodes.append([plan['Node Type'], plan.get('Relation Name'), plan.get('Index Name')])
+        for child in plan.get('Plans', ()):
+            nodes.extend(self._postgres_nodes(child))
+        return nodes
+
+    def _sqlite_nodes(self, details):
+        nodes = []
+        for detail in details:
+            match = _SQLITE_SCAN.match(detail)
+            if match:
+                verb, table, using, index = match.groups()
+                node = 'Seq Scan' if verb == 'SCAN' and not using else 'Index Scan'
+                nodes.append([node, table, index or ('PRIMARY KEY' if using else None)])
+        return nodes
+
+    # Comparing
+    def compare(self, report, baseline):
+        """Human-readable problems with report, relative to baseline (which may be None)."""
+        if baseline is not None and baseline.get('dialect') != report['dialect']:
+            raise click.ClickException(
+                f'The baseline holds {baseline.get("dialect")} plans and these are {report["dialect"]} plans.  '
+                f'Compare against a {report["dialect"]} baseline, or record one with --update.')
+        config = current_app.config
+        watched = set(config['QUERY_PLAN_WATCHED_TABLES'])
+        factor = config['QUERY_PLAN_COST_FACTOR']
+        problems = []
+        for route, route_report in report['routes'].items():
+            before = (baseline or {}).get('routes', {}).get(route)
+            budget = config['QUERY_BUDGETS'].get(route, before['queries'] if before else None)
+            if budget is not None and route_report['queries'] > budget:
+                problems.append(f'{route}: {route_report["queries"]} queries, budget {budget}')
+            for key, statement in route_report['statements'].items():
+                old = (before or {}).get('statements', {}).get(key)
+                label = f'{route}: {statement["sql"][:120]}'
+                seq_scans = {table for node, table, _ in statement['plan'] if node == 'Seq Scan' and table in watched}
+                if old is None:
+                    for table in sorted(seq_scans):
+                        problems.append(f'{label}\n    new statement scans {table} sequentially')
+                    continue
+                old_seq_scans = {table for node, table, _ in old['plan'] if node == 'Seq Scan'}
+                for table in sorted(seq_scans - old_seq_scans):
+                    problems.append(f'{label}\n    now scans {table} sequentially')
+                lost = ({index for _, _, index in old['plan'] if index}
+                        - {index for _, _, index in statement['plan'] if index})
+                for index in sorted(lost):
+                    problems.append(f'{label}\n    no longer uses index {index}')
+                if old['cost'] and statement['cost'] and statement['cost'] > old['cost'] * factor:
+                    problems.append(f'{label}\n    estimated cost {old["cost"]} -> {statement["cost"]}')
+        return problems
+
+    # Seeding
+    def seed(self, show_count):
+        """Insert synthetic venues, artists and shows in batches.  Only ever on a scratch database."""
+        if shards.enabled:
+            raise click.ClickException('Seed an unsharded scratch database, then move states with `flask shards move`.')
+        from read_model import read_model
+        from trending import trending
+
+        rng = random.Random(0)
+        venue_count, artist_count = max(1, show_count // 50), max(1, show_count // 20)
+        states = ['CA', 'NY', 'TX', 'IL', 'WA', 'MA', 'FL', 'OR', 'CO', 'GA']
+        genres = [genre.id for genre in Genre.query.all()] or [
+            db.session.execute(db.insert(Genre).values(name=name).returning(Genre.id)).scalar()
+            for name in ('Jazz', 'Blues', 'Rock n Roll', 'Folk', 'Hip-Hop', 'Classical')]
+        words = ['The', 'Blue', 'Red', 'Hall', 'Room', 'Sound', 'Live', 'House', 'Club', 'Band', 'Hop', 'Sax']
+
+        def name():
+            return ' '.join(rng.choice(words) for _ in range(3)) + f' {rng.randrange(10000)}'
+
+        def insert(model, rows):
+            ids = []
+            for start in range(0, len(rows), 1000):
+                ids.extend(db.session.scalars(db.insert(model).values(rows[start:start + 1000]).returning(model.id)))
+            return ids
+
+        venue_ids = insert(Venue, [{'name': name(), 'city': f'City {rng.randrange(200)}', 'state': rng.choice(states),
+                                    'phone': '555-555-5555'} for _ in range(venue_count)])
+        artist_ids = insert(Artist, [{'name': name(), 'city': f'City {rng.randrange(200)}', 'state': rng.choice(states),
+                                      'phone': '555-555-5555'} for _ in range(artist_count)])
+        for table, owner, ids in ((venue_genre_table, 'venue_id', venue_ids), (artist_genre_table, 'artist_id', artist_ids)):
+            links = [{owner: id, 'genre_id': genre} for id in ids for genre in rng.sample(genres, 2)]
+            for start in range(0, len(links), 5000):
+                db.session.execute(db.insert(table), links[start:start + 5000])
+        now = datetime.now()
+        shows = [{'venue_id': rng.choice(venue_ids), 'artist_id': rng.choice(artist_ids),
+                  'start_time': now + timedelta(days=rng.randint(-365, 365), hours=rng.randint(0, 23))}
+                 for _ in range(show_count)]
+        for start in range(0, len(shows), 5000):
+            db.session.execute(db.insert(Show), shows[start:start + 5000])
+        db.session.commit()
+
+        read_model.rebuild()
+        trending.rebuild()
+        db.session.execute(db.text('ANALYZE'))     # fresh planner statistics, both PostgreSQL and SQLite
+        db.session.commit()
+        print(f'Seeded {venue_count} venues, {artist_count} artists and {show_count} shows')
+
+
+query_plans = QueryPlanGuard()
@@ -0,0 +1,182 @@
+#----------------------------------------------------------------------------#
+# Read model: precomputed venue and artist page documents.
+#----------------------------------------------------------------------------#
+
+# page_documents holds one JSON document per venue and per artist: the entity's
+# columns, its genre names, and every show with the other side's name and image.
+# Write paths call refresh() with the ids they touched before committing, so
+# each document changes in the same transaction as the rows it is built from.
+# Documents are rebuilt in batches (a few queries per batch however many ids),
+# so the batch API and purges stay cheap.  Venues and shows may live on shards
+# (see shards.py): venue documents are built from the venue's shard, artist
+# documents gather their shows from every shard, and all documents are stored
+# on the primary.
+#
+# Rendering a detail page is then one primary-key lookup.  The only work left
+# at request time is splitting shows into upcoming and past, which depends on
+# the clock.  A missing document (e.g. right after the migration) is built on
+# first view; `flask rebuild-read-model` rebuilds all of them.
+
+from datetime import datetime
+from operator import itemgetter
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from filters import format_datetime
+from models import Genre, Venue, Artist, Show, PageDocument, artist_genre_table, purging
+from shards import shards, artist_cards, genre_names
+
+VENUE_COLUMNS = ['id', 'name', 'address', 'city', 'state', 'phone', 'website', 'facebook_link',
+                 'seeking_talent', 'seeking_description', 'image_link']
+ARTIST_COLUMNS = ['id', 'name', 'city', 'state', 'phone', 'website', 'facebook_link',
+                  'seeking_venue', 'seeking_description', 'image_link']
+
+
+class ReadModel:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('READ_MODEL_BATCH_SIZE', 500)
+        app.cli.command('rebuild-read-model')(self._rebuild_command)
+        app.extensions['read_model'] = self
+
+    # Writing
+    def refresh(self, venue_ids=(), artist_ids=()):
+        """Rebuild the documents of these venues and artists in the current transaction.
+
+        Ids of deleted entities are fine: their documents are removed.  So are those
+        of entities being purged (see purge.py), which get none until they're gone.
+        """
+        batch_size = current_app.config['READ_MODEL_BATCH_SIZE']
+        for kind, ids, build in (('venue', venue_ids, self._venue_documents),
+                                 ('artist', artist_ids, self._artist_documents)):
+            ids = sorted({int(id) for id in ids})
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                hidden = purging(kind, batch)
+                documents = build([id for id in batch if id not in hidden])
+                db.session.execute(db.delete(PageDocument).where(PageDocument.kind == kind,
+                                                                  PageDocument.entity_id.in_(batch)))
+                if documents:
+                    now = datetime.utcnow()
+                    db.session.execute(db.insert(PageDocument), [
+                        {'kind': kind, 'entity_id': id, 'document': document, 'updated_at': now}
+                        for id, document in documents.items()])
+
+    def artists_at_venue(self, venue_id):
+        session = shards.venue_session(venue_id)
+        return set(session.scalars(db.select(Show.artist_id).where(Show.venue_id == venue_id).distinct()))
+
+    def venues_of_artist(self, artist_id):
+        found = shards.scatter(lambda session: session.scalars(
+            db.select(Show.venue_id).where(Show.artist_id == artist_id).distinct()).all())
+        return set().union(*found)
+
+    def _genres(self, association_table, owner_column, ids):
+        owner = association_table.c[owner_column]
+        grouped = {}
+        rows = db.session.execute(db.select(owner, Genre.name)
+                                  .join(Genre, Genre.id == association_table.c.genre_id)
+                                  .where(owner.in_(ids)).order_by(owner, Genre.name))
+        for owner_id, name in rows:
+            grouped.setdefault(owner_id, []).append(name)
+        return grouped
+
+    def _documents(self, session, model, columns, ids, genres, show_rows, show_keys):
+        documents = {}
+        for row in session.execute(db.select(*(getattr(model, c) for c in columns)).where(model.id.in_(ids))):
+            document = dict(zip(columns, row))
+            document['genres'] = genres.get(document['id'], [])
+            document['shows'] = []
+            documents[document['id']] = document
+        for owner_id, other_id, other_name, other_image, start_time in show_rows:
+            if owner_id in documents:
+                documents[owner_id]['shows'].append(dict(zip(show_keys, (other_id, other_name, other_image,
+                                                                         str(start_time)))))
+        return documents
+
+    def _venue_documents(self, ids):
+        documents = {}
+        for shard, shard_ids in shards.locate_venues(ids).items():
+            session = shards.session(shard)
+            shows = session.execute(
+                db.select(Show.venue_id, Show.artist_id, Show.start_time)
+                .where(Show.venue_id.in_(shard_ids)).order_by(Show.start_time, Show.id)).all()
+            # Artists are on the primary, whichever shard the venue is on
+            artists = artist_cards(artist_id for _, artist_id, _ in shows)
+            rows = ((venue_id, artist_id, *artists[artist_id], start_time)
+                    for venue_id, artist_id, start_time in shows if artist_id in artists)
+            documents.update(self._documents(session, Venue, VENUE_COLUMNS, shard_ids,
+                                             genre_names(session, shard_ids), rows,
+                                             ('artist_id', 'artist_name', 'artist_image_link', 'start_time')))
+        for document in documents.values():
+            document['seeking_talent'] = bool(document['seeking_talent'])
+        return documents
+
+    def _artist_documents(self, ids):
+        shows = shards.merge(lambda session: session.execute(
+            db.select(Show.artist_id, Show.venue_id, Venue.name, Venue.image_link, Show.start_time)
+            .join(Venue, Venue.id == Show.venue_id).where(Show.artist_id.in_(ids))
+            .order_by(Show.start_time, Show.id)).all(), key=itemgetter(4))
+        return self._documents(db.session, Artist, ARTIST_COLUMNS, ids,
+                               self._genres(artist_genre_table, 'artist_id', ids), shows,
+                               ('venue_id', 'venue_name', 'venue_image_link', 'start_time'))
+
+    def rebuild(self):
+        venue_ids = [id for ids in shards.scatter(lambda session: session.scalars(db.select(Venue.id)).all())
+                     for id in ids]
+        artist_ids = db.session.scalars(db.select(Artist.id)).all()
+        db.session.execute(db.delete(PageDocument))
+        self.refresh(venue_ids, artist_ids)
+        db.session.commit()
+        return len(venue_ids), len(artist_ids)
+
+    def _rebuild_command(self):
+        """Rebuild every venue and artist page document."""
+        venues, artists = self.rebuild()
+        print(f'Rebuilt {venues} venue and {artists} artist page documents')
+
+    # Reading
+    def venue_page(self, venue_id):
+        return self._page('venue', venue_id)
+
+    def artist_page(self, artist_id):
+        return self._page('artist', artist_id)
+
+    def _page(self, kind, entity_id):
+        """Template data for a page, or None if there's no such venue/artist."""
+        page = db.session.get(PageDocument, (kind, entity_id))
+        if page is not None:
+            document = page.document
+        else:
+            # Not built yet, or being purged
+            if purging(kind, [entity_id]):
+                return None
+            build = self._venue_documents if kind == 'venue' else self._artist_documents
+            document = build([entity_id]).get(entity_id)
+            if document is None:
+                return None
+            try:
+                db.session.add(PageDocument(kind=kind, entity_id=entity_id, document=document))
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()   # another request stored it first
+
+        data = dict(document)
+        data['past_shows'], data['upcoming_shows'] = [], []
+        now = datetime.now()
+        for show in data.pop('shows'):
+            upcoming = datetime.fromisoformat(show['start_time']) > now
+            data['upcoming_shows' if upcoming else 'past_shows'].append(
+                dict(show, start_time=format_datetime(show['start_time'])))
+        data['past_shows_count'] = len(data['past_shows'])
+        data['upcoming_shows_count'] = len(data['upcoming_shows'])
+        return data
+
+
+read_model = ReadModel()
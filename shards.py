@@ -0,0 +1,359 @@
+#----------------------------------------------------------------------------#
+# Geographic sharding of venues and their shows.
+#----------------------------------------------------------------------------#
+
+# Opt-in: with SHARDS unset there is one database and every method here is the
+# identity (shard_of_venue() is 'default', session('default') is db.session,
+# scatter() calls its function once, inline).
+#
+# With SHARDS = {'east': 'postgresql://...', 'west': ...} each shard is an extra
+# database holding the venues, venue genre links and shows of the states mapped
+# to it by SHARD_STATES = {'NY': 'east', ...}.  Unmapped states stay on the
+# primary ('default').  Artists, genres and everything derived (page documents,
+# the change feed) live on the primary only, so shard tables carry no foreign
+# keys into them and shard rows are joined to artists and genre names in the
+# application (artist_cards(), genre_names()).
+#
+# - Routing: venue_shards on the primary records every venue living on a shard.
+#   A venue-scoped request looks its venue up there (one primary-key read) and
+#   goes straight to that shard.  SHARD_STATES only decides where new venues go.
+# - Ids: venues and shows get ids from the primary (next_id()), so an id means
+#   the same row on every shard and rows can move between shards unchanged.
+# - Cross-shard listings use scatter(): one query per shard, run in parallel,
+#   each result ordered by id so the caller can heapq.merge() them.
+# - Writes to a shard commit before the primary's transaction (which then
+#   refreshes the read model from the committed rows).  The two commits are not
+#   atomic.  On failure, rollback() rolls back the request's shard sessions and
+#   deletes the rows an insert already committed to a shard.  An update can't be
+#   undone that way: it leaves a shard row the read model hasn't seen yet,
+#   repaired by the next write to it or `flask rebuild-read-model`.
+# - `flask shards move STATE SHARD` moves a state's venues, links and shows, one
+#   batch at a time: copy, point the directory at the new shard, delete the
+#   originals.  Then update SHARD_STATES so new venues follow.
+#
+# Show events and the change feed are published for shard shows like any other
+# (pass the shard's session to events.publish_shows() and change_feed.record()).
+# /api/query resolves relations with joins on one database, so it answers 501
+# while sharding is on.
+
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app, g
+from flask.cli import AppGroup
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import Genre, Venue, Artist, Show, VenueShard, venue_genre_table
+
+DEFAULT = 'default'
+
+
+def bind_key(name):
+    return f'shard:{name}'
+
+
+def shard_metadata():
+    """Tables of a shard: venues, venue genre links and shows, minus foreign keys into the primary."""
+    metadata = db.MetaData()
+    for table in (Venue.__table__, venue_genre_table, Show.__table__):
+        table.to_metadata(metadata)
+    for table in metadata.tables.values():
+        for foreign_key in list(table.foreign_keys):
+            if foreign_key.target_fullname.split('.')[0] not in metadata.tables:
+                table.foreign_keys.discard(foreign_key)
+                foreign_key.parent.foreign_keys.discard(foreign_key)
+                table.constraints.discard(foreign_key.constraint)
+    return metadata
+
+
+class ShardRouter:
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._id_lock = threading.Lock()
+        self._last_ids = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Must run before db.init_app(), which creates an engine per entry in SQLALCHEMY_BINDS
+        app.config.setdefault('SHARDS', {})            # name -> database URI
+        app.config.setdefault('SHARD_STATES', {})      # state -> shard name
+        app.config.setdefault('SHARD_WORKERS', 8)
+        app.config.setdefault('SHARD_MOVE_BATCH_SIZE', 200)
+        shards = app.config['SHARDS']
+        if DEFAULT in shards:
+            raise RuntimeError(f'"{DEFAULT}" is the primary database, pick another shard name.')
+        unknown = set(app.config['SHARD_STATES'].values()) - set(shards) - {DEFAULT}
+        if unknown:
+            raise RuntimeError(f'SHARD_STATES maps to unknown shards: {sorted(unknown)}')
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.update((bind_key(name), uri) for name, uri in shards.items())
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+        self.enabled = bool(shards)
+        self.names = [DEFAULT, *shards]
+        self.states = {state.upper(): name for state, name in app.config['SHARD_STATES'].items()}
+        self.workers = app.config['SHARD_WORKERS']
+        app.teardown_appcontext(self._close_sessions)
+        app.cli.add_command(shards_cli)
+        app.extensions['shards'] = self
+
+    # Routing
+    def shard_for_state(self, state):
+        """Where a new venue in this state goes."""
+        return self.states.get((state or '').upper(), DEFAULT)
+
+    def shard_of_venue(self, venue_id):
+        if not self.enabled:
+            return DEFAULT
+        return db.session.scalar(db.select(VenueShard.shard).where(VenueShard.venue_id == int(venue_id))) \
+            or DEFAULT
+
+    def locate_venues(self, venue_ids):
+        """{shard: [venue ids]} for these venues."""
+        venue_ids = sorted({int(id) for id in venue_ids})
+        if not self.enabled or not venue_ids:
+            return {DEFAULT: venue_ids} if venue_ids else {}
+        located = dict(db.session.execute(db.select(VenueShard.venue_id, VenueShard.shard)
+                                          .where(VenueShard.venue_id.in_(venue_ids))).all())
+        grouped = {}
+        for id in venue_ids:
+            grouped.setdefault(located.get(id, DEFAULT), []).append(id)
+        return grouped
+
+    def session(self, name):
+        """The request's session on a shard; db.session for the primary."""
+        if name == DEFAULT:
+            return db.session
+        sessions = g.setdefault('shard_sessions', {})
+        if name not in sessions:
+            sessions[name] = Session(db.engines[bind_key(name)])
+        return sessions[name]
+
+    def venue_session(self, venue_id):
+        return self.session(self.shard_of_venue(venue_id))
+
+    def _close_sessions(self, exc):
+        for session in g.pop('shard_sessions', {}).values():
+            session.close()
+
+    def next_id(self, model):
+        """An id for a new venue or show that is free on every shard, or None when unsharded."""
+        return self.next_ids(model, 1)[0]
+
+    def next_ids(self, model, count):
+        """count ids for new venues or shows, free on every shard; all None when unsharded."""
+        if not self.enabled:
+            return [None] * count
+        if not count:
+            return []
+        if db.session.get_bind().dialect.name == 'postgresql':
+            # Every shard draws from the primary's sequence
+            return list(db.session.scalars(
+                db.text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+                {'table': model.__tablename__, 'count': count}))
+        # SQLite (development and tests): past the highest id anywhere.  Only
+        # safe within one process, which is all a SQLite setup runs.
+        with self._id_lock:
+            highest = max(self.scatter(lambda session: session.scalar(db.select(db.func.max(model.id))) or 0))
+            first = max(highest, self._last_ids.get(model, 0)) + 1
+            self._last_ids[model] = first + count - 1
+            return list(range(first, first + count))
+
+    def rollback(self, committed=()):
+        """Roll back the request's shard sessions after a failed write.
+
+        committed lists (shard, model, ids) for rows the write had already
+        committed to a shard; they are deleted again (cascading to their links
+        and shows), so a failed insert leaves nothing behind.
+        """
+        for session in g.get('shard_sessions', {}).values():
+            session.rollback()
+        for shard, model, ids in committed:
+            if shard == DEFAULT or not ids:
+                continue
+            session = self.session(shard)
+            session.execute(db.delete(model).where(model.id.in_(list(ids))))
+            session.commit()
+
+    # Scatter-gather
+    def scatter(self, fn, names=None):
+        """[fn(session) for every shard], the shards queried in parallel.
+
+        The primary runs inline on db.session, so it sees the caller's uncommitted
+        writes.  Other shards get a fresh session in a worker thread and only see
+        committed rows; the thread has its own app context, so fn can still look
+        things up on the primary through db.session.
+        """
+        names = list(names or self.names)
+        if names == [DEFAULT]:
+            return [fn(db.session)]
+        app = current_app._get_current_object()
+        engines = {name: db.engines[bind_key(name)] for name in names if name != DEFAULT}
+
+        def run(name):
+            with app.app_context(), Session(engines[name]) as session:
+                return fn(session)
+
+        futures = {name: self._pool().submit(run, name) for name in engines}
+        results = {DEFAULT: fn(db.session)} if DEFAULT in names else {}
+        results.update((name, future.result()) for name, future in futures.items())
+        return [results[name] for name in names]
+
+    def merge(self, fn, key, names=None):
+        """scatter(fn), with each shard's sorted results merged into one sorted list."""
+        return list(heapq.merge(*self.scatter(fn, names), key=key))
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Created on first use, so a preloaded master never forks with a live thread
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shards')
+        return self._executor
+
+    # Rebalancing
+    def move_state(self, state, target):
+        """Move every venue in state (with its links and shows) to target.  Returns the number moved."""
+        sources = [name for name in self.names if name != target]
+        found = self.scatter(lambda session: session.scalars(
+            db.select(Venue.id).where(db.func.upper(Venue.state) == state.upper())).all(), sources)
+        return sum(self.move_venues(ids, target, source) for source, ids in zip(sources, found))
+
+    def move_venues(self, venue_ids, target, source=None):
+        """Move venues from their shard to target, a batch per transaction."""
+        batch_size = current_app.config['SHARD_MOVE_BATCH_SIZE']
+        groups = {source: list(venue_ids)} if source else self.locate_venues(venue_ids)
+        moved = 0
+        for source, ids in groups.items():
+            if source == target:
+                continue
+            for start in range(0, len(ids), batch_size):
+                moved += self._move_batch(ids[start:start + batch_size], source, target)
+        return moved
+
+    def _move_batch(self, ids, source, target):
+        from_session, to_session = self.session(source), self.session(target)
+        try:
+            locked = db.select(Venue.__table__).where(Venue.id.in_(ids)).order_by(Venue.id)
+            if from_session.get_bind().dialect.name == 'postgresql':
+                # Blocks new shows for these venues until the originals are gone
+                locked = locked.with_for_update()
+            venues = [dict(row) for row in from_session.execute(locked).mappings()]
+            if not venues:
+                return 0
+            links = [dict(row) for row in from_session.execute(
+                db.select(venue_genre_table).where(venue_genre_table.c.venue_id.in_(ids))).mappings()]
+            shows = [dict(row) for row in from_session.execute(
+                db.select(Show.__table__).where(Show.venue_id.in_(ids))).mappings()]
+
+            to_session.execute(db.insert(Venue.__table__), venues)
+            if links:
+                to_session.execute(db.insert(venue_genre_table), links)
+            if shows:
+                to_session.execute(db.insert(Show.__table__), shows)
+            if to_session is not db.session:
+                to_session.commit()
+
+            db.session.execute(db.delete(VenueShard).where(VenueShard.venue_id.in_(ids)))
+            if target != DEFAULT:
+                db.session.execute(db.insert(VenueShard), [{'venue_id': venue['id'], 'shard': target}
+                                                           for venue in venues])
+            # The database cascades to shows and genre links.  Moving off the
+            # primary, that happens in the same transaction as the directory update.
+            from_session.execute(db.delete(Venue).where(Venue.id.in_(ids)))
+            db.session.commit()
+            if from_session is not db.session:
+                from_session.commit()
+            return len(venues)
+        except Exception:
+            from_session.rollback()
+            to_session.rollback()
+            db.session.rollback()
+            raise
+
+    def counts(self):
+        """{shard: {state: number of venues}}"""
+        rows = self.scatter(lambda session: session.execute(
+            db.select(Venue.state, db.func.count(Venue.id)).group_by(Venue.state).order_by(Venue.state)).all())
+        return {name: dict(result) for name, result in zip(self.names, rows)}
+
+
+shards = ShardRouter()
+
+
+#----------------------------------------------------------------------------#
+# Application-side joins to the primary.
+#----------------------------------------------------------------------------#
+
+def artist_cards(artist_ids):
+    """{artist id: (name, image_link)}"""
+    artist_ids = set(artist_ids)
+    if not artist_ids:
+        return {}
+    rows = db.session.execute(db.select(Artist.id, Artist.name, Artist.image_link)
+                              .where(Artist.id.in_(artist_ids)))
+    return {id: (name, image_link) for id, name, image_link in rows}
+
+
+def genre_names(session, venue_ids=None):
+    """{venue id: sorted genre names} for venues stored in session's database (all of them by default)."""
+    owner = venue_genre_table.c.venue_id
+    grouped = {}
+    if session is db.session:
+        query = db.select(owner, Genre.name).join(Genre, Genre.id == venue_genre_table.c.genre_id)
+        if venue_ids is not None:
+            query = query.where(owner.in_(venue_ids))
+        rows = db.session.execute(query.order_by(owner, Genre.name))
+    else:
+        query = db.select(owner, venue_genre_table.c.genre_id)
+        if venue_ids is not None:
+            query = query.where(owner.in_(venue_ids))
+        links = session.execute(query).all()
+        names = dict(db.session.execute(db.select(Genre.id, Genre.name)
+                                        .where(Genre.id.in_({genre_id for _, genre_id in links}))).all())
+        rows = sorted((venue_id, names[genre_id]) for venue_id, genre_id in links if genre_id in names)
+    for venue_id, name in rows:
+        grouped.setdefault(venue_id, []).append(name)
+    return grouped
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+shards_cli = AppGroup('shards', help='Manage venue shards.')
+
+
+@shards_cli.command('init')
+def init_command():
+    """Create the shard tables in every configured shard."""
+    metadata = shard_metadata()
+    for name in shards.names[1:]:
+        metadata.create_all(db.engines[bind_key(name)])
+        print(f'Initialized shard {name}')
+
+
+@shards_cli.command('status')
+def status_command():
+    """Venues per shard and state."""
+    for name, states in shards.counts().items():
+        total = sum(states.values())
+        print(f'{name}: {total} venues' + (' (' + ', '.join(f'{state} {count}' for state, count in states.items())
+                                           + ')' if states else ''))
+
+
+@shards_cli.command('move')
+@click.argument('state')
+@click.argument('shard')
+def move_command(state, shard):
+    """Move a state's venues and shows to SHARD."""
+    if shard not in shards.names:
+        raise click.BadParameter(f'unknown shard, expected one of {shards.names}', param_hint='SHARD')
+    moved = shards.move_state(state, shard)
+    print(f'Moved {moved} {state.upper()} venues to {shard}.  Set SHARD_STATES["{state.upper()}"] = "{shard}" '
+          f'so new venues follow.')
@@ -0,0 +1,157 @@
+#----------------------------------------------------------------------------#
+# Cross-worker result cache in a local SQLite database.
+#----------------------------------------------------------------------------#
+
+# Every gunicorn worker opens the same cache file (SHARED_CACHE_PATH, in WAL mode
+# so readers never block on the writer), so a value computed by one worker is
+# warm for all of them.  Values are stored as JSON with an expiry time.  When
+# the file grows past SHARED_CACHE_MAX_BYTES, expired rows are dropped first,
+# then the least recently read ones.
+#
+# Keys can be versioned by namespace: key('venue', 12) gives 'venue@3:12', where
+# 3 is the namespace's current version in the versions table.  bump('venue')
+# moves every worker to a new version in one write, so every cached venue entry
+# is invalidated at once.  The old rows are never read again and age out through
+# eviction.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_entries_accessed_at ON entries (accessed_at);
+CREATE TABLE IF NOT EXISTS versions (
+    namespace TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+# Reads only write accessed_at back when it's older than this, so a hot key
+# doesn't take the write lock on every hit
+_TOUCH_INTERVAL = 60
+
+
+class SharedCache:
+
+    def __init__(self, app=None):
+        self._local = threading.local()
+        self._writes = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SHARED_CACHE_PATH', os.path.join(app.instance_path, 'cache.sqlite3'))
+        app.config.setdefault('SHARED_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+        app.config.setdefault('SHARED_CACHE_DEFAULT_TTL', 300)
+        app.config.setdefault('SHARED_CACHE_EVICT_EVERY', 100)
+        self.path = app.config['SHARED_CACHE_PATH']
+        self.max_bytes = app.config['SHARED_CACHE_MAX_BYTES']
+        self.default_ttl = app.config['SHARED_CACHE_DEFAULT_TTL']
+        self.evict_every = app.config['SHARED_CACHE_EVICT_EVERY']
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        conn.close()
+        app.cli.command('clear-cache')(self._clear_command)
+        app.extensions['shared_cache'] = self
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @property
+    def _conn(self):
+        # One connection per thread, reopened in a forked child
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = self._connect()
+            local.pid = os.getpid()
+        return local.conn
+
+    # Versioned keys
+    def version(self, namespace):
+        row = self._conn.execute('SELECT version FROM versions WHERE namespace = ?', (namespace,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, namespace):
+        """Invalidate every key(namespace, ...) in all workers."""
+        self._conn.execute('INSERT INTO versions (namespace, version) VALUES (?, 1) '
+                           'ON CONFLICT (namespace) DO UPDATE SET version = version + 1', (namespace,))
+
+    def key(self, namespace, *parts):
+        return f'{namespace}@{self.version(namespace)}:' + ':'.join(str(part) for part in parts)
+
+    # Entries
+    def get(self, key, default=None):
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def get_entry(self, key):
+        """(value, stored_at) for a live key, or None."""
+        row = self._lookup(key, 'stored_at, value')
+        return None if row is None else (json.loads(row[1]), row[0])
+
+    def stored_at(self, key):
+        """When a live key was stored, or None.
+
+        Lets a caller holding a decoded copy check it is still current without
+        fetching and decoding the value again.
+        """
+        row = self._lookup(key, 'stored_at')
+        return None if row is None else row[0]
+
+    def _lookup(self, key, columns):
+        now = time.time()
+        row = self._conn.execute(f'SELECT accessed_at, {columns} FROM entries WHERE key = ? AND expires_at > ?',
+                                 (key, now)).fetchone()
+        if row is None:
+            return None
+        if now - row[0] > _TOUCH_INTERVAL:
+            self._conn.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+        return row[1:]
+
+    def set(self, key, value, ttl=None, stored_at=None):
+        now = time.time()
+        data = json.dumps(value, separators=(',', ':'))
+        self._conn.execute(
+            'INSERT OR REPLACE INTO entries (key, value, size, stored_at, expires_at, accessed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (key, data, len(data), stored_at or now, now + (ttl or self.default_ttl), now))
+        self._writes += 1
+        if self._writes % self.evict_every == 0:
+            self.evict()
+
+    def delete(self, *keys):
+        self._conn.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key in keys])
+
+    def evict(self):
+        """Drop expired entries, then least recently read ones until under SHARED_CACHE_MAX_BYTES."""
+        conn = self._conn
+        conn.execute('DELETE FROM entries WHERE expires_at <= ?', (time.time(),))
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        while total > self.max_bytes:
+            rows = conn.execute('SELECT key, size FROM entries ORDER BY accessed_at LIMIT 100').fetchall()
+            if not rows:
+                break
+            conn.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key, _ in rows])
+            total -= sum(size for _, size in rows)
+
+    def clear(self):
+        self._conn.execute('DELETE FROM entries')
+
+    def _clear_command(self):
+        """Empty the shared result cache."""
+        self.clear()
+        print(f'Cleared {self.path}')
@@ -0,0 +1,127 @@
+#----------------------------------------------------------------------------#
+# MinHash / LSH similarity index over genre sets.
+#----------------------------------------------------------------------------#
+
+# Artists and venues only carry a handful of genres each, so the exact Jaccard
+# similarity between two of them is cheap.  What doesn't scale is comparing one
+# artist against *every* other artist on each page view.  Instead we keep a
+# MinHash signature per item and bucket the signatures into LSH bands: items that
+# share any band bucket become candidates, and only those candidates get the
+# exact Jaccard comparison.
+
+import hashlib
+import heapq
+import random
+import threading
+
+# Mersenne prime used for the universal hash family h(x) = (a*x + b) mod p
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _token_hash(token):
+    # Stable across processes (unlike hash()), so every worker builds the same buckets
+    digest = hashlib.blake2b(token.strip().lower().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHashLSH:
+    """Incrementally maintained MinHash signatures plus an LSH banding index.
+
+    num_perm must be divisible by bands.  With 32 permutations in 16 bands of
+    2 rows, two genre sets sharing a single genre out of three already have a
+    good chance of colliding in at least one band, which is what we want for a
+    "similar" panel over such small sets.
+    """
+
+    def __init__(self, num_perm=32, bands=16, seed=1):
+        if num_perm % bands:
+            raise ValueError('num_perm must be divisible by bands')
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = random.Random(seed)
+        self._coefficients = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME))
+                              for _ in range(num_perm)]
+
+        self._lock = threading.RLock()
+        self._sets = {}         # item id -> frozenset of genre names
+        self._signatures = {}   # item id -> tuple of num_perm minhashes
+        self._buckets = {}      # (band, band signature) -> set of item ids
+        self.loaded = False
+
+    def signature(self, genres):
+        hashes = [_token_hash(g) for g in genres]
+        if not hashes:
+            return (_MAX_HASH,) * self.num_perm
+        return tuple(min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes)
+                     for a, b in self._coefficients)
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [(band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def _normalize(self, genres):
+        return frozenset(g.strip().lower() for g in genres if g and g.strip())
+
+    def update(self, item_id, genres):
+        """Insert or replace the genre set of one item."""
+        genres = self._normalize(genres)
+        with self._lock:
+            self._remove(item_id)
+            signature = self.signature(genres)
+            self._sets[item_id] = genres
+            self._signatures[item_id] = signature
+            for key in self._band_keys(signature):
+                self._buckets.setdefault(key, set()).add(item_id)
+
+    def remove(self, item_id):
+        with self._lock:
+            self._remove(item_id)
+
+    def _remove(self, item_id):
+        signature = self._signatures.pop(item_id, None)
+        self._sets.pop(item_id, None)
+        if signature is None:
+            return
+        for key in self._band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(item_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def load(self, rows):
+        """Bulk (re)build the index from (item id, genre name) rows."""
+        grouped = {}
+        for item_id, genre in rows:
+            grouped.setdefault(item_id, []).append(genre)
+        with self._lock:
+            self._sets.clear()
+            self._signatures.clear()
+            self._buckets.clear()
+            for item_id, genres in grouped.items():
+                self.update(item_id, genres)
+            self.loaded = True
+
+    def similar(self, item_id, k=5, min_score=0.0):
+        """Top-k (item id, jaccard) pairs that share at least one LSH bucket with item_id."""
+        with self._lock:
+            genres = self._sets.get(item_id)
+            signature = self._signatures.get(item_id)
+            if not genres or signature is None:
+                return []
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates |= self._buckets.get(key, ())
+            candidates.discard(item_id)
+            scored = ((jaccard(genres, self._sets[c]), c) for c in candidates)
+            best = heapq.nlargest(k, (s for s in scored if s[0] > min_score),
+                                  key=lambda s: (s[0], -s[1]))
+        return [(c, score) for score, c in best]
@@ -1,4 +1,41 @@
 window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
-};
\ No newline at end of file
+};
+
+// Name suggestions for inputs marked data-autocomplete="venue|artist", via a <datalist>.
+// With data-autocomplete-value="id" the suggestion fills in the id and shows the name.
+document.addEventListener('DOMContentLoaded', function () {
+  var inputs = document.querySelectorAll('input[data-autocomplete]');
+  Array.prototype.forEach.call(inputs, function (input) {
+    var kind = input.getAttribute('data-autocomplete');
+    var useId = input.getAttribute('data-autocomplete-value') === 'id';
+    var list = document.createElement('datalist');
+    list.id = (input.id || input.name) + '-' + kind + '-suggestions';
+    input.parentNode.appendChild(list);
+    input.setAttribute('list', list.id);
+    input.setAttribute('autocomplete', 'off');
+
+    var timer = null, last = '';
+    input.addEventListener('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var q = input.value.trim();
+        if (!q || q === last || (useId && /^\d+$/.test(q))) return;
+        last = q;
+        fetch('/autocomplete?type=' + kind + '&q=' + encodeURIComponent(q))
+          .then(function (response) { return response.json(); })
+          .then(function (data) {
+            if (input.value.trim() !== q) return;
+            list.innerHTML = '';
+            data.results.forEach(function (item) {
+              var option = document.createElement('option');
+              option.value = useId ? item.id : item.name;
+              if (useId) option.label = item.name;
+              list.appendChild(option);
+            });
+          });
+      }, 100);
+    });
+  });
+});
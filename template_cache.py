@@ -0,0 +1,69 @@
+#----------------------------------------------------------------------------#
+# Jinja bytecode cache, precompilation and boot-time warm-up.
+#----------------------------------------------------------------------------#
+
+# Compiling layouts/main.html and the pages/forms templates is the bulk of a
+# worker's first-request latency.  Compiled templates are persisted in a
+# FileSystemBytecodeCache shared by every worker on the box (entries are keyed by
+# template name and source checksum, so an edited template simply misses).
+# `flask precompile-templates` fills that cache ahead of a deploy, and with
+# TEMPLATE_WARMUP set, create_app() renders each page once before the worker
+# takes traffic.  When the app is preloaded in the gunicorn master, the warm
+# in-memory template cache is inherited by every forked worker.
+
+import os
+
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache
+
+
+class TemplateCache:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JINJA_BYTECODE_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+        app.config.setdefault('TEMPLATE_WARMUP', False)
+
+        directory = app.config['JINJA_BYTECODE_CACHE_DIR']
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory, '%s.jinja2.cache')
+
+        app.cli.command('precompile-templates')(self._precompile_command)
+        app.extensions['template_cache'] = self
+
+    def template_names(self, app):
+        return sorted(app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html')))
+
+    def precompile(self, app):
+        """Compile every template, which also writes it to the bytecode cache."""
+        names = self.template_names(app)
+        for name in names:
+            app.jinja_env.get_template(name)
+        return names
+
+    def warm_up(self, app):
+        """Compile and render each template once with an empty context.
+
+        Detail and form pages can't fully render without their data, so a render
+        error is expected there and ignored: by the time it's raised the template
+        (and everything it extends) has been compiled and cached, which is the
+        expensive part.
+        """
+        rendered = 0
+        with app.test_request_context('/'):
+            for name in self.precompile(app):
+                try:
+                    app.jinja_env.get_template(name).render()
+                    rendered += 1
+                except Exception:
+                    pass
+        app.logger.info(f'Template warm-up: {rendered} rendered, all compiled.')
+
+    def _precompile_command(self):
+        """Compile all templates into the Jinja bytecode cache."""
+        names = self.precompile(current_app)
+        print(f"Precompiled {len(names)} templates into {current_app.config['JINJA_BYTECODE_CACHE_DIR']}")
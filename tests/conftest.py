@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import indexes  # noqa: E402
+from app import create_app  # noqa: E402
+from catalog import catalog  # noqa: E402
+from extensions import db  # noqa: E402
+from purge import purger  # noqa: E402
+
+
+def make_app(tmp_path, **overrides):
+    """An app on a SQLite database in tmp_path, with the tables created."""
+    settings = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+    settings.update(
+        TESTING=True,
+        DEBUG=True,     # keeps create_app() from logging to error.log
+        SECRET_KEY='test',
+        WTF_CSRF_ENABLED=False,
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "primary.db"}',
+        SQLALCHEMY_ENGINE_OPTIONS={},
+        SHARED_CACHE_PATH=str(tmp_path / 'shared_cache.db'),
+    )
+    settings.update(overrides)
+    app = create_app(type('TestConfig', (), settings))
+    # In-process state that would otherwise carry over from the previous test's database
+    catalog.seq = None
+    indexes._feed['seq'] = None
+    purger._resumed_at = None
+    with app.app_context():
+        db.create_all(bind_key=None)     # the primary; shard tests create their own
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path)
+    with app.app_context():
+        yield app
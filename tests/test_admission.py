@@ -0,0 +1,28 @@
+from conftest import make_app
+
+
+def search_venues(client, addr, **kwargs):
+    return client.post('/venues/search', data={'search_term': 'x'}, environ_base={'REMOTE_ADDR': addr}, **kwargs)
+
+
+def test_clients_behind_a_trusted_proxy_get_their_own_buckets(tmp_path):
+    app = make_app(tmp_path, TRUSTED_PROXIES=1, RATE_LIMITS={'search': (0.001, 1)})
+    client = app.test_client()
+
+    first = search_venues(client, '10.0.0.1', headers={'X-Forwarded-For': '203.0.113.1'})
+    second = search_venues(client, '10.0.0.1', headers={'X-Forwarded-For': '203.0.113.2'})
+    again = search_venues(client, '10.0.0.1', headers={'X-Forwarded-For': '203.0.113.1'})
+
+    assert (first.status_code, second.status_code, again.status_code) == (200, 200, 429)
+
+
+def test_new_clients_evict_only_the_idlest_buckets(tmp_path):
+    app = make_app(tmp_path, RATE_LIMITS={'search': (0.001, 1)}, ADMISSION_MAX_CLIENTS=2)
+    client = app.test_client()
+
+    assert search_venues(client, '198.51.100.1').status_code == 200
+    assert search_venues(client, '198.51.100.2').status_code == 200
+    assert search_venues(client, '198.51.100.1').status_code == 429    # 1 is now the most recently used
+    assert search_venues(client, '198.51.100.3').status_code == 200    # evicts 2, not everyone
+
+    assert search_venues(client, '198.51.100.1').status_code == 429
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from analytics import analytics, genre_mix, occupancy
+from catalog import catalog
+from extensions import db
+from models import Genre, Venue, Artist, Show
+
+
+def add_show(venue_id, artist_id, start_time):
+    db.session.add(Show(venue_id=venue_id, artist_id=artist_id, start_time=start_time))
+
+
+def test_frame_matches_artists_whose_name_order_differs_from_id_order(app):
+    jazz = Genre(name='Jazz')
+    db.session.add_all([Artist(id=1, name='Zed', genres=[jazz]), Artist(id=2, name='Aardvark'),
+                        Venue(id=1, name='The Hall', city='Austin', state='TX')])
+    for day in (1, 2, 3):
+        add_show(1, 1, datetime(2020, 1, day, 20))
+    db.session.commit()
+    catalog.load()
+
+    frame = analytics.frame()
+
+    assert [frame.artists[i].name for i in frame.artist] == ['Zed'] * 3
+    mix = genre_mix(frame)
+    assert list(mix['genre']) == ['Jazz'] and list(mix['shows']) == [3]
+
+
+def test_occupancy_counts_venues_from_their_first_show(app):
+    db.session.add_all([Artist(id=1, name='Band'),
+                        Venue(id=1, name='Old', city='Austin', state='TX'),
+                        Venue(id=2, name='New', city='Austin', state='TX')])
+    add_show(1, 1, datetime(2020, 1, 10, 20))
+    add_show(2, 1, datetime(2020, 3, 10, 20))
+    db.session.commit()
+    catalog.load()
+
+    report = occupancy(analytics.frame())
+
+    assert list(report['month']) == ['2020-01', '2020-03']
+    assert list(report['venues']) == [1, 2]
+    assert list(report['venue_days']) == [31, 62]
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from extensions import db
+from models import Venue, Artist, PendingPurge
+
+from conftest import make_app
+
+RECORD = [{'venue_id': 1, 'artist_id': 1, 'start_time': '2030-01-01T20:00:00'}]
+
+
+def test_batch_writes_need_the_admin_token(tmp_path):
+    client = make_app(tmp_path, ADMIN_TOKEN='secret').test_client()
+
+    assert client.post('/api/shows/batch', json=RECORD).status_code == 403
+    assert client.post('/api/venues/batch', json=[], headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    response = client.post('/api/shows/batch', json=RECORD, headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200 and response.json['failed'] == 1
+
+
+def test_batch_writes_are_off_without_an_admin_token(tmp_path):
+    client = make_app(tmp_path).test_client()
+
+    assert client.post('/api/artists/batch', json=[]).status_code == 404
+
+
+def test_batch_shows_refuse_venues_and_artists_being_purged(tmp_path):
+    app = make_app(tmp_path, ADMIN_TOKEN='secret')
+    with app.app_context():
+        venue = Venue(name='Blue Note', city='New York', state='NY', address='131 W 3rd St', phone='2124754592')
+        artist = Artist(name='Miles', city='New York', state='NY', phone='2125550100')
+        db.session.add_all([venue, artist])
+        db.session.flush()
+        db.session.add(PendingPurge(kind='venue', entity_id=venue.id, requested_at=datetime.utcnow(),
+                                    claimed_at=datetime.utcnow()))     # another process is purging it
+        db.session.commit()
+        record = {'venue_id': venue.id, 'artist_id': artist.id, 'start_time': '2030-01-01T20:00:00'}
+
+    response = app.test_client().post('/api/shows/batch', json=[record], headers={'Authorization': 'Bearer secret'})
+    assert response.json['failed'] == 1
+    assert response.json['results'][0]['errors'] == {'venue_id': ['Venue is being deleted.']}
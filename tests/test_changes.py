@@ -0,0 +1,16 @@
+from changes import change_feed
+from extensions import db
+from models import Artist
+
+
+def test_changes_pages_always_advance(app):
+    for name in ('Miles', 'Coltrane'):
+        artist = Artist(name=name, city='New York', state='NY', phone='2125550100')
+        db.session.add(artist)
+        db.session.flush()
+        change_feed.record('artist', 'insert', [artist.id])
+    db.session.commit()
+
+    response = app.test_client().get('/changes?since=0&limit=-1')
+    assert len(response.json['changes']) == 1 and response.json['more'] is True
+    assert response.json['next'] > 0
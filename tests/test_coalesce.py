@@ -0,0 +1,34 @@
+import threading
+import time
+
+import pytest
+
+from coalesce import _FileLock
+from extensions import coalescer
+
+
+def test_stale_hits_queue_one_refresh(app):
+    release, calls = threading.Event(), []
+
+    def builder():
+        calls.append(1)
+        release.wait(5)
+        return ['built']
+
+    for _ in range(5):
+        coalescer._refresh('shows', builder)
+    flight = coalescer._flights['shows']
+    release.set()
+    assert flight.result(timeout=5) == ['built']
+    assert len(calls) == 1
+
+
+def test_file_lock_gives_up_after_the_wait(tmp_path):
+    fcntl = pytest.importorskip('fcntl')
+    path = str(tmp_path / 'key.lock')
+    with open(path, 'a') as holder:
+        fcntl.flock(holder, fcntl.LOCK_EX)     # a hung builder in another worker
+        started = time.monotonic()
+        with _FileLock(path, 0.2):
+            waited = time.monotonic() - started
+    assert 0.2 <= waited < 2
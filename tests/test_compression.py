@@ -0,0 +1,50 @@
+import gzip
+
+import pytest
+from flask import Flask, Response
+
+from compression import Compress
+
+PAGE = '<p>' + 'fyyur ' * 500 + '</p>'
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    Compress(app)
+    app.add_url_rule('/page', 'page', lambda: PAGE)
+    app.add_url_rule('/small', 'small', lambda: '<p>hi</p>')
+    app.add_url_rule('/stream', 'stream', lambda: Response((PAGE for _ in range(3)), mimetype='text/html'))
+    return app.test_client()
+
+
+def test_gzip_when_accepted(client):
+    response = client.get('/page', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data).decode() == PAGE
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+    etag = response.headers['ETag']
+    assert etag.endswith('-gzip"')
+    again = client.get('/page', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert again.status_code == 304
+
+
+@pytest.mark.parametrize('accept', ['gzip;q=0', 'identity', '', 'gzip;q=0, identity'])
+def test_identity_when_nothing_acceptable(client, accept):
+    response = client.get('/page', headers={'Accept-Encoding': accept})
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_data(as_text=True) == PAGE
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+
+def test_small_bodies_go_out_untouched(client):
+    response = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_streamed_responses_are_compressed_as_they_go(client):
+    response = client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert gzip.decompress(response.data).decode() == PAGE * 3
@@ -0,0 +1,16 @@
+from conftest import make_app
+
+
+def test_streams_past_the_cap_get_503_until_one_closes(tmp_path):
+    app = make_app(tmp_path, EVENTS_MAX_STREAMS=1)
+    client = app.test_client()
+
+    first = client.get('/venues/1/events')
+    refused = client.get('/venues/2/events')
+    first.close()
+    after_close = client.get('/venues/2/events')
+    after_close.close()
+
+    assert first.status_code == 200 and first.mimetype == 'text/event-stream'
+    assert refused.status_code == 503 and refused.headers['Retry-After']
+    assert after_close.status_code == 200
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import pytest
+
+from extensions import db
+from graph import Query, QueryError
+from models import Venue, Artist, Show
+
+
+def seed(shows=3):
+    venue = Venue(name='Blue Note', city='New York', state='NY', address='131 W 3rd St', phone='2124754592')
+    artist = Artist(name='Miles', city='New York', state='NY', phone='2125550100')
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    db.session.add_all([Show(venue_id=venue.id, artist_id=artist.id, start_time=datetime(2030, 1, 1, day % 24))
+                        for day in range(shows)])
+    db.session.commit()
+    return venue.id
+
+
+def test_limit_is_at_least_one(app):
+    seed()
+    response = app.test_client().post('/api/query', json={'shows': {'limit': -1, 'select': ['id']}})
+    assert response.status_code == 200 and len(response.json['data']['shows']) == 1
+
+
+def test_filters_and_ids_must_be_scalars(app):
+    seed()
+    client = app.test_client()
+    for document in ({'shows': {'where': {'venue_id': [1, 2]}, 'select': ['id']}},
+                     {'shows': {'where': [1], 'select': ['id']}},
+                     {'venues': {'ids': [{'a': 1}], 'select': ['name']}},
+                     {'venues': {'ids': [True], 'select': ['name']}}):
+        response = client.post('/api/query', json=document)
+        assert response.status_code == 400 and 'error' in response.json
+
+
+def test_relation_loads_stop_at_the_row_budget(app):
+    seed(shows=30)
+    q = Query(max_rows=10)
+    with pytest.raises(QueryError):
+        q.run({'venues': {'select': ['name', {'shows': ['id']}]}})
+    assert q.rows == 11     # the venue and one show past the budget, rather than all 30
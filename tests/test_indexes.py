@@ -0,0 +1,38 @@
+from changes import change_feed
+from extensions import db
+from indexes import autocomplete, nearby_venues
+from models import Venue
+
+from conftest import make_app
+
+
+def write_venue(**columns):
+    # As another worker would: the row and its change feed entry, nothing else
+    venue = Venue(**columns)
+    db.session.add(venue)
+    db.session.flush()
+    change_feed.record('venue', 'insert', [venue.id])
+    db.session.commit()
+    return venue.id
+
+
+def delete_venue(venue_id):
+    db.session.execute(db.delete(Venue).where(Venue.id == venue_id))
+    change_feed.record('venue', 'delete', [venue_id])
+    db.session.commit()
+
+
+def test_indexes_follow_writes_made_elsewhere(tmp_path):
+    app = make_app(tmp_path, INDEXES_POLL_SECONDS=0)
+    with app.app_context():
+        write_venue(name='Blue Note', city='New York', state='NY', latitude=40.73, longitude=-74.0)
+        assert [r['name'] for r in autocomplete('blu', 'venue')] == ['Blue Note']
+        assert [r['name'] for r in nearby_venues(40.73, -74.0, radius_miles=5)] == ['Blue Note']
+
+        venue_id = write_venue(name='Blue Moon', city='New York', state='NY', latitude=40.74, longitude=-74.0)
+        assert {r['name'] for r in autocomplete('blu', 'venue')} == {'Blue Note', 'Blue Moon'}
+        assert {r['name'] for r in nearby_venues(40.73, -74.0, radius_miles=5)} == {'Blue Note', 'Blue Moon'}
+
+        delete_venue(venue_id)
+        assert [r['name'] for r in autocomplete('blu', 'venue')] == ['Blue Note']
+        assert [r['name'] for r in nearby_venues(40.73, -74.0, radius_miles=5)] == ['Blue Note']
@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import event
+
+from extensions import db
+from models import Genre, Venue, venue_genre_table, assign_changed, sync_genres
+
+
+@pytest.fixture
+def issued(app):
+    """Leading keyword of every statement issued on the primary from here on."""
+    issued = []
+
+    def record(conn, cursor, statement, *args):
+        issued.append(statement.split()[0].upper())
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield issued
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def add_venue(genres=()):
+    venue = Venue(name='Blue Note', city='New York', state='NY', address='131 W 3rd St', phone='2124754592')
+    db.session.add(venue)
+    db.session.flush()
+    sync_genres(venue_genre_table, 'venue_id', venue.id, genres)
+    db.session.commit()
+    return venue
+
+
+def linked(venue_id):
+    return set(db.session.scalars(db.select(Genre.name).join(venue_genre_table)
+                                  .where(venue_genre_table.c.venue_id == venue_id)))
+
+
+def test_unchanged_edit_writes_nothing(app, issued):
+    venue = add_venue(['Jazz'])
+    issued.clear()
+    assert assign_changed(venue, name='Blue Note', city='New York', phone='2124754592') == []
+    assert sync_genres(venue_genre_table, 'venue_id', venue.id, ['Jazz']) is False
+    db.session.commit()
+    assert not {'UPDATE', 'INSERT', 'DELETE'} & set(issued)
+
+
+def test_changed_edit_updates_only_changed_columns(app):
+    venue = add_venue()
+    assert assign_changed(venue, name='Blue Note', city='Boston') == ['city']
+    assert db.session.is_modified(venue)
+
+
+def test_genre_sync_writes_only_the_difference(app, issued):
+    venue = add_venue(['Jazz', 'Blues', 'Folk'])
+    issued.clear()
+    assert sync_genres(venue_genre_table, 'venue_id', venue.id, ['Jazz', 'Blues', 'Funk']) is True
+    db.session.commit()
+    assert linked(venue.id) == {'Jazz', 'Blues', 'Funk'}
+    # Folk unlinked, Funk created and linked; Jazz and Blues untouched
+    assert issued.count('DELETE') == 1
+    assert issued.count('INSERT') == 2
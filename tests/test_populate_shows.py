@@ -0,0 +1,23 @@
+from catalog import catalog
+from changes import change_feed
+from extensions import db
+from models import Show, TrendBucket, PageDocument
+from populate_shows import populate_shows
+
+from conftest import make_app
+
+
+def test_seeded_shows_reach_the_catalog_trending_pages_and_feed(tmp_path):
+    app = make_app(tmp_path)
+    populate_shows(app)
+    populate_shows(app)     # idempotent
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count(Show.id))) == 5
+        assert [r.name for r in catalog.venues()] == ['The Musical Hop', 'Park Square Live Music & Coffee']
+        assert {r.name for r in catalog.artists()} == {'Guns N Petals', 'Matt Quevedo', 'The Wild Sax Band'}
+        starts = db.session.scalar(db.select(db.func.sum(TrendBucket.count))
+                                   .where(TrendBucket.metric == 'starts', TrendBucket.kind == 'venue'))
+        assert starts == 5
+        assert db.session.scalar(db.select(db.func.count()).select_from(PageDocument)) == 5
+        rows, _ = change_feed.since(0)
+        assert sorted(row.entity for row in rows).count('show') == 5
@@ -0,0 +1,47 @@
+import threading
+import tracemalloc
+
+from profiler import RequestProfile, profiler
+
+from conftest import make_app
+
+
+def test_overlapping_profiles_share_tracemalloc():
+    first = RequestProfile(threading.get_ident(), 0.01, 8)
+    second = RequestProfile(threading.get_ident(), 0.01, 8)
+    first.stop()
+    assert tracemalloc.is_tracing()     # still on for the request profiling second
+    second.stop()
+    assert not tracemalloc.is_tracing()
+
+
+def test_continuous_sampler_exits_when_idle(tmp_path):
+    app = make_app(tmp_path, PROFILE_CONTINUOUS=True, PROFILE_CONTINUOUS_INTERVAL=0.01,
+                   PROFILE_CONTINUOUS_IDLE=0.05)
+    client = app.test_client()
+    try:
+        client.get('/')
+        sampler = profiler._sampler
+        assert sampler is not None
+        sampler.join(timeout=5)
+        assert not sampler.is_alive() and profiler._sampler is None
+
+        client.get('/')     # the next request starts another
+        assert profiler._sampler is not None and profiler._sampler is not sampler
+    finally:
+        profiler.stop()
+    assert profiler._sampler is None
+
+
+def test_dead_continuous_sampler_is_replaced(tmp_path, monkeypatch):
+    app = make_app(tmp_path, PROFILE_CONTINUOUS=True, PROFILE_CONTINUOUS_INTERVAL=0.01)
+    client = app.test_client()
+    try:
+        dead = threading.Thread(target=lambda: None)
+        dead.start()
+        dead.join()
+        monkeypatch.setattr(profiler, '_sampler', dead)     # as if _sample_loop had raised
+        client.get('/')
+        assert profiler._sampler is not dead and profiler._sampler.is_alive()
+    finally:
+        profiler.stop()
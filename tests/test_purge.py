@@ -0,0 +1,65 @@
+from datetime import datetime
+
+from catalog import catalog
+from extensions import db
+from indexes import autocomplete
+from models import Venue, Artist, Show, PendingPurge
+from purge import purger
+from read_model import read_model
+
+from conftest import make_app
+
+
+def seed():
+    venue = Venue(name='Blue Note', city='New York', state='NY', address='131 W 3rd St', phone='2124754592')
+    artist = Artist(name='Miles', city='New York', state='NY', phone='2125550100')
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    db.session.add_all([Show(venue_id=venue.id, artist_id=artist.id, start_time=datetime(2030, 1, day, 20))
+                        for day in range(1, 4)])
+    db.session.commit()
+    return venue.id, artist.id
+
+
+def test_purged_venue_is_hidden_until_a_resumed_purge_removes_it(tmp_path, monkeypatch):
+    app = make_app(tmp_path, PURGE_INLINE_LIMIT=0, PURGE_BATCH_SIZE=2, PURGE_STALE_SECONDS=0,
+                   CATALOG_POLL_SECONDS=0, INDEXES_POLL_SECONDS=0)
+    submitted = []
+    # As if the worker that took the delete died before its background thread ran
+    monkeypatch.setattr(purger, '_submit', lambda kind, owner_id: submitted.append((kind, owner_id)))
+    with app.app_context():
+        venue_id, artist_id = seed()
+        assert [r.id for r in catalog.venues()] == [venue_id]
+        assert [r['id'] for r in autocomplete('blu', 'venue')] == [venue_id]
+
+        assert purger.delete_venue(venue_id) is False
+        assert submitted == [('venue', venue_id)]
+        assert db.session.get(Venue, venue_id) is not None
+        assert catalog.venues() == []
+        assert autocomplete('blu', 'venue') == []
+        assert read_model.venue_page(venue_id) is None
+        read_model.refresh(venue_ids=[venue_id])
+        assert read_model.venue_page(venue_id) is None
+
+        # Deleting it again doesn't schedule a second purge
+        assert purger.delete_venue(venue_id) is False
+        assert len(submitted) == 1
+
+        monkeypatch.undo()
+        assert purger.resume(inline=True) == 1
+        assert db.session.get(Venue, venue_id) is None
+        assert db.session.scalars(db.select(Show.id)).all() == []
+        assert db.session.scalars(db.select(PendingPurge.entity_id)).all() == []
+        artist_page = read_model.artist_page(artist_id)
+        assert artist_page['past_shows'] == [] and artist_page['upcoming_shows'] == []
+        assert purger.resume(inline=True) == 0
+
+
+def test_edit_form_of_a_venue_being_purged_redirects_home(tmp_path, monkeypatch):
+    app = make_app(tmp_path, PURGE_INLINE_LIMIT=0)
+    monkeypatch.setattr(purger, '_submit', lambda kind, owner_id: None)
+    with app.app_context():
+        venue_id, _ = seed()
+        purger.delete_venue(venue_id)
+    response = app.test_client().get(f'/venues/{venue_id}/edit')
+    assert response.status_code == 302
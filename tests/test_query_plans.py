@@ -0,0 +1,38 @@
+import json
+import os
+
+import click
+import pytest
+
+from query_plans import query_plans
+
+from conftest import make_app
+
+# Regenerate after an intended plan change with
+#   UPDATE_QUERY_PLANS=1 python -m pytest tests/test_query_plans.py
+BASELINE = os.path.join(os.path.dirname(__file__), 'query_plans.sqlite.json')
+
+
+@pytest.fixture
+def seeded(tmp_path):
+    app = make_app(tmp_path, QUERY_PLAN_BASELINE=BASELINE)
+    with app.app_context():
+        query_plans.seed(2000)
+        yield app
+
+
+def test_hot_routes_keep_their_sqlite_plans(seeded):
+    report = query_plans.capture()
+    assert report['dialect'] == 'sqlite'
+    if os.environ.get('UPDATE_QUERY_PLANS'):
+        with open(BASELINE, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+    assert query_plans.compare(report, baseline) == []
+
+
+def test_plans_are_never_compared_across_dialects(seeded):
+    report = query_plans.capture()
+    with pytest.raises(click.ClickException):
+        query_plans.compare(report, dict(report, dialect='postgresql'))
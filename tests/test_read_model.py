@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from extensions import db
+from models import Venue, Artist, Show
+from read_model import read_model
+
+from conftest import make_app
+
+
+def seed():
+    venue = Venue(name='Blue Note', city='New York', state='NY', address='131 W 3rd St', phone='2124754592')
+    artist = Artist(name='Miles', city='New York', state='NY', phone='2125550100')
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_time=datetime(2035, 1, 1, 20)))
+    db.session.commit()
+    return venue.id, artist.id
+
+
+def artist_names(venue_id):
+    page = read_model.venue_page(venue_id)
+    return [show['artist_name'] for show in page['past_shows'] + page['upcoming_shows']]
+
+
+def test_pages_are_served_from_stored_documents(app):
+    venue_id, artist_id = seed()
+    assert artist_names(venue_id) == ['Miles']
+
+    # A write that skips the read model isn't seen...
+    db.session.get(Artist, artist_id).name = 'Miles Davis'
+    db.session.commit()
+    assert artist_names(venue_id) == ['Miles']
+
+    # ...until its documents are refreshed
+    read_model.refresh(artist_ids=[artist_id], venue_ids=read_model.venues_of_artist(artist_id))
+    db.session.commit()
+    assert artist_names(venue_id) == ['Miles Davis']
+
+
+def test_new_shows_rebuild_the_pages_listing_them(tmp_path):
+    app = make_app(tmp_path, ADMIN_TOKEN='secret')
+    with app.app_context():
+        venue_id, artist_id = seed()
+        assert artist_names(venue_id) == ['Miles']
+
+    record = {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': '2036-01-01T20:00:00'}
+    response = app.test_client().post('/api/shows/batch', json=[record], headers={'Authorization': 'Bearer secret'})
+    assert response.json['failed'] == 0
+    with app.app_context():
+        assert artist_names(venue_id) == ['Miles', 'Miles']
+        assert len(read_model.artist_page(artist_id)['upcoming_shows']) == 2
+
+
+def test_deleting_a_show_rebuilds_both_pages(app):
+    venue_id, artist_id = seed()
+    assert artist_names(venue_id) == ['Miles']
+    db.session.execute(db.delete(Show))
+    read_model.refresh(venue_ids=[venue_id], artist_ids=[artist_id])
+    db.session.commit()
+    assert artist_names(venue_id) == []
+    assert read_model.artist_page(artist_id)['upcoming_shows'] == []
@@ -0,0 +1,95 @@
+import pytest
+
+import trending as trending_module
+from events import events
+from extensions import db
+from models import Venue, Show, Change, VenueShard
+from shards import shards, shard_metadata, bind_key
+
+from conftest import make_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path, SHARDS={'east': f'sqlite:///{tmp_path / "east.db"}'}, SHARD_STATES={'NY': 'east'},
+                   ADMIN_TOKEN='secret')
+    with app.app_context():
+        shard_metadata().create_all(db.engines[bind_key('east')])
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = 'Bearer secret'
+    return client
+
+
+def venue(name, state):
+    return {'name': name, 'city': 'Somewhere', 'state': state, 'address': '1 Main St', 'phone': '',
+            'genres': ['Jazz'], 'facebook_link': 'https://facebook.com/x'}
+
+
+def artist(name):
+    return {'name': name, 'city': 'Somewhere', 'state': 'NY', 'genres': ['Jazz'],
+            'facebook_link': 'https://facebook.com/x'}
+
+
+def east_venue_ids():
+    return shards.scatter(lambda session: session.scalars(db.select(Venue.id)).all(), ['east'])[0]
+
+
+def east_show_ids():
+    return shards.scatter(lambda session: session.scalars(db.select(Show.id)).all(), ['east'])[0]
+
+
+def test_batch_venues_go_to_the_shard_of_their_state(client):
+    response = client.post('/api/venues/batch', json=[venue('Uptown', 'NY'), venue('Downtown', 'TX')])
+
+    assert response.json['created'] == 2
+    ny_id, tx_id = (result['id'] for result in response.json['results'])
+    assert east_venue_ids() == [ny_id]
+    assert db.session.get(Venue, tx_id) is not None and db.session.get(Venue, ny_id) is None
+    assert db.session.get(VenueShard, ny_id).shard == 'east'
+    assert {(c.entity, c.entity_id) for c in db.session.scalars(db.select(Change))} == {('venue', ny_id),
+                                                                                       ('venue', tx_id)}
+
+
+def test_batch_shows_on_a_shard_venue_get_events_and_changes(client):
+    ny_id = client.post('/api/venues/batch', json=[venue('Uptown', 'NY')]).json['results'][0]['id']
+    artist_id = client.post('/api/artists/batch', json=[artist('Band')]).json['results'][0]['id']
+    subscription = events.subscribe(f'venue:{ny_id}')
+    try:
+        response = client.post('/api/shows/batch', json=[
+            {'venue_id': ny_id, 'artist_id': artist_id, 'start_time': '2030-01-01T20:00:00'}])
+        event = subscription.get(timeout=1)
+    finally:
+        subscription.close()
+
+    assert response.json['created'] == 1, response.json
+    show_id = response.json['results'][0]['id']
+    assert east_show_ids() == [show_id]
+    assert event['type'] == 'show.created' and event['show']['artist_name'] == 'Band'
+    change = db.session.scalars(db.select(Change).where(Change.entity == 'show')).one()
+    assert (change.entity_id, change.op, change.data['venue_id']) == (show_id, 'insert', ny_id)
+
+
+def test_failed_primary_commit_removes_the_shard_rows(client, monkeypatch):
+    ny_id = client.post('/api/venues/batch', json=[venue('Uptown', 'NY')]).json['results'][0]['id']
+    artist_id = client.post('/api/artists/batch', json=[artist('Band')]).json['results'][0]['id']
+
+    def fail(shows, booked_on=None):
+        raise RuntimeError('primary down')
+    monkeypatch.setattr(trending_module.trending, 'shows_added', fail)
+    response = client.post('/api/shows/batch', json=[
+        {'venue_id': ny_id, 'artist_id': artist_id, 'start_time': '2030-01-01T20:00:00'}])
+
+    assert response.json['failed'] == 1
+    assert east_show_ids() == []
+    assert db.session.scalars(db.select(Change).where(Change.entity == 'show')).all() == []
+
+
+def test_selection_queries_are_refused_while_sharded(client):
+    response = client.post('/api/query', json={'venues': {'select': ['name']}})
+
+    assert response.status_code == 501
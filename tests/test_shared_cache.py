@@ -0,0 +1,57 @@
+import time
+
+import pytest
+from flask import Flask
+
+from shared_cache import SharedCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SHARED_CACHE_PATH=str(tmp_path / 'cache.sqlite3'), SHARED_CACHE_MAX_BYTES=3000,
+                      SHARED_CACHE_EVICT_EVERY=1000)
+    return SharedCache(app)
+
+
+def test_values_round_trip_until_they_expire(cache):
+    cache.set('a', {'venues': [1, 2]}, ttl=60)
+    assert cache.get('a') == {'venues': [1, 2]}
+    cache.set('b', 'soon gone', ttl=0.05)
+    time.sleep(0.1)
+    assert cache.get('b', 'missing') == 'missing'
+    cache.delete('a')
+    assert cache.get('a') is None
+
+
+def test_entries_are_shared_between_instances(cache):
+    # As another worker on the same box would see it
+    other = SharedCache()
+    app = Flask(__name__)
+    app.config['SHARED_CACHE_PATH'] = cache.path
+    other.init_app(app)
+    cache.set('shows', [1], stored_at=123.0)
+    assert other.get_entry('shows') == ([1], 123.0)
+    assert other.stored_at('shows') == 123.0
+
+
+def test_bump_moves_a_namespace_to_new_keys(cache):
+    key = cache.key('venue', 3)
+    assert key == 'venue@0:3'
+    cache.set(key, 'old')
+    cache.bump('venue')
+    assert cache.key('venue', 3) == 'venue@1:3'
+    assert cache.get(cache.key('venue', 3)) is None
+    assert cache.key('artist', 3) == 'artist@0:3'
+
+
+def test_evict_drops_expired_then_least_recently_read(cache):
+    cache.set('expired', 'x' * 10, ttl=0.01)
+    time.sleep(0.05)
+    for n in range(300):
+        cache.set(f'k{n}', 'x' * 10)    # 12 bytes of JSON each, 3600 in all
+    # Reads only touch accessed_at once it's old, so age the first hundred by hand
+    cache._conn.execute("UPDATE entries SET accessed_at = accessed_at - 100 WHERE CAST(substr(key, 2) AS INTEGER) < 100")
+    cache.evict()
+    keys = {row[0] for row in cache._conn.execute('SELECT key FROM entries')}
+    assert keys == {f'k{n}' for n in range(100, 300)}
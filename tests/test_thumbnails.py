@@ -0,0 +1,38 @@
+import pytest
+from flask import Flask
+
+from thumbnails import ThumbnailCache, UnsafeURL, check_url
+
+
+@pytest.mark.parametrize('url', [
+    'file:///etc/passwd',
+    'ftp://example.com/image.png',
+    'http://127.0.0.1/image.png',
+    'http://localhost:8080/image.png',
+    'http://10.0.0.5/image.png',
+    'http://169.254.169.254/latest/meta-data/',
+    'http://[::1]/image.png',
+    'http://[::ffff:127.0.0.1]/image.png',
+])
+def test_check_url_refuses_local_and_non_http_sources(url):
+    with pytest.raises(UnsafeURL):
+        check_url(url)
+
+
+def test_failed_fetches_are_not_retried_and_release_their_locks(tmp_path):
+    calls = []
+
+    def fetcher(url):
+        calls.append(url)
+        raise OSError('connection refused')
+
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', THUMBNAIL_DIR=str(tmp_path))
+    cache = ThumbnailCache(app, fetcher=fetcher)
+
+    for width in (160, 320, 160):
+        with pytest.raises(Exception):
+            cache.get('http://images.example.com/broken.png', width, 'jpg')
+
+    assert len(calls) == 1
+    assert cache._locks == {}
@@ -0,0 +1,46 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from extensions import db
+from models import Venue, PendingPurge
+from trending import trending
+
+
+def test_cold_start_refreshes_once(app, monkeypatch):
+    calls = []
+
+    def refresh():
+        calls.append(1)
+        time.sleep(0.1)
+        trending._lists, trending._refreshed_at = {}, time.time()
+
+    monkeypatch.setattr(trending, '_refreshed_at', None)
+    monkeypatch.setattr(trending, '_start_refresher', lambda: None)
+    monkeypatch.setattr(trending, 'refresh', refresh)
+    threads = [threading.Thread(target=trending.top, args=('venue', 'upcoming_7')) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+
+
+def test_venues_being_purged_drop_out(app, monkeypatch):
+    monkeypatch.setattr(trending, '_start_refresher', lambda: None)
+    venues = [Venue(name=name, city='New York', state='NY', address='1 Main St', phone='2125550100')
+              for name in ('Blue Note', 'Village Vanguard')]
+    db.session.add_all(venues)
+    db.session.flush()
+    soon = datetime.now() + timedelta(days=1)
+    trending.shows_added([(venue.id, 1, soon) for venue in venues])
+    db.session.commit()
+    trending.refresh()
+    assert {entry['name'] for entry in trending.top('venue', 'upcoming_7')} == {'Blue Note', 'Village Vanguard'}
+
+    db.session.add(PendingPurge(kind='venue', entity_id=venues[0].id, requested_at=datetime.utcnow(),
+                                claimed_at=datetime.utcnow()))
+    db.session.commit()
+    assert [entry['name'] for entry in trending.top('venue', 'upcoming_7')] == ['Village Vanguard']
+    trending.refresh()
+    assert [entry['name'] for entry in trending.top('venue', 'upcoming_7')] == ['Village Vanguard']
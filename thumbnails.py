@@ -0,0 +1,298 @@
+#----------------------------------------------------------------------------#
+# Local thumbnail cache for remote image_link artwork.
+#----------------------------------------------------------------------------#
+
+# Templates call {{ url|thumbnail(320) }} instead of hotlinking image_link.  That
+# produces a /thumbs/<width>/<token> URL where the token is the signed source URL
+# (so the route can't be used as an open proxy).  The first hit fetches the source
+# once through a pluggable fetcher, resizes it and stores the result in a
+# content-addressed disk cache; every later hit is served straight from disk with
+# a one year, immutable Cache-Control.
+#
+# Resizing uses Pillow when it's installed.  Without it the original bytes are
+# cached and served as-is, which still saves the round trip to the image host.
+#
+# image_link is user input, and the server fetches it.  The default fetcher only
+# follows http(s) URLs whose host resolves to public addresses, redirects
+# included, so artwork can't be pointed at localhost, the private network or a
+# cloud metadata endpoint.  A source that fails to fetch or decode is not retried
+# for THUMBNAIL_FAILURE_TTL seconds; meanwhile its thumbnails redirect straight to
+# the original.
+
+import hashlib
+import io
+import ipaddress
+import os
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+
+from flask import abort, redirect, request, send_file, url_for
+from itsdangerous import BadSignature, URLSafeSerializer
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional
+    Image = None
+
+ONE_YEAR = 365 * 24 * 60 * 60
+
+_SNIFF = (
+    (b'\xff\xd8\xff', 'jpg', 'image/jpeg'),
+    (b'\x89PNG', 'png', 'image/png'),
+    (b'GIF8', 'gif', 'image/gif'),
+    (b'RIFF', 'webp', 'image/webp'),
+)
+_MIMETYPES = {ext: mimetype for _, ext, mimetype in _SNIFF}
+
+
+class UnsafeURL(ValueError):
+    pass
+
+
+def check_url(url):
+    """Raise UnsafeURL unless url is http(s) and its host resolves only to public addresses."""
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise UnsafeURL(f'{url} is not an http(s) URL')
+    try:
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        addresses = socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)
+    except (ValueError, OSError) as e:
+        raise UnsafeURL(f'{url} does not resolve: {e}') from e
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split('%', 1)[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        # Private, loopback, link-local, reserved and the like are all non-global
+        if not address.is_global or address.is_multicast:
+            raise UnsafeURL(f'{url} resolves to non-public address {address}')
+
+
+class _CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+_opener = urllib.request.build_opener(_CheckedRedirectHandler)
+
+
+def urlopen_fetcher(url, timeout=10, max_bytes=15 * 1024 * 1024):
+    """Default fetcher: HTTP(S) GET of a public URL (see check_url()), refusing anything larger than max_bytes."""
+    check_url(url)
+    req = urllib.request.Request(url, headers={'User-Agent': 'fyyur-thumbnailer'})
+    with _opener.open(req, timeout=timeout) as resp:
+        body = resp.read(max_bytes + 1)
+    if len(body) > max_bytes:
+        raise ValueError(f'{url} is larger than {max_bytes} bytes')
+    return body
+
+
+class DirectoryFetcher:
+    """Fetcher that serves every URL from a local directory, keyed by the URL's last path segment."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def __call__(self, url):
+        name = url.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+        with open(os.path.join(self.root, name), 'rb') as f:
+            return f.read()
+
+
+def _sniff(body):
+    for magic, ext, _ in _SNIFF:
+        if body.startswith(magic):
+            return ext
+    return None
+
+
+class ThumbnailCache:
+
+    def __init__(self, app=None, fetcher=None):
+        self.fetcher = fetcher or urlopen_fetcher
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._failures = OrderedDict()      # source -> monotonic time until which it isn't refetched
+        self._total_bytes = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('THUMBNAIL_DIR', os.path.join(app.instance_path, 'thumbnails'))
+        app.config.setdefault('THUMBNAIL_MAX_BYTES', 256 * 1024 * 1024)
+        app.config.setdefault('THUMBNAIL_WIDTHS', (160, 320, 640))
+        app.config.setdefault('THUMBNAIL_FAILURE_TTL', 300)
+        app.config.setdefault('THUMBNAIL_FAILURE_ENTRIES', 4096)
+        self.root = app.config['THUMBNAIL_DIR']
+        self.failure_ttl = app.config['THUMBNAIL_FAILURE_TTL']
+        self.failure_entries = app.config['THUMBNAIL_FAILURE_ENTRIES']
+        self.max_bytes = app.config['THUMBNAIL_MAX_BYTES']
+        self.widths = sorted(app.config['THUMBNAIL_WIDTHS'])
+        self._signer = URLSafeSerializer(app.config['SECRET_KEY'], salt='thumbnail')
+
+        app.add_url_rule('/thumbs/<int:width>/<token>', 'thumbnail', self.serve)
+        app.jinja_env.filters['thumbnail'] = self.url_for
+        app.extensions['thumbnails'] = self
+
+    # Template side
+    def url_for(self, source, width=320):
+        if not source or not source.startswith(('http://', 'https://')):
+            return source
+        # Snap to the next configured width so we never cache dozens of near-identical sizes
+        width = next((w for w in self.widths if w >= width), self.widths[-1])
+        return url_for('thumbnail', width=width, token=self._signer.dumps(source))
+
+    # Request side
+    def serve(self, width, token):
+        if width not in self.widths:
+            abort(404)
+        try:
+            source = self._signer.loads(token)
+        except BadSignature:
+            abort(404)
+
+        webp = Image is not None and 'image/webp' in request.headers.get('Accept', '')
+        try:
+            digest, ext = self.get(source, width, 'webp' if webp else 'jpg')
+        except Exception as e:
+            print(f'Exception "{e}" fetching thumbnail for {source}')
+            # Fall back to the original so the page still shows something
+            return redirect(source)
+
+        path = self._blob_path(digest, ext)
+        response = send_file(path, mimetype=_MIMETYPES.get(ext, 'application/octet-stream'),
+                             etag=digest, max_age=ONE_YEAR, conditional=True)
+        response.headers['Cache-Control'] = f'public, max-age={ONE_YEAR}, immutable'
+        response.vary.add('Accept')
+        return response
+
+    # Cache
+    def get(self, source, width, fmt):
+        """(content digest, extension) of the cached thumbnail, fetching and resizing it on a miss."""
+        ref = self._ref_path(source, width, fmt)
+        cached = self._read_ref(ref)
+        if cached:
+            return cached
+
+        self._check_failed(source)
+
+        lock = self._lock_for(ref)
+        with lock:
+            try:
+                cached = self._read_ref(ref)
+                if cached:
+                    return cached
+                self._check_failed(source)     # failed while we waited for the lock
+                try:
+                    body, ext = self._resize(self.fetcher(source), width, fmt)
+                except Exception:
+                    self._failed(source)
+                    raise
+                digest = hashlib.sha256(body).hexdigest()
+                path = self._blob_path(digest, ext)
+                if not os.path.exists(path):
+                    self._write_atomic(path, body)
+                    self._account(len(body))
+                self._write_atomic(ref, f'{digest} {ext}'.encode('ascii'))
+                return digest, ext
+            finally:
+                with self._locks_guard:
+                    if self._locks.get(ref) is lock:
+                        del self._locks[ref]
+
+    def _check_failed(self, source):
+        with self._locks_guard:
+            until = self._failures.get(source)
+        if until is not None and until > time.monotonic():
+            raise ValueError(f'{source} failed recently, not retrying yet')
+
+    def _failed(self, source):
+        with self._locks_guard:
+            self._failures.pop(source, None)
+            self._failures[source] = time.monotonic() + self.failure_ttl
+            while len(self._failures) > self.failure_entries:
+                self._failures.popitem(last=False)
+
+    def _resize(self, body, width, fmt):
+        if Image is None:
+            ext = _sniff(body)
+            if ext is None:
+                raise ValueError('not a recognised image format')
+            return body, ext
+        image = Image.open(io.BytesIO(body))
+        image.thumbnail((width, width * 4))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        out = io.BytesIO()
+        if fmt == 'webp':
+            image.save(out, 'WEBP', quality=80, method=4)
+        else:
+            image.save(out, 'JPEG', quality=82, optimize=True, progressive=True)
+        return out.getvalue(), fmt
+
+    def _ref_path(self, source, width, fmt):
+        key = hashlib.sha256(f'{width}:{fmt}:{source}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, 'refs', key[:2], key)
+
+    def _blob_path(self, digest, ext):
+        return os.path.join(self.root, 'blobs', digest[:2], f'{digest}.{ext}')
+
+    def _read_ref(self, ref):
+        try:
+            with open(ref, 'rb') as f:
+                digest, ext = f.read().decode('ascii').split()
+        except (OSError, ValueError):
+            return None
+        path = self._blob_path(digest, ext)
+        try:
+            # Touch on hit: eviction drops the least recently used blobs first
+            os.utime(path)
+        except OSError:
+            return None     # blob was evicted, refetch
+        return digest, ext
+
+    def _lock_for(self, key):
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _write_atomic(self, path, body):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+    def _blobs(self):
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, 'blobs')):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _account(self, added):
+        with self._locks_guard:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._blobs())
+            else:
+                self._total_bytes += added
+            if self._total_bytes <= self.max_bytes:
+                return
+            # Evict least recently used blobs down to 90% of the budget
+            target = self.max_bytes * 0.9
+            for path, size, _ in sorted(self._blobs(), key=lambda b: b[2]):
+                if self._total_bytes <= target:
+                    break
+                try:
+                    os.remove(path)
+                    self._total_bytes -= size
+                except OSError:
+                    pass
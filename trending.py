@@ -0,0 +1,216 @@
+#----------------------------------------------------------------------------#
+# Trending venues and artists over sliding day windows.
+#----------------------------------------------------------------------------#
+
+# trend_buckets holds per-day show counters for every venue and artist:
+#
+#   starts  shows taking place on that day   -> "most upcoming shows in 7/30 days"
+#   booked  shows booked (inserted) that day -> booking velocity over 7/30 days
+#
+# Write paths call shows_added() / shows_removed() in their transaction, which
+# upserts a handful of counter rows instead of anyone ever scanning `shows`.  A
+# window is then a range scan over at most 30 buckets per entity.  Cancelled
+# shows are taken out of `starts`, but a booking stays a booking.
+#
+# The top-k lists live in memory and are refreshed by a background thread every
+# TRENDING_REFRESH_SECONDS, so the home page never waits on them.  Only the first
+# request computes them inline; others arriving meanwhile wait for its result.
+# Venues and artists being purged (see purge.py) are left out of both the
+# refresh and what top() returns in between.  The same
+# thread compacts the table now and then (past `starts` days, `booked` days
+# older than the longest window, zeroed counters).  `flask rebuild-trending`
+# recounts `starts` from the shows table; booking history can't be recovered
+# from it and is left alone.
+
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models import Venue, Artist, Show, TrendBucket, PendingPurge, purging
+from shards import shards
+
+# name -> (metric, first day, last day + 1), as offsets from today
+LISTS = {
+    'upcoming_7': ('starts', 0, 7),
+    'upcoming_30': ('starts', 0, 30),
+    'booked_7': ('booked', -6, 1),
+    'booked_30': ('booked', -29, 1),
+}
+KINDS = ('venue', 'artist')
+_KEEP_BOOKED_DAYS = 30
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+class Trending:
+
+    def __init__(self, app=None):
+        self._lists = {}            # (kind, list name) -> [{'id', 'name', 'image_link', 'count'}]
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+        self._cold_lock = threading.Lock()
+        self._refresher = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TRENDING_TOP_K', 10)
+        app.config.setdefault('TRENDING_REFRESH_SECONDS', 60)
+        app.config.setdefault('TRENDING_COMPACT_SECONDS', 3600)
+        self.app = app
+        app.cli.command('rebuild-trending')(self._rebuild_command)
+        app.cli.command('compact-trending')(self._compact_command)
+        app.extensions['trending'] = self
+
+    # Counting
+    def shows_added(self, shows, booked_on=None):
+        """Count new shows, given as (venue_id, artist_id, start_time) rows, in the current transaction."""
+        booked_on = booked_on or date.today()
+        counts = Counter()
+        for venue_id, artist_id, start_time in shows:
+            for kind, id in (('venue', venue_id), ('artist', artist_id)):
+                counts['starts', kind, _day(start_time), int(id)] += 1
+                counts['booked', kind, booked_on, int(id)] += 1
+        self._add(counts)
+
+    def shows_removed(self, shows):
+        """Uncount deleted shows, given as (venue_id, artist_id, start_time) rows."""
+        counts = Counter()
+        for venue_id, artist_id, start_time in shows:
+            for kind, id in (('venue', venue_id), ('artist', artist_id)):
+                counts['starts', kind, _day(start_time), int(id)] -= 1
+        self._add(counts)
+
+    def show_rows(self, session, *criteria):
+        """(venue_id, artist_id, start_time) of the shows matching criteria, for shows_removed()."""
+        return session.execute(db.select(Show.venue_id, Show.artist_id, Show.start_time).where(*criteria)).all()
+
+    def _add(self, counts):
+        # Sorted, so concurrent writers take row locks in the same order
+        rows = [{'metric': metric, 'kind': kind, 'day': day, 'entity_id': id, 'count': delta}
+                for (metric, kind, day, id), delta in sorted(counts.items()) if delta]
+        dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+        for start in range(0, len(rows), 500):
+            insert = dialect.insert(TrendBucket).values(rows[start:start + 500])
+            db.session.execute(insert.on_conflict_do_update(
+                index_elements=['metric', 'kind', 'day', 'entity_id'],
+                set_={'count': TrendBucket.count + insert.excluded['count']}))
+
+    # Reading
+    def top(self, kind, name, k=None):
+        """The current top list, from memory.  Starts the refresher on first use."""
+        self._start_refresher()
+        if self._refreshed_at is None:
+            with self._cold_lock:
+                if self._refreshed_at is None:
+                    self.refresh()      # cold start: compute once inline
+        entries = self._lists.get((kind, name), [])
+        hidden = purging(kind, [entry['id'] for entry in entries]) if entries else ()
+        return [entry for entry in entries if entry['id'] not in hidden][:k]
+
+    def refresh(self):
+        k = current_app.config['TRENDING_TOP_K']
+        today = date.today()
+        ranked = {}
+        for kind in KINDS:
+            for name, (metric, first, last) in LISTS.items():
+                total = db.func.sum(TrendBucket.count)
+                being_purged = db.select(PendingPurge.entity_id).where(PendingPurge.kind == kind)
+                ranked[kind, name] = db.session.execute(
+                    db.select(TrendBucket.entity_id, total)
+                    .where(TrendBucket.metric == metric, TrendBucket.kind == kind,
+                           TrendBucket.day >= today + timedelta(days=first),
+                           TrendBucket.day < today + timedelta(days=last),
+                           TrendBucket.entity_id.not_in(being_purged))
+                    .group_by(TrendBucket.entity_id).having(total > 0)
+                    .order_by(total.desc(), TrendBucket.entity_id).limit(k)).all()
+
+        cards = {kind: self._cards(kind, {id for (list_kind, _), rows in ranked.items() if list_kind == kind
+                                          for id, _ in rows})
+                 for kind in KINDS}
+        lists = {}
+        for (kind, name), rows in ranked.items():
+            lists[kind, name] = [dict(cards[kind][id], id=id, count=count) for id, count in rows if id in cards[kind]]
+        # Swapped in whole, readers never see a half-built set
+        self._lists = lists
+        self._refreshed_at = time.time()
+
+    def _cards(self, kind, ids):
+        if not ids:
+            return {}
+        if kind == 'artist':
+            rows = db.session.execute(db.select(Artist.id, Artist.name, Artist.image_link)
+                                      .where(Artist.id.in_(ids))).all()
+        else:
+            rows = [row for shard, shard_ids in shards.locate_venues(ids).items()
+                    for row in shards.session(shard).execute(db.select(Venue.id, Venue.name, Venue.image_link)
+                                                             .where(Venue.id.in_(shard_ids)))]
+        return {id: {'name': name, 'image_link': image_link} for id, name, image_link in rows}
+
+    def _start_refresher(self):
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            # Started on first use, so a preloaded master never forks with a live thread
+            self._refresher = threading.Thread(target=self._refresh_loop, name='trending', daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        interval = self.app.config['TRENDING_REFRESH_SECONDS']
+        compact_every = self.app.config['TRENDING_COMPACT_SECONDS']
+        compacted_at = time.time()
+        while True:
+            time.sleep(interval)
+            with self.app.app_context():
+                try:
+                    if time.time() - compacted_at >= compact_every:
+                        self.compact()
+                        compacted_at = time.time()
+                    self.refresh()
+                except Exception as e:
+                    print(f'Exception "{e}" refreshing trending lists')
+                    db.session.rollback()
+                finally:
+                    db.session.close()
+
+    # Maintenance
+    def compact(self):
+        """Drop buckets no window can reach any more, and zeroed ones."""
+        today = date.today()
+        result = db.session.execute(db.delete(TrendBucket).where(db.or_(
+            db.and_(TrendBucket.metric == 'starts', TrendBucket.day < today),
+            db.and_(TrendBucket.metric == 'booked', TrendBucket.day < today - timedelta(days=_KEEP_BOOKED_DAYS)),
+            TrendBucket.count <= 0)))
+        db.session.commit()
+        return result.rowcount
+
+    def rebuild(self):
+        """Recount `starts` from the upcoming shows on every shard."""
+        today = datetime.combine(date.today(), datetime.min.time())
+        db.session.execute(db.delete(TrendBucket).where(TrendBucket.metric == 'starts'))
+        counts = Counter()
+        for rows in shards.scatter(lambda session: self.show_rows(session, Show.start_time >= today)):
+            for venue_id, artist_id, start_time in rows:
+                counts['starts', 'venue', _day(start_time), venue_id] += 1
+                counts['starts', 'artist', _day(start_time), artist_id] += 1
+        self._add(counts)
+        db.session.commit()
+        return len(counts)
+
+    def _rebuild_command(self):
+        """Recount upcoming shows per day for the trending lists."""
+        print(f'Rebuilt {self.rebuild()} trending counters')
+
+    def _compact_command(self):
+        """Drop trending counters that have aged out of every window."""
+        print(f'Dropped {self.compact()} trending counters')
+
+
+trending = Trending()
@@ -0,0 +1,335 @@
+import re
+
+import dateutil.parser
+from flask import Blueprint, current_app, jsonify, request
+from werkzeug.datastructures import MultiDict
+
+import geo
+from admission import admission, admin_only
+from analytics import analytics, REPORTS
+from graph import Query, QueryError
+from changes import change_feed
+from events import events
+from extensions import db, coalescer
+from forms import VenueForm, ArtistForm
+from models import Genre, Venue, Artist, Show, VenueShard, artist_genre_table, venue_genre_table, purging
+from read_model import read_model
+from shards import shards, DEFAULT
+from trending import trending
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+
+#  Batch writes
+#  ----------------------------------------------------------------
+#  POST a JSON array of records (or {"records": [...]}) to /api/<kind>/batch.
+#  Every record is validated first, foreign keys are checked with one IN query per
+#  referenced table, and all valid records are inserted in a single transaction
+#  with multi-row INSERTs.  Venues and shows go to their shard (see shards.py), which
+#  commits first; if the primary's commit then fails, the shard rows are deleted again.
+#  Bulk writes are for operators, so these routes need `Authorization: Bearer <ADMIN_TOKEN>`
+#  (admin_only, see admission.py).  The response reports each record by its index:
+#    {"created": 2, "failed": 1, "results": [{"index": 0, "ok": true, "id": 17}, ...]}
+
+def _records():
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get('records')
+    if not isinstance(payload, list) or not all(isinstance(r, dict) for r in payload):
+        return None, (jsonify({'error': 'Expected a JSON array of objects.'}), 400)
+    limit = current_app.config.get('API_BATCH_MAX', 1000)
+    if len(payload) > limit:
+        return None, (jsonify({'error': f'At most {limit} records per batch.'}), 413)
+    return payload, None
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _existing_ids(model, ids, session=None):
+    if not ids:
+        return set()
+    return set((session or db.session).scalars(db.select(model.id).where(model.id.in_(ids))))
+
+
+def _venue_shards(ids):
+    """{venue id: shard} for the venues that exist, one query per shard they're on."""
+    found = {}
+    for shard, shard_ids in shards.locate_venues(ids).items():
+        found.update((id, shard) for id in _existing_ids(Venue, shard_ids, shards.session(shard)))
+    return found
+
+
+def _by_shard(items, shard_of):
+    grouped = {}
+    for item in items:
+        grouped.setdefault(shard_of(item), []).append(item)
+    return grouped
+
+
+def _summary(results):
+    created = sum(1 for r in results if r['ok'])
+    return jsonify({'created': created, 'failed': len(results) - created, 'results': results})
+
+
+def _insert_returning_ids(model, rows, session=None):
+    # One multi-row INSERT ... RETURNING id, ids in the same order as rows
+    if not rows:
+        return []
+    return list((session or db.session).scalars(
+        db.insert(model).returning(model.id, sort_by_parameter_order=True), rows))
+
+
+def _insert_sharded(model, rows, session):
+    """Insert venues or shows into session's database, returning their ids in the same order as rows."""
+    if not shards.enabled:
+        return _insert_returning_ids(model, rows, session)
+    # Ids come from the primary, so an id means the same row on every shard
+    ids = shards.next_ids(model, len(rows))
+    if rows:
+        session.execute(db.insert(model), [dict(row, id=id) for row, id in zip(rows, ids)])
+    return ids
+
+
+def _genre_ids(names):
+    """{name: id} for every name, inserting the genres that don't exist yet in one statement."""
+    names = set(names)
+    if not names:
+        return {}
+    ids = dict(db.session.execute(db.select(Genre.name, Genre.id).where(Genre.name.in_(names))).all())
+    missing = sorted(names - set(ids))
+    ids.update(zip(missing, _insert_returning_ids(Genre, [{'name': name} for name in missing])))
+    return ids
+
+
+def _form_data(record, bool_fields):
+    # Feed JSON through the same WTForms classes the HTML forms use
+    data = MultiDict()
+    for key, value in record.items():
+        if key in bool_fields:
+            data.add(key, 'y' if value else '')
+        elif isinstance(value, list):
+            for item in value:
+                data.add(key, str(item))
+        elif value is not None:
+            data.add(key, str(value))
+    if 'website' in record and 'website_link' not in record:
+        data.add('website_link', str(record['website'] or ''))
+    return data
+
+
+def _validated(records, form_class, bool_fields):
+    """[(index, form)] for valid records, plus failure results for the rest."""
+    valid, results = [], []
+    for index, record in enumerate(records):
+        form = form_class(formdata=_form_data(record, bool_fields))
+        if form.validate():
+            valid.append((index, form))
+        else:
+            results.append({'index': index, 'ok': False, 'errors': form.errors})
+    return valid, results
+
+
+def _entity_row(form, model_fields):
+    row = {}
+    for name in model_fields:
+        field = form.website_link if name == 'website' else form[name]
+        value = field.data
+        row[name] = value.strip() if isinstance(value, str) else value
+    row['phone'] = re.sub(r'\D', '', row['phone'] or '')     # e.g. (819) 392-1234 --> 8193921234
+    return row
+
+
+def _commit_failed(e, results, pending, committed):
+    db.session.rollback()
+    shards.rollback(committed)
+    current_app.logger.exception('Batch insert failed')
+    results.extend({'index': index, 'ok': False, 'errors': {'database': [str(e.__class__.__name__)]}}
+                   for index in pending)
+
+
+@bp.route('/shows/batch', methods=['POST'])
+@admin_only
+def create_shows_batch():
+    records, error = _records()
+    if error:
+        return error
+
+    parsed, results = [], []
+    for index, record in enumerate(records):
+        errors = {}
+        artist_id, venue_id = _as_int(record.get('artist_id')), _as_int(record.get('venue_id'))
+        if artist_id is None:
+            errors['artist_id'] = ['Must be an integer.']
+        if venue_id is None:
+            errors['venue_id'] = ['Must be an integer.']
+        try:
+            start_time = dateutil.parser.isoparse(str(record.get('start_time')))
+        except ValueError:
+            errors['start_time'] = ['Must be an ISO 8601 datetime.']
+        if errors:
+            results.append({'index': index, 'ok': False, 'errors': errors})
+        else:
+            parsed.append((index, {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': start_time}))
+
+    # Batched foreign key existence checks: one query per referenced table (and venue shard)
+    artists = _existing_ids(Artist, {row['artist_id'] for _, row in parsed})
+    venues = _venue_shards({row['venue_id'] for _, row in parsed})
+    # Venues and artists being purged (see purge.py) are already gone as far as writers go
+    purging_artists, purging_venues = purging('artist', artists), purging('venue', venues)
+    rows = []
+    for index, row in parsed:
+        errors = {}
+        if row['artist_id'] not in artists:
+            errors['artist_id'] = ['No such artist.']
+        elif row['artist_id'] in purging_artists:
+            errors['artist_id'] = ['Artist is being deleted.']
+        if row['venue_id'] not in venues:
+            errors['venue_id'] = ['No such venue.']
+        elif row['venue_id'] in purging_venues:
+            errors['venue_id'] = ['Venue is being deleted.']
+        if errors:
+            results.append({'index': index, 'ok': False, 'errors': errors})
+        else:
+            rows.append((index, row))
+
+    created, committed = [], []
+    try:
+        # Shows live on their venue's shard
+        for shard, shard_rows in _by_shard(rows, lambda item: venues[item[1]['venue_id']]).items():
+            session = shards.session(shard)
+            ids = _insert_sharded(Show, [row for _, row in shard_rows], session)
+            if session is not db.session:
+                session.commit()    # shard first, then the primary
+                committed.append((shard, Show, ids))
+            events.publish_shows('show.created', Show.id.in_(ids), session=session)
+            change_feed.record('show', 'insert', ids, session=session)
+            created.extend((index, id) for (index, _), id in zip(shard_rows, ids))
+        trending.shows_added((row['venue_id'], row['artist_id'], row['start_time']) for _, row in rows)
+        read_model.refresh(venue_ids={row['venue_id'] for _, row in rows},
+                           artist_ids={row['artist_id'] for _, row in rows})
+        db.session.commit()
+        results.extend({'index': index, 'ok': True, 'id': id} for index, id in created)
+        if created:
+            coalescer.invalidate('shows', 'venues')
+    except Exception as e:
+        _commit_failed(e, results, [index for index, _ in rows], committed)
+    finally:
+        db.session.close()
+
+    results.sort(key=lambda r: r['index'])
+    return _summary(results)
+
+
+VENUE_FIELDS = ['name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+                'website', 'seeking_talent', 'seeking_description']
+ARTIST_FIELDS = ['name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+                 'website', 'seeking_venue', 'seeking_description']
+
+
+def _create_entities_batch(model, form_class, fields, bool_field, association_table, owner_column):
+    records, error = _records()
+    if error:
+        return error, []
+
+    valid, results = _validated(records, form_class, {bool_field})
+    rows = [_entity_row(form, fields) for _, form in valid]
+    if model is Venue:
+        for row in rows:
+            row['latitude'], row['longitude'] = geo.geocode(row['city'], row['state']) or (None, None)
+
+    created, committed = [], []
+    try:
+        genre_names = [list(dict.fromkeys(form.genres.data)) for _, form in valid]
+        genre_ids = _genre_ids(name for names in genre_names for name in names)
+        items = list(zip(valid, rows, genre_names))
+        # Venues go to the shard of their state; artists all live on the primary
+        groups = (_by_shard(items, lambda item: shards.shard_for_state(item[1]['state'])) if model is Venue
+                  else {DEFAULT: items})
+        for shard, shard_items in groups.items():
+            session = shards.session(shard)
+            insert = _insert_sharded if model is Venue else _insert_returning_ids
+            shard_ids = insert(model, [row for _, row, _ in shard_items], session)
+            links = [{'genre_id': genre_ids[name], owner_column: id}
+                     for id, (_, _, names) in zip(shard_ids, shard_items) for name in names]
+            if links:
+                session.execute(db.insert(association_table), links)
+            if session is not db.session:
+                session.commit()    # shard first, then the directory entries on the primary
+                committed.append((shard, model, shard_ids))
+                db.session.execute(db.insert(VenueShard), [{'venue_id': id, 'shard': shard} for id in shard_ids])
+            created.extend((index, id) for ((index, _), _, _), id in zip(shard_items, shard_ids))
+        created.sort()
+        ids = [id for _, id in created]
+        if model is Venue:
+            read_model.refresh(venue_ids=ids)
+            change_feed.record('venue', 'insert', ids)
+        else:
+            read_model.refresh(artist_ids=ids)
+            change_feed.record('artist', 'insert', ids)
+        db.session.commit()
+        results.extend({'index': index, 'ok': True, 'id': id} for index, id in created)
+    except Exception as e:
+        created = []
+        _commit_failed(e, results, [index for index, _ in valid], committed)
+    finally:
+        db.session.close()
+
+    results.sort(key=lambda r: r['index'])
+    return _summary(results), created
+
+
+@bp.route('/venues/batch', methods=['POST'])
+@admin_only
+def create_venues_batch():
+    response, created = _create_entities_batch(Venue, VenueForm, VENUE_FIELDS, 'seeking_talent',
+                                               venue_genre_table, 'venue_id')
+    if created:
+        coalescer.invalidate('venues')
+    return response
+
+
+@bp.route('/artists/batch', methods=['POST'])
+@admin_only
+def create_artists_batch():
+    response, _ = _create_entities_batch(Artist, ArtistForm, ARTIST_FIELDS, 'seeking_venue',
+                                         artist_genre_table, 'artist_id')
+    return response
+
+
+#  Selection queries
+#  ----------------------------------------------------------------
+#  POST /api/query with e.g. {"venues": {"ids": [3], "select": ["name", {"shows": ["start_time", {"artist": ["name"]}]}]}}
+#  See graph.py for the format.  Every relation in the selection costs one query, however many rows it spans.
+
+@bp.route('/query', methods=['POST'])
+def query():
+    if shards.enabled:
+        # Relations are resolved with joins on one database (see shards.py)
+        return jsonify({'error': 'Selection queries are not available while venues are sharded.'}), 501
+    document = request.get_json(silent=True)
+    q = Query(max_rows=current_app.config.get('API_QUERY_MAX_ROWS', 5000))
+    try:
+        data = q.run(document)
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'data': data, 'queries': q.queries})
+
+
+#  Analytics
+#  ----------------------------------------------------------------
+#  GET /api/analytics/<report>, one of venue_months, heatmap, genre_mix, occupancy.
+#  Reports come back column-wise, {"columns": {"month": [...], "shows": [...]}}.  See analytics.py.
+
+@bp.route('/analytics/<report>')
+@admission.limit('heavy')
+def analytics_report(report):
+    if report not in REPORTS:
+        return jsonify({'error': f'report must be one of {sorted(REPORTS)}.'}), 404
+    if not analytics.available:
+        return jsonify({'error': 'Analytics needs numpy installed on the server.'}), 503
+    return jsonify(analytics.report(report))
@@ -0,0 +1,311 @@
+import re
+from collections import Counter
+from datetime import datetime
+
+from flask import Blueprint, render_template, request, flash, redirect, url_for, abort, jsonify
+
+from admission import admission
+from catalog import catalog
+from changes import change_feed
+from extensions import db, coalescer
+from forms import *
+from indexes import similar_artists
+from models import Genre, Artist, Show, artist_genre_table, assign_changed, sync_genres, purging
+from purge import purger
+from read_model import read_model
+from shards import shards
+
+bp = Blueprint('artists', __name__)
+
+
+#  Artists
+#  ----------------------------------------------------------------
+@bp.route('/artists')
+@admission.limit('heavy')
+def artists():
+    artists = catalog.artists()  # Sorted alphabetically, from memory (see catalog.py)
+
+    data = []  # Initialize data list before using it
+
+    for artist in artists:
+        data.append({
+            "id": artist.id,
+            "name": artist.name
+        })
+
+    return render_template('pages/artists.html', artists=data)
+
+
+@bp.route('/artists/search', methods=['POST'])
+@admission.limit('search')
+def search_artists():
+    # Most of code is from search_venues()
+    search_term = request.form.get('search_term', '').strip()
+
+    # Case-insensitive, anywhere in the name, against the in-memory catalog
+    artists = catalog.search('artist', search_term)
+    #print(artists)
+    artist_list = []
+    now = datetime.now()
+    ids = [artist.id for artist in artists]
+    # Their shows can be on any shard: one grouped count per shard, in parallel
+    upcoming = Counter()
+    for counts in shards.scatter(lambda session: session.execute(
+            db.select(Show.artist_id, db.func.count(Show.id))
+            .where(Show.artist_id.in_(ids), Show.start_time > now).group_by(Show.artist_id)).all()):
+        upcoming.update(dict(counts))
+    for artist in artists:
+        artist_list.append({
+            "id": artist.id,
+            "name": artist.name,
+            "num_upcoming_shows": upcoming[artist.id]  # FYI, template does nothing with this
+        })
+    if not artists:
+        response = {
+            "count": 0,
+            "data": []
+        }
+    else:
+        response = {
+        "count": len(artist_list),
+        "data": artist_list
+    }
+
+    return render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+@bp.route('/artists/<int:artist_id>')
+@admission.limit('heavy')
+def show_artist(artist_id):
+    print(f"Requested artist_id: {artist_id}")
+
+    # One primary-key lookup in the read model (see read_model.py)
+    data = read_model.artist_page(artist_id)
+    if not data:
+        flash('Artist not found.')
+        return redirect(url_for('main.index'))
+
+    data["similar_artists"] = similar_artists(artist_id)
+    return render_template('pages/show_artist.html', artist=data)
+
+#  Update
+#  ----------------------------------------------------------------
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
+def edit_artist(artist_id):
+    # Taken mostly from edit_venue()
+
+    # Get the existing artist from the database
+    artist = Artist.query.get(artist_id)  # Returns object based on primary key, or None.  Guessing get is faster than filter_by
+    if not artist or purging('artist', [artist_id]):
+        # User typed in a URL that doesn't exist (or is being deleted, see purge.py), redirect home
+        return redirect(url_for('main.index'))
+    else:
+        # Otherwise, valid artist.  We can prepopulate the form with existing data like this.
+        # Prepopulate the form with the current values.  This is only used by template rendering!
+        form = ArtistForm(obj=artist)
+
+    # genres needs to be a list of genre strings for the template
+    genres = [ genre.name for genre in artist.genres ]
+    
+    
+    artist = {
+        "id": artist_id,
+        "name": artist.name,
+        "genres": genres,
+        # "address": artist.address,
+        "city": artist.city,
+        "state": artist.state,
+    # Put the dashes back into phone number
+    "phone": (artist.phone[:3] + '-' + artist.phone[3:6] + '-' + artist.phone[6:]) if len(artist.phone) == 10 else artist.phone,
+        "website": artist.website,
+        "facebook_link": artist.facebook_link,
+        "seeking_venue": artist.seeking_venue,
+        "seeking_description": artist.seeking_description,
+        "image_link": artist.image_link
+    }
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
+def edit_artist_submission(artist_id):
+    # Much of this code from edit_venue_submission()
+    form = ArtistForm()
+
+    name = form.name.data.strip()
+    city = form.city.data.strip()
+    state = form.state.data
+    # address = form.address.data.strip()
+    phone = form.phone.data
+    # Normalize DB.  Strip anything from phone that isn't a number
+    phone = re.sub(r'\D', '', phone) if phone else phone # e.g. (819) 392-1234 --> 8193921234
+    genres = form.genres.data                   # ['Alternative', 'Classical', 'Country']
+    seeking_venue = True if form.seeking_venue.data == 'Yes' else False
+    seeking_description = form.seeking_description.data.strip()
+    image_link = form.image_link.data.strip()
+    website = form.website.data.strip()
+    facebook_link = form.facebook_link.data.strip()
+    
+    # Redirect back to form if errors in form validation
+    if not form.validate():
+        flash( form.errors )
+        return redirect(url_for('artists.edit_artist', artist_id=artist_id))
+
+    else:
+        error_in_update = False
+
+        # Insert form data into DB
+        try:
+            # First get the existing artist object
+            artist = Artist.query.get(artist_id)
+            # artist = Artist.query.filter_by(id=artist_id).one_or_none()
+            if artist is None or purging('artist', [artist_id]):
+                raise ValueError(f'no artist {artist_id}')
+
+            # Update only the fields that actually changed, so a no-op save writes nothing
+            changed = assign_changed(artist, name=name, city=city, state=state, phone=phone,
+                seeking_venue=seeking_venue, seeking_description=seeking_description,
+                image_link=image_link, website=website, facebook_link=facebook_link)
+
+            # Only the added/removed genre links are written, the rest of artist_genre_table is left alone
+            # genres from the form is like: ['Alternative', 'Classical', 'Country']
+            genres_changed = sync_genres(artist_genre_table, 'artist_id', artist_id, genres)
+            if changed or genres_changed:
+                # The artist's name and image also appear in its venues' page documents
+                venue_ids = read_model.venues_of_artist(artist_id) if {'name', 'image_link'} & set(changed) else ()
+                read_model.refresh(venue_ids=venue_ids, artist_ids=[artist_id])
+                change_feed.record('artist', 'update', [artist_id])
+
+            # Attempt to save everything
+            db.session.commit()
+            if changed or genres_changed:
+                coalescer.invalidate('shows')
+        except Exception as e:
+            error_in_update = True
+            print(f'Exception "{e}" in edit_artist_submission()')
+            db.session.rollback()
+        finally:
+            db.session.close()
+
+        if not error_in_update:
+            # on successful db update, flash success
+            flash('Artist ' + request.form['name'] + ' was successfully updated!')
+            return redirect(url_for('artists.show_artist', artist_id=artist_id))
+        else:
+            flash('An error occurred. Artist ' + name + ' could not be updated.')
+            print("Error in edit_artist_submission()")
+            abort(500)
+
+
+
+#  Create Artist
+#  ----------------------------------------------------------------
+@bp.route('/artists/create', methods=['GET'])
+def create_artist_form():
+    form = ArtistForm()
+    return render_template('forms/new_artist.html', form=form)
+
+
+@bp.route('/artists/create', methods=['POST'])
+def create_artist_submission():
+
+    # Much of this code is similar to create_venue view
+    form = ArtistForm()
+
+    name = form.name.data.strip()
+    city = form.city.data.strip()
+    state = form.state.data
+    # address = form.address.data.strip()
+    phone = form.phone.data
+    # Normalize DB.  Strip anything from phone that isn't a number
+    phone = re.sub(r'\D', '', phone) # e.g. (819) 392-1234 --> 8193921234
+    genres = form.genres.data                   # ['Alternative', 'Classical', 'Country']
+    seeking_venue = True if form.seeking_venue.data == 'Yes' else False
+    seeking_description = form.seeking_description.data.strip()
+    image_link = form.image_link.data.strip()
+    website = form.website.data.strip()
+    facebook_link = form.facebook_link.data.strip()
+    
+    # Redirect back to form if errors in form validation
+    if not form.validate():
+        flash( form.errors )
+        return redirect(url_for('artists.create_artist_form'))
+
+    else:
+        error_in_insert = False
+
+        # Insert form data into DB
+        try:
+            # creates the new artist with all fields but not genre yet
+            new_artist = Artist(name=name, city=city, state=state, phone=phone, \
+                seeking_venue=seeking_venue, seeking_description=seeking_description, image_link=image_link, \
+                website=website, facebook_link=facebook_link)
+            # genres can't take a list of strings, it needs to be assigned to db objects
+            # genres from the form is like: ['Alternative', 'Classical', 'Country']
+            for genre in genres:
+                # fetch_genre = session.query(Genre).filter_by(name=genre).one_or_none()  # Throws an exception if more than one returned, returns None if none
+                fetch_genre = Genre.query.filter_by(name=genre).one_or_none()  # Throws an exception if more than one returned, returns None if none
+                if fetch_genre:
+                    # if found a genre, append it to the list
+                    new_artist.genres.append(fetch_genre)
+
+                else:
+                    # fetch_genre was None. It's not created yet, so create it
+                    new_genre = Genre(name=genre)
+                    db.session.add(new_genre)
+                    new_artist.genres.append(new_genre)  # Create a new Genre item and append it
+
+            db.session.add(new_artist)
+            db.session.flush()
+            read_model.refresh(artist_ids=[new_artist.id])
+            change_feed.record('artist', 'insert', [new_artist.id])
+            db.session.commit()
+        except Exception as e:
+            error_in_insert = True
+            print(f'Exception "{e}" in create_artist_submission()')
+            db.session.rollback()
+        finally:
+            db.session.close()
+
+        if not error_in_insert:
+            # on successful db insert, flash success
+            flash('Artist ' + request.form['name'] + ' was successfully listed!')
+            return redirect(url_for('main.index'))
+        else:
+            flash('An error occurred. Artist ' + name + ' could not be listed.')
+            print("Error in create_artist_submission()")
+            abort(500)
+
+
+@bp.route('/artists/<artist_id>/delete', methods=['POST'])
+def delete_artist(artist_id):
+    # Deletes a artist based on AJAX call from the artist page
+    artist = Artist.query.get(artist_id)
+    if not artist:
+        # User somehow faked this call, redirect home
+        return redirect(url_for('main.index'))
+    else:
+        error_on_delete = False
+        # Need to hang on to artist name since will be lost after delete
+        artist_name = artist.name
+        artist_id = artist.id
+        try:
+            # Cascades to shows in the database; artists with many shows are purged in the background
+            deleted = purger.delete_artist(artist_id)
+            coalescer.invalidate('shows', 'venues')
+        except:
+            error_on_delete = True
+            db.session.rollback()
+            shards.rollback()
+        finally:
+            db.session.close()
+        if error_on_delete:
+            flash(f'An error occurred deleting artist {artist_name}.')
+            print("Error in delete_artist()")
+            abort(500)
+        else:
+            # flash(f'Successfully removed artist {artist_name}')
+            # return redirect(url_for('artists.artists'))
+            return jsonify({
+                'deleted': True,
+                'purging': not deleted,
+                'url': url_for('artists.artists')
+            })
@@ -0,0 +1,41 @@
+from flask import Blueprint, Response, jsonify
+
+from events import events, city_channel
+
+bp = Blueprint('events', __name__)
+
+
+#  Live show events (Server-Sent Events)
+#  ----------------------------------------------------------------
+#  new EventSource('/venues/3/events').addEventListener('show.created', ...)
+#  Each stream carries show.created and show.deleted events for one venue,
+#  artist or city; see events.py for how they're delivered.  A stream holds a worker
+#  thread while it's open, so there are at most EVENTS_MAX_STREAMS per process.
+
+def _event_stream(channel):
+    subscription = events.subscribe(channel)
+    if subscription is None:
+        response = jsonify({'error': 'Too many open event streams, try again later.'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(events.app.config['EVENTS_RETRY_AFTER'])
+        return response
+    response = Response(events.stream(subscription), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Also when the client goes away before the body starts, which never runs stream()'s finally
+    response.call_on_close(subscription.close)
+    return response
+
+
+@bp.route('/venues/<int:venue_id>/events')
+def venue_events(venue_id):
+    return _event_stream(f'venue:{venue_id}')
+
+
+@bp.route('/artists/<int:artist_id>/events')
+def artist_events(artist_id):
+    return _event_stream(f'artist:{artist_id}')
+
+
+@bp.route('/cities/<state>/<city>/events')
+def city_events(state, city):
+    return _event_stream(city_channel(state, city))
@@ -0,0 +1,81 @@
+import os
+import time
+
+from flask import Blueprint, render_template, jsonify, request
+
+from admission import admission, admin_only
+from changes import change_feed
+from indexes import autocomplete
+from trending import trending, LISTS
+
+bp = Blueprint('main', __name__)
+
+
+@bp.route('/')
+def index():
+    # Served from the in-memory lists (see trending.py)
+    return render_template('pages/home.html', trending={
+        'venues': trending.top('venue', 'upcoming_7', 5),
+        'artists': trending.top('artist', 'booked_7', 5),
+    })
+
+
+@bp.route('/trending')
+def trending_lists():
+    # e.g. /trending?type=venue&by=upcoming_30
+    kind = request.args.get('type', 'venue')
+    by = request.args.get('by', 'upcoming_7')
+    if kind not in ('venue', 'artist') or by not in LISTS:
+        return jsonify({'error': f'type must be venue or artist, by one of {sorted(LISTS)}.'}), 400
+    return jsonify({'type': kind, 'by': by, 'results': trending.top(kind, by)})
+
+
+@bp.route('/test')
+def test_route():
+    return jsonify({'status': 'success', 'message': 'Test route working'})
+
+
+@bp.route('/autocomplete')
+def autocomplete_names():
+    # e.g. /autocomplete?q=mus&type=venue -- served from memory, never touches the database once loaded
+    kind = request.args.get('type')
+    if kind not in (None, 'venue', 'artist'):
+        return jsonify({'error': 'type must be venue or artist.'}), 400
+    k = min(request.args.get('k', 8, type=int), 25)
+    query = request.args.get('q', '')
+    return jsonify({'query': query, 'results': autocomplete(query, kind, k)})
+
+
+@bp.route('/changes')
+def changes():
+    # Incremental sync: GET /changes?since=0, then keep passing back the returned `next`
+    since = request.args.get('since', 0, type=int)
+    page = change_feed.since(since, request.args.get('limit', type=int))
+    if page is None:
+        return jsonify({'error': 'Cursor is older than the retained change history, resync from scratch.',
+                        'latest': change_feed.latest()}), 410
+    rows, more = page
+    return jsonify({
+        'changes': [{'seq': row.seq, 'entity': row.entity, 'id': row.entity_id, 'op': row.op,
+                     'data': row.data, 'at': row.changed_at.isoformat()} for row in rows],
+        'next': rows[-1].seq if rows else since,
+        'more': more,
+    })
+
+
+@bp.route('/stats/pool')
+@admin_only
+def pool_stats():
+    # Per worker process: the load generator (loadtest.py) polls it and tells workers apart by pid
+    return jsonify({'pid': os.getpid(), 'time': time.time(), 'pools': admission.pool_stats(),
+                    'admission': admission.outcomes()})
+
+
+@bp.app_errorhandler(404)
+def not_found_error(error):
+    return render_template('errors/404.html'), 404
+
+
+@bp.app_errorhandler(500)
+def server_error(error):
+    return render_template('errors/500.html'), 500
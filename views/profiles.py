@@ -0,0 +1,52 @@
+import re
+
+from flask import Blueprint, Response, abort, current_app, jsonify, send_from_directory
+
+from admission import admin_only
+from profiler import profiler, flamegraph
+
+bp = Blueprint('profiles', __name__, url_prefix='/profiles')
+
+_ID = re.compile(r'^[0-9]+-[A-Za-z0-9_.-]+$')
+
+
+#  Profiles (admins only, see profiler.py)
+#  ----------------------------------------------------------------
+#  GET /venues?_profile=1 with the admin token, then /profiles/<X-Profile-Id>.svg
+#  for the flame graph and /profiles/<X-Profile-Id>.txt for the allocations.
+
+@bp.route('')
+@admin_only
+def list_profiles():
+    return jsonify({'profiles': profiler.stored(), 'endpoints': profiler.endpoint_samples()})
+
+
+@bp.route('/<profile_id>.<any(svg, txt, folded):kind>')
+@admin_only
+def stored_profile(profile_id, kind):
+    if not _ID.match(profile_id):
+        abort(404)
+    mimetype = {'svg': 'image/svg+xml', 'txt': 'text/plain', 'folded': 'text/plain'}[kind]
+    return send_from_directory(current_app.config['PROFILE_DIR'], f'{profile_id}.{kind}', mimetype=mimetype,
+                               max_age=0)
+
+
+#  Continuous sampling (PROFILE_CONTINUOUS)
+#  ----------------------------------------------------------------
+
+@bp.route('/endpoints/<endpoint>.<any(svg, folded):kind>')
+@admin_only
+def endpoint_profile(endpoint, kind):
+    stacks = profiler.endpoint_stacks(endpoint)
+    if not stacks:
+        abort(404)
+    if kind == 'folded':
+        return Response(''.join(f'{stack} {n}\n' for stack, n in stacks.items()), mimetype='text/plain')
+    return Response(flamegraph(stacks, endpoint), mimetype='image/svg+xml')
+
+
+@bp.route('/endpoints/reset', methods=['POST'])
+@admin_only
+def reset_endpoint_profiles():
+    profiler.reset()
+    return jsonify({'reset': True})
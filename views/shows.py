@@ -0,0 +1,130 @@
+from operator import itemgetter
+
+from flask import Blueprint, render_template, flash, jsonify
+
+from admission import admission
+from changes import change_feed
+from events import events
+from extensions import db, coalescer
+from filters import format_datetime
+from forms import *
+from models import Venue, Artist, Show, purging
+from read_model import read_model
+from shards import shards, artist_cards
+from trending import trending
+
+bp = Blueprint('shows', __name__)
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+def show_listing():
+    # Template data for /shows, gathered from every shard
+    shows = shards.merge(lambda session: session.execute(
+        db.select(Show.id, Show.venue_id, Venue.name, Show.artist_id, Show.start_time)
+        .join(Venue, Venue.id == Show.venue_id).order_by(Show.id)).all(), key=itemgetter(0))
+    # Artists are all on the primary
+    artists = artist_cards(show.artist_id for show in shows)
+
+    data = []  # Initialize data list before using it
+
+    for show in shows:
+        if show.artist_id not in artists:
+            continue
+        artist_name, artist_image_link = artists[show.artist_id]
+        data.append({
+            "venue_id": show.venue_id,
+            "venue_name": show.name,
+            "artist_id": show.artist_id,
+            "artist_name": artist_name,
+            "artist_image_link": artist_image_link,
+            "start_time": format_datetime(str(show.start_time))
+        })
+
+    return data
+
+
+@bp.route('/shows')
+@admission.limit('heavy')
+def shows():
+    data = coalescer.get('shows', show_listing)
+    return render_template('pages/shows.html', shows=data)
+
+
+
+@bp.route('/venues/<int:venue_id>/shows', methods=['GET'])
+@admission.limit('heavy')
+def get_venue_shows(venue_id):
+    # Straight to the venue's shard
+    shows = shards.venue_session(venue_id).scalars(
+        db.select(Show).where(Show.venue_id == venue_id).order_by(Show.id)).all()
+    artists = artist_cards(show.artist_id for show in shows)
+    data = []
+    for show in shows:
+        if show.artist_id not in artists:
+            continue
+        artist_name, artist_image_link = artists[show.artist_id]
+        data.append({
+            "artist_id": show.artist_id,
+            "artist_name": artist_name,
+            "artist_image_link": artist_image_link,
+            "start_time": show.start_time.isoformat()
+        })
+    return jsonify(data)
+
+
+@bp.route('/shows/create', methods=['GET'])
+def create_shows():
+    # renders form. do not touch. (--> nyah nyah!  I touched it!)
+    form = ShowForm()
+    return render_template('forms/new_show.html', form=form)
+
+
+@bp.route('/shows/create', methods=['POST'])
+def create_show_submission():
+    # called to create new shows in the db, upon submitting new show listing form
+    form = ShowForm()
+
+    artist_id = form.artist_id.data.strip()
+    venue_id = form.venue_id.data.strip()
+    start_time = form.start_time.data
+
+    error_in_insert = False
+    committed = []      # shard rows to delete again if the primary's commit fails
+    
+    try:
+        # Shows live on their venue's shard (see shards.py)
+        shard = shards.shard_of_venue(venue_id)
+        session = shards.session(shard)
+        if session is not db.session and db.session.get(Artist, int(artist_id)) is None:
+            raise ValueError(f'no artist {artist_id}')    # no foreign key to check it on a shard
+        if purging('venue', [venue_id]) or purging('artist', [artist_id]):
+            raise ValueError('venue or artist is being deleted')
+        new_show = Show(id=shards.next_id(Show), start_time=start_time, artist_id=artist_id, venue_id=venue_id)
+        session.add(new_show)
+        session.flush()
+        if session is not db.session:
+            session.commit()    # shard first, then the read model on the primary
+            committed.append((shard, Show, [new_show.id]))
+        events.publish_shows('show.created', Show.id == new_show.id, session=session)
+        trending.shows_added([(new_show.venue_id, new_show.artist_id, new_show.start_time)])
+        read_model.refresh(venue_ids=[venue_id], artist_ids=[artist_id])
+        change_feed.record('show', 'insert', [new_show.id], session=session)
+        db.session.commit()
+        coalescer.invalidate('shows', 'venues')
+    except Exception as e:
+        error_in_insert = True
+        print(f'Exception "{e}" in create_show_submission()')
+        db.session.rollback()
+        shards.rollback(committed)
+    finally:
+        db.session.close()
+
+    if error_in_insert:
+        flash(f'An error occurred.  Show could not be listed.')
+        print("Error in create_show_submission()")
+    else:
+        flash('Show was successfully listed!')
+    
+    return render_template('pages/home.html')
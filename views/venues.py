@@ -0,0 +1,402 @@
+import re
+from datetime import datetime
+from operator import itemgetter # for sorting lists of tuples
+
+from flask import Blueprint, render_template, request, flash, redirect, url_for, abort, jsonify
+
+import geo
+from admission import admission
+from catalog import catalog
+from changes import change_feed
+from extensions import db, coalescer
+from forms import *
+from indexes import similar_venues, nearby_venues
+from models import Venue, Show, VenueShard, venue_genre_table, assign_changed, sync_genres, purging
+from purge import purger
+from read_model import read_model
+from shards import shards, genre_names
+
+bp = Blueprint('venues', __name__, cli_group=None)
+
+
+@bp.cli.command('geocode-venues')
+def geocode_venues_command():
+    """Fill in latitude/longitude for venues from the bundled city centroids."""
+    located, missing = [], 0
+    for venue in Venue.query.all():
+        coords = geo.geocode(venue.city, venue.state)
+        if coords:
+            venue.latitude, venue.longitude = coords
+            located.append(venue.id)
+        else:
+            missing += 1
+    db.session.flush()
+    change_feed.record('venue', 'update', located)
+    db.session.commit()
+    print(f'Geocoded {len(located)} venues, {missing} with no matching city centroid.')
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+def upcoming_counts(session, venue_ids=None, now=None):
+    # {venue id: number of upcoming shows} in one grouped query on a shard
+    query = db.select(Show.venue_id, db.func.count(Show.id)) \
+        .where(Show.start_time > (now or datetime.now())).group_by(Show.venue_id)
+    if venue_ids is not None:
+        query = query.where(Show.venue_id.in_(venue_ids))
+    return dict(session.execute(query).all())
+
+
+def venue_areas():
+    # Template data for /venues: venues grouped by city and state, from the in-memory catalog
+    now = datetime.now()  # Don't get this over and over in a loop!
+
+    # Only the upcoming counts come from the database, one grouped query per shard
+    upcoming = {}
+    for counts in shards.scatter(lambda session: upcoming_counts(session, now=now)):
+        upcoming.update(counts)
+    venues = [(venue.id, venue.name, venue.city, venue.state, upcoming.get(venue.id, 0))
+              for venue in catalog.venues()]
+
+    # Create a set of all the cities/states combinations uniquely
+    cities_states = list({(venue[2], venue[3]) for venue in venues})
+    cities_states.sort(key=itemgetter(1, 0))  # Sorts on second column first (state), then by city.
+
+    data = []  # Initialize data list before using it
+
+    # Now iterate over the unique values to seed the data dictionary with city/state locations
+    for loc in cities_states:
+        venues_list = [{
+            "id": id,
+            "name": name,
+            "num_upcoming_shows": num_upcoming
+        } for id, name, city, state, num_upcoming in venues if (city, state) == loc]
+
+        # After all venues are added to the list for a given location, add it to the data dictionary
+        data.append({
+            "city": loc[0],
+            "state": loc[1],
+            "venues": venues_list
+        })
+
+    return data
+
+
+@bp.route('/venues')
+@admission.limit('heavy')
+def venues():
+    data = coalescer.get('venues', venue_areas)
+    return render_template('pages/venues.html', areas=data)
+
+@bp.route('/venues/search', methods=['POST'])
+@admission.limit('search')
+def search_venues():
+    search_term = request.form.get('search_term', '').strip()
+
+    # Matched against the in-memory catalog, case-insensitive, anywhere in the name
+    venues = catalog.search('venue', search_term)
+    ids = [venue.id for venue in venues]
+    upcoming = {}
+    for shard, shard_ids in shards.locate_venues(ids).items():
+        upcoming.update(upcoming_counts(shards.session(shard), shard_ids))
+    venue_list = [{
+        "id": venue.id,
+        "name": venue.name,
+        "city": venue.city,
+        "state": venue.state,
+        "phone": venue.phone,
+        "image_link": venue.image_link,
+        "genres": list(venue.genres),
+        "num_upcoming_shows": upcoming.get(venue.id, 0)
+    } for venue in venues]
+
+
+    if not venue_list:
+        response = {
+            "count": 0,
+            "data": []
+        }
+    else:
+        response = {
+            "count": len(venue_list),
+            "data": venue_list
+        }
+    return render_template('pages/search_venues.html', results=response, search_term=search_term)
+
+
+@bp.route('/venues/near', methods=['GET'])
+@admission.limit('heavy')
+def venues_near():
+    # e.g. /venues/near?lat=37.77&lng=-122.42&radius=20  or  /venues/near?city=Oakland&state=CA&k=5
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    if lat is None or lng is None:
+        coords = geo.geocode(request.args.get('city'), request.args.get('state'))
+        if not coords:
+            return jsonify({'error': 'Pass lat and lng, or a known city and state.'}), 400
+        lat, lng = coords
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return jsonify({'error': 'lat/lng out of range.'}), 400
+
+    radius = request.args.get('radius', type=float)
+    k = request.args.get('k', type=int)
+    if request.args.get('unit', 'mi') == 'km' and radius is not None:
+        radius *= geo.MILES_PER_KM
+    if radius is None and k is None:
+        radius = 20.0
+
+    data = nearby_venues(lat, lng, radius_miles=radius, k=k)
+    return jsonify({'lat': lat, 'lng': lng, 'count': len(data), 'data': data})
+
+
+@bp.route('/venues/<int:venue_id>')
+@admission.limit('heavy')
+def show_venue(venue_id):
+    print(f"Requested venue_id: {venue_id}")
+
+    # One primary-key lookup in the read model (see read_model.py)
+    data = read_model.venue_page(venue_id)
+    if not data:
+        flash('Venue not found.')
+        return redirect(url_for('main.index'))
+
+    data["similar_venues"] = similar_venues(venue_id)
+    return render_template('pages/show_venue.html', venue=data)
+
+#  Create Venue
+#  ----------------------------------------------------------------
+
+@bp.route('/venues/create', methods=['GET'])
+def create_venue_form():
+    form = VenueForm()
+    return render_template('forms/new_venue.html', form=form)
+
+
+@bp.route('/venues/create', methods=['POST'])
+def create_venue_submission():
+    form = VenueForm()
+
+    name = form.name.data.strip()
+    city = form.city.data.strip()
+    state = form.state.data
+    address = form.address.data.strip()
+    phone = form.phone.data
+    # Normalize DB.  Strip anything from phone that isn't a number
+    phone = re.sub(r'\D', '', phone) if phone else phone # e.g. (819) 392-1234 --> 8193921234
+    genres = form.genres.data                   # ['Alternative', 'Classical', 'Country']
+    seeking_talent = True if form.seeking_talent.data == 'Yes' else False
+    seeking_description = form.seeking_description.data.strip()
+    image_link = form.image_link.data.strip()
+    website = form.website_link.data.strip()
+    facebook_link = form.facebook_link.data.strip()
+    
+    # Redirect back to form if errors in form validation
+    if not form.validate():
+        flash( form.errors )
+        return redirect(url_for('venues.create_venue_form'))
+
+    else:
+        error_in_insert = False
+        committed = []      # shard rows to delete again if the primary's commit fails
+
+        # Insert form data into DB
+        try:
+            # The state decides the venue's shard (see shards.py); unsharded it's the primary
+            shard = shards.shard_for_state(state)
+            session = shards.session(shard)
+
+            # creates the new venue with all fields but not genre yet
+            new_venue = Venue(id=shards.next_id(Venue), name=name, city=city, state=state, address=address, phone=phone, \
+                seeking_talent=seeking_talent, seeking_description=seeking_description, image_link=image_link, \
+                website=website, facebook_link=facebook_link)
+            new_venue.latitude, new_venue.longitude = geo.geocode(city, state) or (None, None)
+            session.add(new_venue)
+            session.flush()
+            # genres from the form is like: ['Alternative', 'Classical', 'Country'], created on the primary if new
+            sync_genres(venue_genre_table, 'venue_id', new_venue.id, genres, session=session)
+            if session is not db.session:
+                # Shard first, then the directory entry and read model on the primary
+                session.commit()
+                committed.append((shard, Venue, [new_venue.id]))
+                db.session.add(VenueShard(venue_id=new_venue.id, shard=shard))
+            read_model.refresh(venue_ids=[new_venue.id])
+            change_feed.record('venue', 'insert', [new_venue.id])
+            db.session.commit()
+            coalescer.invalidate('venues')
+        except Exception as e:
+            error_in_insert = True
+            print(f'Exception "{e}" in create_venue_submission()')
+            db.session.rollback()
+            shards.rollback(committed)
+        finally:
+            db.session.close()
+
+        if not error_in_insert:
+            # on successful db insert, flash success
+            flash('Venue ' + request.form['name'] + ' was successfully listed!')
+            return redirect(url_for('main.index'))
+        else:
+            flash('An error occurred. Venue ' + name + ' could not be listed.')
+            print("Error in create_venue_submission()")
+            # return redirect(url_for('venues.create_venue_submission'))
+            abort(500)
+
+
+@bp.route('/venues/<venue_id>/delete', methods=['POST'])
+def delete_venue(venue_id):
+    # Deletes a venue based on AJAX call from the venue page
+    venue = shards.venue_session(venue_id).get(Venue, venue_id)
+    if not venue:
+        # User somehow faked this call, redirect home
+        return redirect(url_for('main.index'))
+    else:
+        error_on_delete = False
+        # Need to hang on to venue name since will be lost after delete
+        venue_name = venue.name
+        venue_id = venue.id
+        try:
+            # Cascades to shows in the database; venues with many shows are purged in the background
+            deleted = purger.delete_venue(venue_id)
+            coalescer.invalidate('venues', 'shows')
+        except:
+            error_on_delete = True
+            db.session.rollback()
+            shards.rollback()
+        finally:
+            db.session.close()
+        if error_on_delete:
+            flash(f'An error occurred deleting venue {venue_name}.')
+            print("Error in delete_venue()")
+            abort(500)
+        else:
+            # flash(f'Successfully removed venue {venue_name}')
+            # return redirect(url_for('venues.venues'))
+            return jsonify({
+                'deleted': True,
+                'purging': not deleted,
+                'url': url_for('venues.venues')
+            })
+
+
+#  Update
+#  ----------------------------------------------------------------
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
+def edit_venue(venue_id):
+    # Get the existing venue from the database
+    # venue = Venue.query.filter_by(id=venue_id).one_or_none()    # Returns one, None, or exception if more than one
+    session = shards.venue_session(venue_id)    # the venue's shard, see shards.py
+    venue = session.get(Venue, venue_id)  # Returns object based on primary key, or None.  Guessing get is faster than filter_by
+    if not venue or purging('venue', [venue_id]):
+        # User typed in a URL that doesn't exist (or is being deleted, see purge.py), redirect home
+        return redirect(url_for('main.index'))
+    else:
+        # Otherwise, valid venue.  We can prepopulate the form with existing data like this
+        # (the columns plus genre names; venue.genres can't be loaded from a shard):
+        genres = genre_names(session, [venue_id]).get(venue_id, [])
+        form = VenueForm(data=dict(((column.key, getattr(venue, column.key)) for column in Venue.__table__.columns),
+                                   genres=genres))
+
+    # Prepopulate the form with the current values.  This is only used by template rendering!
+    
+    # genres needs to be a list of genre strings for the template
+    
+    
+
+    venue = {
+        "id": venue_id,
+        "name": venue.name,
+        "genres": genres,
+        "address": venue.address,
+        "city": venue.city,
+        "state": venue.state,
+    # Put the dashes back into phone number
+    "phone": (venue.phone[:3] + '-' + venue.phone[3:6] + '-' + venue.phone[6:]) if len(venue.phone) == 10 else venue.phone,
+        "website": venue.website,
+        "facebook_link": venue.facebook_link,
+        "seeking_talent": venue.seeking_talent,
+        "seeking_description": venue.seeking_description,
+        "image_link": venue.image_link
+    }
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
+def edit_venue_submission(venue_id):
+    # Much of this code same as /venue/create view.
+    form = VenueForm()
+
+    name = form.name.data.strip()
+    city = form.city.data.strip()
+    state = form.state.data
+    address = form.address.data.strip()
+    phone = form.phone.data
+    # Normalize DB.  Strip anything from phone that isn't a number
+    phone = re.sub(r'\D', '', phone) # e.g. (819) 392-1234 --> 8193921234
+    genres = form.genres.data                   # ['Alternative', 'Classical', 'Country']
+    seeking_talent = True if form.seeking_talent.data == 'Yes' else False
+    seeking_description = form.seeking_description.data.strip()
+    image_link = form.image_link.data.strip()
+    website = form.website.data.strip()
+    facebook_link = form.facebook_link.data.strip()
+    
+    # Redirect back to form if errors in form validation
+    if not form.validate():
+        flash( form.errors )
+        return redirect(url_for('venues.edit_venue', venue_id=venue_id))
+
+    else:
+        error_in_update = False
+
+        # Insert form data into DB
+        try:
+            # First get the existing venue object, from its shard
+            shard = shards.shard_of_venue(venue_id)
+            session = shards.session(shard)
+            venue = session.get(Venue, venue_id)
+            # venue = Venue.query.filter_by(id=venue_id).one_or_none()
+            if venue is None or purging('venue', [venue_id]):
+                raise ValueError(f'no venue {venue_id}')
+
+            # Update only the fields that actually changed, so a no-op save writes nothing
+            changed = assign_changed(venue, name=name, city=city, state=state, address=address, phone=phone,
+                seeking_talent=seeking_talent, seeking_description=seeking_description,
+                image_link=image_link, website=website, facebook_link=facebook_link)
+            if 'city' in changed or 'state' in changed:
+                latitude, longitude = geo.geocode(city, state) or (None, None)
+                assign_changed(venue, latitude=latitude, longitude=longitude)
+
+            # Only the added/removed genre links are written, the rest of venue_genre_table is left alone
+            # genres from the form is like: ['Alternative', 'Classical', 'Country']
+            genres_changed = sync_genres(venue_genre_table, 'venue_id', venue_id, genres, session=session)
+            if session is not db.session:
+                session.commit()    # shard first, then the read model on the primary
+            if changed or genres_changed:
+                # The venue's name and image also appear in its artists' page documents
+                artist_ids = read_model.artists_at_venue(venue_id) if {'name', 'image_link'} & set(changed) else ()
+                read_model.refresh(venue_ids=[venue_id], artist_ids=artist_ids)
+                change_feed.record('venue', 'update', [venue_id])
+
+            # Attempt to save everything
+            db.session.commit()
+            if 'state' in changed and shards.shard_for_state(state) != shard:
+                # Moved to a state that lives on another shard
+                shards.move_venues([venue_id], shards.shard_for_state(state), shard)
+            if changed or genres_changed:
+                coalescer.invalidate('venues', 'shows')
+        except Exception as e:
+            error_in_update = True
+            print(f'Exception "{e}" in edit_venue_submission()')
+            db.session.rollback()
+            shards.rollback()
+        finally:
+            db.session.close()
+
+        if not error_in_update:
+            # on successful db update, flash success
+            flash('Venue ' + request.form['name'] + ' was successfully updated!')
+            return redirect(url_for('venues.show_venue', venue_id=venue_id))
+        else:
+            flash('An error occurred. Venue ' + name + ' could not be updated.')
+            print("Error in edit_venue_submission()")
+            abort(500)